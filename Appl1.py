@@ -1,375 +1,637 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import sqlite3
-from datetime import datetime, timedelta
-
-class TrainScheduleApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Расписание поездов")
-        self.root.geometry("1000x600")
-        self.conn = sqlite3.connect('trains.db')
-        self.create_tables()
-        self.current_route_id = None
-        self.current_station_id = None
-        self.setup_ui()
-        self.load_routes()
-
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS routes (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS stations (
-                id INTEGER PRIMARY KEY,
-                route_id INTEGER NOT NULL,
-                order_index INTEGER NOT NULL,
-                city TEXT NOT NULL,
-                departure_time TEXT NOT NULL,
-                travel_time INTEGER,
-                FOREIGN KEY (route_id) REFERENCES routes(id)
-            )
-        ''')
-        self.conn.commit()
-
-    def setup_ui(self):
-        # Левая панель: Список маршрутов
-        self.left_frame = tk.Frame(self.root, width=200)
-        self.left_frame.pack(side=tk.LEFT, fill=tk.Y)
-        self.route_list = tk.Listbox(self.left_frame)
-        self.route_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.route_list.bind('<<ListboxSelect>>', self.on_route_select)
-        self.new_route_btn = tk.Button(self.left_frame, text="Новый маршрут", command=self.create_route)
-        self.new_route_btn.pack(fill=tk.X, padx=5, pady=2)
-        self.del_route_btn = tk.Button(self.left_frame, text="Удалить маршрут", command=self.delete_route)
-        self.del_route_btn.pack(fill=tk.X, padx=5, pady=2)
-
-        # Средняя панель: Список станций
-        self.middle_frame = tk.Frame(self.root)
-        self.middle_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.station_list = tk.Listbox(self.middle_frame)
-        self.station_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.station_list.bind('<<ListboxSelect>>', self.on_station_select)
-        self.add_station_btn = tk.Button(self.middle_frame, text="Добавить станцию", command=self.add_station)
-        self.add_station_btn.pack(fill=tk.X, padx=5, pady=2)
-        self.del_station_btn = tk.Button(self.middle_frame, text="Удалить станцию", command=self.delete_station)
-        self.del_station_btn.pack(fill=tk.X, padx=5, pady=2)
-
-        # Правая панель: Редактирование станции
-        self.right_frame = tk.Frame(self.root, width=300)
-        self.right_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=5, pady=5)
-        tk.Label(self.right_frame, text="Город:").pack(anchor=tk.W)
-        self.city_entry = tk.Entry(self.right_frame)
-        self.city_entry.pack(fill=tk.X)
-        
-        tk.Label(self.right_frame, text="Время отправления (ЧЧ:ММ):").pack(anchor=tk.W)
-        self.departure_entry = tk.Entry(self.right_frame)
-        self.departure_entry.pack(fill=tk.X)
-        
-        tk.Label(self.right_frame, text="Время в пути до следующей (мин):").pack(anchor=tk.W)
-        self.travel_entry = tk.Entry(self.right_frame)
-        self.travel_entry.pack(fill=tk.X)
-        
-        tk.Label(self.right_frame, text="Время прибытия:").pack(anchor=tk.W)
-        self.arrival_label = tk.Label(self.right_frame, text="")
-        self.arrival_label.pack(anchor=tk.W)
-        
-        tk.Label(self.right_frame, text="Время стоянки:").pack(anchor=tk.W)
-        self.dwell_label = tk.Label(self.right_frame, text="")
-        self.dwell_label.pack(anchor=tk.W)
-        
-        self.save_btn = tk.Button(self.right_frame, text="Сохранить", command=self.save_station)
-        self.save_btn.pack(fill=tk.X, pady=5)
-
-    def load_routes(self):
-        self.route_list.delete(0, tk.END)
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, name FROM routes")
-        for route in cursor.fetchall():
-            self.route_list.insert(tk.END, route[1])
-
-    def create_route(self):
-        name = simpledialog.askstring("Создать маршрут", "Введите название маршрута:")
-        if name:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO routes (name) VALUES (?)", (name,))
-            self.conn.commit()
-            self.load_routes()
-
-    def delete_route(self):
-        selected = self.route_list.curselection()
-        if not selected:
-            return
-        route_name = self.route_list.get(selected[0])
-        route_id = self.get_route_id(route_name)
-        if messagebox.askyesno("Удалить маршрут", f"Удалить маршрут '{route_name}'?"):
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM routes WHERE name=?", (route_name,))
-            cursor.execute("DELETE FROM stations WHERE route_id=?", (route_id,))
-            self.conn.commit()
-            self.load_routes()
-            self.station_list.delete(0, tk.END)
-
-    def get_route_id(self, route_name):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id FROM routes WHERE name=?", (route_name,))
-        result = cursor.fetchone()
-        return result[0] if result else None
-
-    def on_route_select(self, event):
-        selected = self.route_list.curselection()
-        if not selected:
-            return
-        route_name = self.route_list.get(selected[0])
-        route_id = self.get_route_id(route_name)
-        if route_id is None:
-            messagebox.showerror("Ошибка", "Маршрут не найден!")
-            self.station_list.delete(0, tk.END)
-            return
-        self.current_route_id = route_id
-        self.load_stations()
-
-    def load_stations(self):
-        self.station_list.delete(0, tk.END)
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT id, city, departure_time, travel_time 
-            FROM stations 
-            WHERE route_id=? 
-            ORDER BY order_index
-        """, (self.current_route_id,))
-        stations = cursor.fetchall()
-        for station in stations:
-            self.station_list.insert(tk.END, f"{station[1]} ({station[2]})")
-        if stations:
-            self.station_list.selection_set(0)
-            self.on_station_select(None)
-
-    def add_station(self):
-        if not self.current_route_id:
-            messagebox.showwarning("Ошибка", "Сначала выберите маршрут!")
-            return
-
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT MAX(order_index) FROM stations WHERE route_id=?", (self.current_route_id,))
-        max_order = cursor.fetchone()[0] or 0
-
-        city = simpledialog.askstring("Новая станция", "Введите название станции:")
-        if not city:
-            return
-
-        if max_order == 0:
-            # Первая станция
-            departure_time = simpledialog.askstring("Время отправления", "Введите время отправления (ЧЧ:ММ):")
-            if not self.validate_time(departure_time):
-                messagebox.showerror("Ошибка", "Неверный формат времени!")
-                return
-            travel_time = 0
-        else:
-            # Получаем данные предыдущей станции
-            cursor.execute("""
-                SELECT departure_time, travel_time 
-                FROM stations 
-                WHERE route_id=? AND order_index=?
-            """, (self.current_route_id, max_order))
-            prev_departure, prev_travel = cursor.fetchone()
-            
-            # Запрашиваем время в пути
-            travel_time = simpledialog.askinteger("Время в пути", "Введите время в пути до следующей станции (минуты):")
-            if not travel_time or travel_time < 0:
-                messagebox.showerror("Ошибка", "Неверное время в пути!")
-                return
-
-            # Рассчитываем время прибытия и отправления
-            arrival = self.calculate_arrival(prev_departure, prev_travel)
-            departure_time = arrival
-
-        cursor.execute("""
-            INSERT INTO stations (route_id, order_index, city, departure_time, travel_time)
-            VALUES (?, ?, ?, ?, ?)
-        """, (self.current_route_id, max_order + 1, city, departure_time, travel_time))
-        self.conn.commit()
-        
-        # Пересчитываем время для последующих станций
-        self.recalculate_times(max_order + 1)
-        self.load_stations()
-
-    def delete_station(self):
-        selected = self.station_list.curselection()
-        if not selected:
-            return
-        station_index = selected[0]
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, order_index FROM stations WHERE route_id=? ORDER BY order_index", (self.current_route_id,))
-        stations = cursor.fetchall()
-        if not stations:
-            return
-        deleted_order = stations[station_index][1]
-        cursor.execute("DELETE FROM stations WHERE id=?", (stations[station_index][0],))
-        self.conn.commit()
-        # Пересчитываем время отправления для последующих станций
-        if deleted_order < len(stations):
-            self.recalculate_times(deleted_order)
-        self.load_stations()
-
-    def recalculate_times(self, start_order):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT id, departure_time, travel_time 
-            FROM stations 
-            WHERE route_id=? AND order_index >= ?
-            ORDER BY order_index
-        """, (self.current_route_id, start_order))
-        stations = cursor.fetchall()
-        if not stations:
-            return
-
-        # Начинаем с предыдущей станции
-        if start_order > 1:
-            cursor.execute("""
-                SELECT departure_time, travel_time 
-                FROM stations 
-                WHERE route_id=? AND order_index=?
-            """, (self.current_route_id, start_order-1))
-            prev_data = cursor.fetchone()
-            if prev_data:
-                current_time = datetime.strptime(prev_data[0], "%H:%M") + timedelta(minutes=prev_data[1])
-            else:
-                current_time = datetime.strptime("00:00", "%H:%M")
-        else:
-            current_time = datetime.strptime(stations[0][1], "%H:%M")
-
-        for station in stations:
-            new_departure = current_time.strftime("%H:%M")
-            cursor.execute("UPDATE stations SET departure_time=? WHERE id=?", (new_departure, station[0]))
-            current_time = datetime.strptime(new_departure, "%H:%M") + timedelta(minutes=station[2] or 0)
-        
-        self.conn.commit()
-
-    def on_station_select(self, event):
-        selected = self.station_list.curselection()
-        if not selected:
-            return
-        station_index = selected[0]
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT id, city, departure_time, travel_time, order_index 
-            FROM stations 
-            WHERE route_id=? 
-            ORDER BY order_index
-        """, (self.current_route_id,))
-        stations = cursor.fetchall()
-        if not stations:
-            return
-        station = stations[station_index]
-        self.current_station_id = station[0]
-        self.city_entry.delete(0, tk.END)
-        self.city_entry.insert(0, station[1])
-
-        # Обновляем интерфейс в зависимости от позиции станции
-        if station_index == 0:
-            self.departure_entry.config(state=tk.NORMAL)
-            self.departure_entry.delete(0, tk.END)
-            self.departure_entry.insert(0, station[2])
-        else:
-            self.departure_entry.config(state=tk.DISABLED)
-            self.departure_entry.delete(0, tk.END)
-            self.departure_entry.insert(0, station[2])
-
-        if station_index == len(stations) - 1:
-            self.travel_entry.config(state=tk.DISABLED)
-            self.travel_entry.delete(0, tk.END)
-            self.travel_entry.insert(0, "0")
-        else:
-            self.travel_entry.config(state=tk.NORMAL)
-            self.travel_entry.delete(0, tk.END)
-            self.travel_entry.insert(0, str(station[3]))
-
-        # Рассчитываем время прибытия и стоянки
-        if station_index == 0:
-            arrival_time = station[2]
-            dwell_time = 0
-        else:
-            prev_station = stations[station_index - 1]
-            arrival_time = self.calculate_arrival(prev_station[2], prev_station[3])
-            dwell_time = self.calculate_dwell(arrival_time, station[2])
-
-        self.arrival_label.config(text=arrival_time)
-        self.dwell_label.config(text=f"{dwell_time} мин")
-
-    def calculate_arrival(self, departure, travel):
-        try:
-            dep_time = datetime.strptime(departure, "%H:%M")
-            arrival = dep_time + timedelta(minutes=int(travel))
-            return arrival.strftime("%H:%M")
-        except:
-            return "Ошибка"
-
-    def calculate_dwell(self, arrival, departure):
-        try:
-            arr = datetime.strptime(arrival, "%H:%M")
-            dep = datetime.strptime(departure, "%H:%M")
-            dwell = (dep - arr).seconds // 60
-            return max(dwell, 0)
-        except:
-            return 0
-
-    def save_station(self):
-        city = self.city_entry.get()
-        departure = self.departure_entry.get()
-        travel_time = self.travel_entry.get()
-
-        if not self.validate_time(departure):
-            messagebox.showerror("Ошибка", "Неверный формат времени отправления!")
-            return
-
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT order_index FROM stations WHERE id=?", (self.current_station_id,))
-        order_index = cursor.fetchone()[0]
-        cursor.execute("SELECT MAX(order_index) FROM stations WHERE route_id=?", (self.current_route_id,))
-        max_order = cursor.fetchone()[0]
-
-        # Получаем текущую станцию
-        cursor.execute("""
-            SELECT city, departure_time, travel_time 
-            FROM stations 
-            WHERE id=?
-        """, (self.current_station_id,))
-        current_data = cursor.fetchone()
-
-        # Обновляем данные станции
-        new_travel = int(travel_time) if travel_time else 0
-        if order_index == max_order:
-            new_travel = 0
-
-        cursor.execute("""
-            UPDATE stations 
-            SET city=?, departure_time=?, travel_time=?
-            WHERE id=?
-        """, (city, departure, new_travel, self.current_station_id))
-
-        # Пересчитываем время для последующих станций
-        if order_index < max_order:
-            self.recalculate_times(order_index)
-
-        self.conn.commit()
-        self.load_stations()
-        self.station_list.selection_clear(0, tk.END)
-        self.station_list.selection_set(order_index)
-        self.on_station_select(None)
-
-    def validate_time(self, time_str):
-        try:
-            datetime.strptime(time_str, "%H:%M")
-            return True
-        except ValueError:
-            return False
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = TrainScheduleApp(root)
+import tkinter as tk
+from tkinter import ttk, messagebox, simpledialog
+import sqlite3
+from timetable import Schedule, DbWorker, connect, get_policy, parse_time, format_time, is_valid_time
+from timetable.paging import ListRows, PredictedRows, PreviewRows, StationRows, route_pager
+from timetable.patterns import parse_frequency
+from timetable.prediction import DelayOverlay
+from timetable.repository import preview_update
+from timetable.tracing import tracer_from_env
+from widgets import VirtualList, StatusBar, TaskRunner
+
+# Как часто проверять изменения, сделанные другими экземплярами приложения
+CHANGES_POLL_MS = 1000
+# Как часто перечитывать задержки поездов, записанные timetable.delays
+DELAYS_POLL_MS = 1000
+# Сколько ближайших отправлений показывать на табло
+BOARD_SIZE = 20
+# Поиск маршрутов запускается, когда ввод в поле поиска затих на столько мс
+SEARCH_DEBOUNCE_MS = 250
+# Сколько найденных маршрутов показывать
+SEARCH_LIMIT = 100
+# Пересчёт несохранённой правки показывается, когда ввод затих на столько мс
+PREVIEW_DEBOUNCE_MS = 150
+# Сколько конфликтов показывать в панели
+CONFLICTS_SIZE = 100
+# Как часто обновлять счётчики SQL в строке состояния (при TIMETABLE_PROFILE)
+TRACE_STATUS_MS = 500
+# Обработчики окна, которым приписываются запросы при трассировке
+TRACED_HANDLERS = ('load_routes', 'create_route', 'delete_route', 'on_route_select',
+                   'add_station', 'insert_station', 'delete_station', 'recalculate_times',
+                   'on_station_select', 'save_station', 'show_board', 'show_conflicts', 'plan_journey',
+                   'generate_trips', 'poll_changes', 'poll_delays')
+
+class TrainScheduleApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Расписание поездов")
+        self.root.geometry("1000x600")
+        # Схема базы создаётся и обновляется миграциями при подключении,
+        # пересчёт времени - по правилам Appl1 (полный каскад).
+        # Запись и пересчёт выполняются в отдельном потоке базы, окно
+        # получает результаты через root.after и не замирает
+        self.policy = get_policy('full')
+        # Трассировка SQL включается переменной окружения TIMETABLE_PROFILE
+        self.tracer = tracer_from_env()
+        self.worker = DbWorker(lambda: Schedule(
+            'trains.db', policy=self.policy, conn=connect('trains.db', tracer=self.tracer)))
+        self.worker.start()
+        self.worker.ready.result()
+        # Список маршрутов читается своим соединением: в WAL чтение не ждёт записи
+        self.conn = connect('trains.db', readonly=True, tracer=self.tracer)
+        self.current_route_id = None
+        self.current_station_id = None
+        # Снимок станций выбранного маршрута (RouteModel) из потока базы
+        self.model = None
+        # Отложенный запуск поиска (root.after) после последнего нажатия
+        self.search_job = None
+        # Несохранённая правка станции: копия снимка маршрута с пересчётом
+        # и отложенный запуск предпросмотра после последнего нажатия
+        self.preview = None
+        self.preview_job = None
+        # После первой проверки панель конфликтов обновляется при сохранении станции
+        self.conflicts_shown = False
+        # Последние задержки поездов и ожидаемое время выбранного маршрута
+        self.delays = DelayOverlay()
+        self.prediction = None
+        if self.tracer is not None:
+            self.tracer.instrument(self, TRACED_HANDLERS)
+        self.setup_ui()
+        self.tasks = TaskRunner(self.root, self.worker, self.status_bar, tracer=self.tracer)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.load_routes()
+        self.root.after(CHANGES_POLL_MS, self.poll_changes)
+        self.poll_delays()
+        if self.tracer is not None:
+            self.root.after(TRACE_STATUS_MS, self.show_trace_status)
+
+    def on_close(self):
+        # Дожидаемся уже отправленных записей, затем закрываем базу
+        self.worker.stop()
+        self.conn.close()
+        if self.tracer is not None:
+            self.tracer.dump()
+        self.root.destroy()
+
+    def show_trace_status(self):
+        queries, ms = self.tracer.totals()
+        text = f"SQL: {queries} запросов, {ms:.0f} мс"
+        action, counters = self.tracer.last_action()
+        if action is not None:
+            text += f" | {action}: {counters['queries']} запросов за {counters['calls']} вызовов"
+        self.status_bar.show_counters(text)
+        self.root.after(TRACE_STATUS_MS, self.show_trace_status)
+
+    def setup_ui(self):
+        # Нижняя строка состояния: что сейчас выполняет поток базы
+        self.status_bar = StatusBar(self.root)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Левая панель: Список маршрутов
+        self.left_frame = tk.Frame(self.root, width=200)
+        self.left_frame.pack(side=tk.LEFT, fill=tk.Y)
+        tk.Label(self.left_frame, text="Поиск маршрута:").pack(anchor=tk.W, padx=5)
+        self.search_entry = tk.Entry(self.left_frame)
+        self.search_entry.pack(fill=tk.X, padx=5)
+        self.search_entry.bind('<KeyRelease>', self.on_search_key)
+        self.route_list = VirtualList(self.left_frame)
+        self.route_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.route_list.bind('<<ListboxSelect>>', self.on_route_select)
+        self.new_route_btn = tk.Button(self.left_frame, text="Новый маршрут", command=self.create_route)
+        self.new_route_btn.pack(fill=tk.X, padx=5, pady=2)
+        self.del_route_btn = tk.Button(self.left_frame, text="Удалить маршрут", command=self.delete_route)
+        self.del_route_btn.pack(fill=tk.X, padx=5, pady=2)
+        self.journey_btn = tk.Button(self.left_frame, text="Найти поездку", command=self.plan_journey)
+        self.journey_btn.pack(fill=tk.X, padx=5, pady=2)
+        self.trips_btn = tk.Button(self.left_frame, text="Рейсы по шаблону", command=self.generate_trips)
+        self.trips_btn.pack(fill=tk.X, padx=5, pady=2)
+
+        # Средняя панель: Список станций
+        self.middle_frame = tk.Frame(self.root)
+        self.middle_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.station_list = VirtualList(self.middle_frame)
+        self.station_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.station_list.bind('<<ListboxSelect>>', self.on_station_select)
+        self.add_station_btn = tk.Button(self.middle_frame, text="Добавить станцию", command=self.add_station)
+        self.add_station_btn.pack(fill=tk.X, padx=5, pady=2)
+        self.insert_station_btn = tk.Button(self.middle_frame, text="Вставить перед выбранной", command=self.insert_station)
+        self.insert_station_btn.pack(fill=tk.X, padx=5, pady=2)
+        self.del_station_btn = tk.Button(self.middle_frame, text="Удалить станцию", command=self.delete_station)
+        self.del_station_btn.pack(fill=tk.X, padx=5, pady=2)
+
+        # Правая панель: Редактирование станции
+        self.right_frame = tk.Frame(self.root, width=300)
+        self.right_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=5, pady=5)
+        tk.Label(self.right_frame, text="Город:").pack(anchor=tk.W)
+        self.city_entry = tk.Entry(self.right_frame)
+        self.city_entry.pack(fill=tk.X)
+        
+        tk.Label(self.right_frame, text="Время отправления (ЧЧ:ММ):").pack(anchor=tk.W)
+        self.departure_entry = tk.Entry(self.right_frame)
+        self.departure_entry.pack(fill=tk.X)
+        self.departure_entry.bind('<KeyRelease>', self.on_edit_key)
+        
+        tk.Label(self.right_frame, text="Время в пути до следующей (мин):").pack(anchor=tk.W)
+        self.travel_entry = tk.Entry(self.right_frame)
+        self.travel_entry.pack(fill=tk.X)
+        self.travel_entry.bind('<KeyRelease>', self.on_edit_key)
+        
+        tk.Label(self.right_frame, text="Время прибытия:").pack(anchor=tk.W)
+        self.arrival_label = tk.Label(self.right_frame, text="")
+        self.arrival_label.pack(anchor=tk.W)
+        
+        tk.Label(self.right_frame, text="Время стоянки:").pack(anchor=tk.W)
+        self.dwell_label = tk.Label(self.right_frame, text="")
+        self.dwell_label.pack(anchor=tk.W)
+        self.preview_label = tk.Label(self.right_frame, text="", fg='#8a6d00')
+        self.preview_label.pack(anchor=tk.W)
+        
+        self.save_btn = tk.Button(self.right_frame, text="Сохранить", command=self.save_station)
+        self.save_btn.pack(fill=tk.X, pady=5)
+
+        # Табло: ближайшие отправления из города после заданного времени
+        tk.Label(self.right_frame, text="Табло: город и время (ЧЧ:ММ):").pack(anchor=tk.W)
+        self.board_city_entry = tk.Entry(self.right_frame)
+        self.board_city_entry.pack(fill=tk.X)
+        self.board_time_entry = tk.Entry(self.right_frame)
+        self.board_time_entry.pack(fill=tk.X)
+        self.board_btn = tk.Button(self.right_frame, text="Показать отправления", command=self.show_board)
+        self.board_btn.pack(fill=tk.X, pady=2)
+        self.board_list = tk.Listbox(self.right_frame, height=10)
+        self.board_list.pack(fill=tk.BOTH, expand=True)
+
+        # Конфликты: разные маршруты стоят в одном городе в одни и те же минуты
+        self.conflicts_btn = tk.Button(self.right_frame, text="Проверить конфликты", command=self.show_conflicts)
+        self.conflicts_btn.pack(fill=tk.X, pady=2)
+        self.conflicts_list = tk.Listbox(self.right_frame, height=6)
+        self.conflicts_list.pack(fill=tk.BOTH, expand=True)
+
+    def load_routes(self):
+        # Маршруты читаются постранично, в списке только видимое окно;
+        # если в поле поиска что-то введено - только найденные маршруты
+        self.search_job = None
+        text = self.search_entry.get().strip()
+        if not text:
+            self.route_list.set_source(route_pager(self.conn))
+            return
+        self.tasks.submit(None, Schedule.search_routes, text, SEARCH_LIMIT,
+                          on_done=lambda found: self.show_found_routes(text, found))
+
+    def show_found_routes(self, text, found):
+        # Пока шёл поиск, запрос могли изменить
+        if text == self.search_entry.get().strip():
+            self.route_list.set_source(ListRows(found))
+
+    def on_search_key(self, event):
+        # Поиск идёт, когда пользователь перестал печатать
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DEBOUNCE_MS, self.load_routes)
+
+    def create_route(self):
+        name = simpledialog.askstring("Создать маршрут", "Введите название маршрута:")
+        if name:
+            self.tasks.submit("Создание маршрута", Schedule.create_route, name,
+                              on_done=lambda route_id: self.load_routes(),
+                              on_error=self.on_create_route_error)
+
+    def on_create_route_error(self, error):
+        if isinstance(error, sqlite3.IntegrityError):
+            messagebox.showerror("Ошибка", "Маршрут с таким названием уже существует!")
+            return True
+        return False
+
+    def delete_route(self):
+        selected = self.route_list.curselection()
+        if not selected:
+            return
+        route_name = self.route_list.get(selected[0])
+        route_id = self.route_list.key(selected[0])
+        if messagebox.askyesno("Удалить маршрут", f"Удалить маршрут '{route_name}'?"):
+            self.tasks.submit("Удаление маршрута", Schedule.delete_route, route_id,
+                              on_done=lambda result: self.load_routes())
+            self.station_list.delete(0, tk.END)
+
+    def generate_trips(self):
+        # Выбранный маршрут становится шаблоном: рейсы хранят только время
+        # отправления, станции и время в пути берутся из шаблона
+        if not self.current_route_id:
+            messagebox.showwarning("Ошибка", "Сначала выберите маршрут!")
+            return
+        rule = simpledialog.askstring("Рейсы по шаблону",
+                                      "Рейсы с ЧЧ:ММ по ЧЧ:ММ каждые N минут (например, 06:00-22:00/30):")
+        if not rule:
+            return
+        try:
+            first, last, every = parse_frequency(rule)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Неверное правило рейсов!")
+            return
+        self.tasks.submit("Создание рейсов", Schedule.generate_trips, self.current_route_id,
+                          first, last, every, on_done=lambda count: self.load_routes())
+
+    def on_route_select(self, event):
+        selected = self.route_list.curselection()
+        if not selected:
+            return
+        route_id = self.route_list.key(selected[0])
+        if route_id is None:
+            messagebox.showerror("Ошибка", "Маршрут не найден!")
+            self.station_list.delete(0, tk.END)
+            return
+        self.current_route_id = route_id
+        self.load_stations()
+
+    def load_stations(self, select=0):
+        # Маршрут читается в потоке базы; select - станция, которую выделить
+        self.tasks.submit("Загрузка станций", Schedule.route_snapshot, self.current_route_id,
+                          on_done=lambda model: self.show_stations(model, select))
+
+    def show_stations(self, model, select=None, keep_position=False):
+        # Пока маршрут загружался, мог быть выбран другой
+        if model.route_id != self.current_route_id:
+            return
+        self.clear_preview()
+        self.model = model
+        # Подписи строятся только для видимых строк списка
+        rows, highlight = self.station_rows()
+        self.station_list.set_source(rows, keep_position=keep_position, highlight=highlight)
+        if select is not None and select < len(model):
+            self.station_list.selection_clear(0, tk.END)
+            self.station_list.selection_set(select)
+            self.on_station_select(None)
+
+    def station_rows(self):
+        # Источник строк станций снимка маршрута: если поезд опаздывает -
+        # с ожидаемым временем, опаздывающие станции подсвечены
+        self.prediction = self.delays.predict(self.model)
+        if self.prediction is None:
+            return StationRows(self.model), None
+        return PredictedRows(self.model, self.prediction), self.prediction.late
+
+    def show_prediction(self):
+        # Изменилась задержка поезда или снимок маршрута после записи
+        rows, highlight = self.station_rows()
+        self.station_list.set_source(rows, keep_position=True, highlight=highlight)
+        index = self.model.index_of(self.current_station_id)
+        if index is not None:
+            self.show_times(self.model, index)
+
+    def edit_stations(self, label, write, *args, select=None):
+        # Запись в потоке базы возвращает RoutePatch: окно правит свой снимок
+        # маршрута и только изменённые строки списка; select - станция,
+        # которую выделить после записи
+        route_id = self.current_route_id
+        return self.tasks.submit(label, Schedule.edit, write, route_id, *args,
+                                 on_done=lambda patch: self.apply_patch(patch, select))
+
+    def apply_patch(self, patch, select=None):
+        if patch.route_id != self.current_route_id:
+            return
+        self.clear_preview()
+        model = self.model
+        if model is None or not patch.apply(model):
+            # Снимок разошёлся с кэшем маршрута - перечитываем маршрут
+            self.load_stations(select=select)
+            return
+        if self.delays.get(model.route_id) is not None:
+            # Ожидаемое время зависит от всех станций после задержки
+            self.show_prediction()
+        else:
+            for index, delta in patch.structure:
+                if delta > 0:
+                    self.station_list.rows_inserted(index)
+                else:
+                    self.station_list.rows_removed(index)
+            if patch.start is not None:
+                self.station_list.rows_changed(patch.start, patch.stop)
+        if select is not None and len(model):
+            self.station_list.selection_clear(0, tk.END)
+            self.station_list.selection_set(min(select, len(model) - 1))
+        if self.station_list.curselection():
+            self.on_station_select(None)
+
+    def add_station(self):
+        if not self.current_route_id:
+            messagebox.showwarning("Ошибка", "Сначала выберите маршрут!")
+            return
+
+        model = self.model
+        if model is None or model.route_id != self.current_route_id:
+            # Станции маршрута ещё загружаются
+            return
+
+        city = simpledialog.askstring("Новая станция", "Введите название станции:")
+        if not city:
+            return
+
+        departure_time = None
+        travel_time = None
+        if not len(model):
+            # Первая станция
+            departure_time = simpledialog.askstring("Время отправления", "Введите время отправления (ЧЧ:ММ):")
+            if not self.validate_time(departure_time):
+                messagebox.showerror("Ошибка", "Неверный формат времени!")
+                return
+            departure_time = parse_time(departure_time)
+        else:
+            # Запрашиваем время в пути; отправление считается от предыдущей станции
+            travel_time = simpledialog.askinteger("Время в пути", "Введите время в пути до следующей станции (минуты):")
+            if not travel_time or travel_time < 0:
+                messagebox.showerror("Ошибка", "Неверное время в пути!")
+                return
+
+        self.edit_stations("Добавление станции", Schedule.add_station, city, departure_time, travel_time)
+
+    def insert_station(self):
+        # Новая станция встаёт перед выбранной, остальные сдвигаются по времени
+        selected = self.station_list.curselection()
+        if not selected:
+            messagebox.showwarning("Ошибка", "Сначала выберите станцию!")
+            return
+        model = self.model
+        if model is None or model.route_id != self.current_route_id:
+            return
+        index = selected[0]
+
+        city = simpledialog.askstring("Новая станция", "Введите название станции:")
+        if not city:
+            return
+
+        departure_time = None
+        if index == 0:
+            # Новая первая станция
+            departure_time = simpledialog.askstring("Время отправления", "Введите время отправления (ЧЧ:ММ):")
+            if not self.validate_time(departure_time):
+                messagebox.showerror("Ошибка", "Неверный формат времени!")
+                return
+            departure_time = parse_time(departure_time)
+        travel_time = simpledialog.askinteger("Время в пути", "Введите время в пути до следующей станции (минуты):")
+        if not travel_time or travel_time < 0:
+            messagebox.showerror("Ошибка", "Неверное время в пути!")
+            return
+
+        self.edit_stations("Вставка станции", Schedule.insert_station, index, city, departure_time, travel_time,
+                           select=index)
+
+    def delete_station(self):
+        selected = self.station_list.curselection()
+        if not selected:
+            return
+        if self.model is None or not len(self.model):
+            return
+        # Время отправления последующих станций пересчитывается там же
+        self.edit_stations("Удаление станции", Schedule.delete_station, selected[0], select=selected[0])
+
+    def recalculate_times(self, start_index):
+        # Начинаем с предыдущей станции, весь хвост маршрута - одним запросом
+        return self.edit_stations("Пересчёт времени", Schedule.recalculate, start_index)
+
+    def on_station_select(self, event):
+        selected = self.station_list.curselection()
+        if not selected:
+            return
+        station_index = selected[0]
+        # Станция, прибытие и стоянка уже посчитаны в снимке маршрута
+        model = self.model
+        if model is None or not len(model):
+            return
+        self.clear_preview()
+        station_id, city, departure, travel = model.station(station_index)[:4]
+        self.current_station_id = station_id
+        self.city_entry.delete(0, tk.END)
+        self.city_entry.insert(0, city)
+
+        # Обновляем интерфейс в зависимости от позиции станции
+        if station_index == 0:
+            self.departure_entry.config(state=tk.NORMAL)
+            self.departure_entry.delete(0, tk.END)
+            self.departure_entry.insert(0, format_time(departure))
+        else:
+            self.departure_entry.config(state=tk.DISABLED)
+            self.departure_entry.delete(0, tk.END)
+            self.departure_entry.insert(0, format_time(departure))
+
+        if station_index == len(model) - 1:
+            self.travel_entry.config(state=tk.DISABLED)
+            self.travel_entry.delete(0, tk.END)
+            self.travel_entry.insert(0, "0")
+        else:
+            self.travel_entry.config(state=tk.NORMAL)
+            self.travel_entry.delete(0, tk.END)
+            self.travel_entry.insert(0, str(travel))
+
+        self.show_times(model, station_index)
+
+    def show_times(self, model, index):
+        arrival, dwell = self.policy.arrival_and_dwell(model, index)
+        text = format_time(arrival)
+        # Поезд опаздывает - рядом ожидаемое прибытие (не для предпросмотра правки)
+        prediction = self.prediction if model is self.model else None
+        if prediction is not None and index > 0 and prediction.arrivals[index] != model.arrivals[index]:
+            text += f", ожидается {format_time(prediction.arrivals[index])}"
+        self.arrival_label.config(text=text)
+        self.dwell_label.config(text=f"{dwell} мин")
+
+    def on_edit_key(self, event):
+        # Пересчёт правки показывается, когда ввод затих
+        if self.preview_job is not None:
+            self.root.after_cancel(self.preview_job)
+        self.preview_job = self.root.after(PREVIEW_DEBOUNCE_MS, self.show_preview)
+
+    def show_preview(self):
+        # Правка пересчитывается на копии снимка маршрута, без базы:
+        # изменившиеся станции подсвечиваются со сдвигом от сохранённого
+        # времени, в базу правка попадёт только по "Сохранить"
+        self.preview_job = None
+        model = self.model
+        index = model.index_of(self.current_station_id) if model is not None else None
+        departure = self.departure_entry.get().strip()
+        travel = self.travel_entry.get().strip()
+        if index is None or not self.validate_time(departure) or not (travel == "" or travel.isdigit()):
+            self.clear_preview()
+            return
+        preview, patch = preview_update(self.policy, model, index, parse_time(departure), int(travel or 0))
+        if patch is None:
+            self.clear_preview()
+            return
+        self.preview = preview
+        rows = PreviewRows(model, preview)
+        self.station_list.set_source(rows, keep_position=True, highlight=rows.changed)
+        self.show_times(preview, index)
+        last = len(preview) - 1
+        arrival = self.policy.arrival_and_dwell(preview, last)[0]
+        delta = arrival - self.policy.arrival_and_dwell(model, last)[0]
+        self.preview_label.config(text=f"Не сохранено: прибытие на конечную {format_time(arrival)} ({delta:+d} мин)")
+
+    def clear_preview(self):
+        if self.preview_job is not None:
+            self.root.after_cancel(self.preview_job)
+            self.preview_job = None
+        if self.preview is None:
+            return
+        self.preview = None
+        self.preview_label.config(text="")
+        rows, highlight = self.station_rows()
+        self.station_list.set_source(rows, keep_position=True, highlight=highlight)
+        index = self.model.index_of(self.current_station_id)
+        if index is not None:
+            self.show_times(self.model, index)
+
+    def save_station(self):
+        city = self.city_entry.get()
+        departure = self.departure_entry.get()
+        travel_time = self.travel_entry.get()
+
+        if not self.validate_time(departure):
+            messagebox.showerror("Ошибка", "Неверный формат времени отправления!")
+            return
+
+        if self.model is None:
+            return
+        station_index = self.model.index_of(self.current_station_id)
+        if station_index is None:
+            return
+
+        # Обновляем станцию и пересчитываем время для последующих станций
+        new_travel = int(travel_time) if travel_time else 0
+        self.edit_stations("Сохранение станции", Schedule.update_station,
+                           station_index, city, parse_time(departure), new_travel, select=station_index)
+        if self.conflicts_shown:
+            # Перепроверяются только города изменённого маршрута
+            self.show_conflicts()
+
+    def poll_changes(self):
+        # Изменения других экземпляров проверяет поток базы;
+        # следующая проверка - после ответа на предыдущую
+        self.tasks.submit(None, Schedule.poll_changes,
+                          on_done=self.on_changes_polled, on_error=self.on_poll_error)
+
+    def on_changes_polled(self, changes):
+        self.root.after(CHANGES_POLL_MS, self.poll_changes)
+        if changes:
+            self.apply_changes(changes)
+
+    def on_poll_error(self, error):
+        # База занята или недоступна - проверим в следующий раз
+        self.root.after(CHANGES_POLL_MS, self.poll_changes)
+        return True
+
+    def poll_delays(self):
+        # Задержки поездов (python -m timetable.delays) читает поток базы
+        self.tasks.submit(None, Schedule.poll_delays,
+                          on_done=self.on_delays_polled, on_error=self.on_delays_error)
+
+    def on_delays_polled(self, delays):
+        self.root.after(DELAYS_POLL_MS, self.poll_delays)
+        if not delays:
+            return
+        self.delays.update(delays)
+        # Несохранённая правка остаётся на экране, задержка покажется после неё
+        if self.model is not None and self.model.route_id in delays and self.preview is None:
+            self.show_prediction()
+
+    def on_delays_error(self, error):
+        self.root.after(DELAYS_POLL_MS, self.poll_delays)
+        return True
+
+    def apply_changes(self, changes):
+        if changes.full or changes.routes:
+            if self.search_entry.get().strip():
+                # Результаты поиска перечитываются заново
+                self.load_routes()
+            else:
+                self.route_list.refresh()
+        if self.conflicts_shown and (changes.full or changes.stations):
+            self.show_conflicts()
+        if self.current_route_id is None:
+            return
+        if self.current_route_id in changes.deleted:
+            self.current_route_id = None
+            self.current_station_id = None
+            self.model = None
+            self.station_list.delete(0, tk.END)
+            return
+        if not changes.full and self.current_route_id not in changes.stations:
+            return
+        # Панель редактирования обновляем, только если изменилась выбранная станция
+        changed = changes.stations.get(self.current_route_id, ())
+        reselect = changes.full or self.current_station_id in changed
+
+        def show(model):
+            index = model.index_of(self.current_station_id) if reselect else None
+            self.show_stations(model, index, keep_position=True)
+
+        self.tasks.submit(None, Schedule.route_snapshot, self.current_route_id, on_done=show)
+
+    def show_board(self):
+        city = self.board_city_entry.get().strip()
+        after = self.board_time_entry.get().strip() or "00:00"
+        if not city:
+            return
+        if not self.validate_time(after):
+            messagebox.showerror("Ошибка", "Неверный формат времени!")
+            return
+        self.tasks.submit("Табло отправлений", Schedule.departures, city, parse_time(after), BOARD_SIZE,
+                          on_done=self.fill_board)
+
+    def fill_board(self, departures):
+        self.board_list.delete(0, tk.END)
+        if not departures:
+            self.board_list.insert(tk.END, "Нет отправлений")
+        for departure, route_name, route_id, station_id in departures:
+            self.board_list.insert(tk.END, f"{format_time(departure)}  {route_name}")
+
+    def show_conflicts(self):
+        self.conflicts_shown = True
+        self.tasks.submit("Поиск конфликтов", Schedule.find_conflicts, CONFLICTS_SIZE,
+                          on_done=self.fill_conflicts)
+
+    def fill_conflicts(self, conflicts):
+        self.conflicts_list.delete(0, tk.END)
+        if not conflicts:
+            self.conflicts_list.insert(tk.END, "Конфликтов нет")
+        for city, start, end, (_, first_name, _), (_, second_name, _) in conflicts:
+            period = format_time(start) if start == end else f"{format_time(start)}-{format_time(end)}"
+            self.conflicts_list.insert(tk.END, f"{period} {city}: {first_name} / {second_name}")
+
+    def plan_journey(self):
+        # Самое раннее прибытие из города в город с пересадками между маршрутами
+        origin = simpledialog.askstring("Поездка", "Откуда (город):")
+        if not origin:
+            return
+        destination = simpledialog.askstring("Поездка", "Куда (город):")
+        if not destination:
+            return
+        after = simpledialog.askstring("Поездка", "Отправление не раньше (ЧЧ:ММ):")
+        if not self.validate_time(after):
+            messagebox.showerror("Ошибка", "Неверный формат времени!")
+            return
+        self.tasks.submit("Поиск поездки", Schedule.plan_journey, origin, destination, parse_time(after),
+                          on_done=self.show_journey)
+
+    def show_journey(self, legs):
+        if legs is None:
+            messagebox.showinfo("Поездка", "Доехать нельзя")
+            return
+        lines = [f"{format_time(departure)} {origin} -> {format_time(arrival)} {destination} ({route_name})"
+                 for route_name, origin, departure, destination, arrival in legs]
+        messagebox.showinfo("Поездка", "\n".join(lines) or "Вы уже на месте")
+
+    def validate_time(self, time_str):
+        return is_valid_time(time_str)
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = TrainScheduleApp(root)
     root.mainloop()
\ No newline at end of file
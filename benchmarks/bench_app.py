@@ -0,0 +1,240 @@
+# Замеры горячих путей окна (load_routes, load_stations, on_station_select,
+# save_station, add_station, delete_station, recalculate_times) для Appl1.py
+# и App2.py на синтетической базе из N маршрутов по M станций.
+# Окно работает без дисплея (headless_tk.py) или скрытым Tk (--real-tk).
+# Для каждой операции выводятся перцентили задержки и число SQL-запросов:
+#   "окно"  - сколько обработчик занимал поток Tk,
+#   "всего" - до момента, когда поток базы ответил и окно обновилось.
+# Запуск: python benchmarks/bench_app.py [--routes N] [--stations M] [--ops K]
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from timetable.cascade import store_times
+from timetable.database import connect
+from timetable.ordering import ORDER_GAP
+from timetable.timeutil import MINUTES_PER_DAY
+
+import headless_tk
+
+APPS = ('Appl1', 'App2')
+OPERATIONS = ('load_routes', 'load_stations', 'on_station_select', 'save_station',
+              'add_station', 'delete_station', 'recalculate_times')
+
+
+def generate(path, routes, stations, cities=None, seed=1):
+    # trains.db с routes маршрутами по stations станций; время отправления
+    # следующей станции = отправление предыдущей + время в пути
+    rng = random.Random(seed)
+    cities = cities or max(10, routes * stations // 20)
+    conn = connect(path)
+    conn.executemany("INSERT INTO routes (id, name) VALUES (?, ?)",
+                     ((route_id, f"Маршрут {route_id}") for route_id in range(1, routes + 1)))
+
+    def rows():
+        for route_id in range(1, routes + 1):
+            departure = rng.randrange(MINUTES_PER_DAY)
+            for number in range(1, stations + 1):
+                travel = rng.randrange(5, 90) if number < stations else 0
+                yield (route_id, number * ORDER_GAP, f"Город {rng.randrange(cities)}",
+                       departure, travel)
+                departure += travel
+
+    conn.executemany("""
+        INSERT INTO stations (route_id, order_index, city, departure_time, travel_time)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows())
+    store_times(conn, 1, routes)
+    conn.commit()
+    conn.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Driver:
+    def __init__(self, module, root, real_tk, seed=1):
+        # Опрос изменений других экземпляров и задержек не должен попадать в замеры
+        module.CHANGES_POLL_MS = 10 ** 9
+        module.DELAYS_POLL_MS = 10 ** 9
+        self.name = module.__name__
+        self.root = root
+        self.real_tk = real_tk
+        self.rng = random.Random(seed)
+        self.queries = 0
+        self.last_statement = None
+        self.app = module.TrainScheduleApp(root)
+        self.app.conn.set_trace_callback(self.count_query)
+        self.app.worker.submit(lambda schedule: schedule.conn.set_trace_callback(self.count_query)).result()
+        self.wait()
+        self.results = {operation: ([], [], []) for operation in OPERATIONS}
+
+    def count_query(self, statement):
+        # Срабатывание триггера на каждую строку приходит повтором текста
+        # запроса, поэтому подряд идущие повторы (и executemany) - один запрос
+        if statement != self.last_statement:
+            self.queries += 1
+        self.last_statement = statement
+
+    def pump(self):
+        if self.real_tk:
+            self.root.update()
+        else:
+            self.root.pump()
+
+    def wait(self):
+        # Пока поток базы выполняет задачи, окно прокачивает root.after
+        while True:
+            self.pump()
+            if not self.app.tasks.busy:
+                return
+            time.sleep(0.0001)
+
+    def measure(self, operation, action):
+        queries = self.queries
+        start = time.perf_counter()
+        action()
+        handler = time.perf_counter() - start
+        self.wait()
+        total = time.perf_counter() - start
+        handlers, totals, counts = self.results[operation]
+        handlers.append(handler)
+        totals.append(total)
+        counts.append(self.queries - queries)
+
+    # --- подготовка состояния (не замеряется)
+
+    def select(self, listbox, index):
+        listbox.selection_clear(0, headless_tk.END)
+        listbox.selection_set(index)
+
+    def open_random_route(self):
+        self.select(self.app.route_list, self.rng.randrange(self.app.route_list.size()))
+        self.app.on_route_select(None)
+        self.wait()
+        return len(self.app.model)
+
+    def select_station(self, index):
+        self.select(self.app.station_list, index)
+        self.app.on_station_select(None)
+
+    # --- операции
+
+    def run(self, operations):
+        app = self.app
+        for step in range(operations):
+            self.measure('load_routes', app.load_routes)
+
+            self.select(app.route_list, self.rng.randrange(app.route_list.size()))
+            self.measure('load_stations', lambda: app.on_route_select(None))
+            count = len(app.model)
+
+            index = self.rng.randrange(count)
+            self.select(app.station_list, index)
+            self.measure('on_station_select', lambda: app.on_station_select(None))
+
+            if count > 1:
+                self.select_station(self.rng.randrange(count - 1))
+                app.travel_entry.delete(0, headless_tk.END)
+                app.travel_entry.insert(0, str(self.rng.randrange(5, 90)))
+                self.measure('save_station', app.save_station)
+
+            headless_tk.dialogs.answers = [f"Новый город {step}"]
+            if app.policy.needs_travel_on_add:
+                headless_tk.dialogs.answers.append(self.rng.randrange(5, 90))
+            self.measure('add_station', app.add_station)
+
+            count = self.open_random_route()
+            if count > 1:
+                self.select(app.station_list, self.rng.randrange(count))
+                self.measure('delete_station', app.delete_station)
+
+            count = self.open_random_route()
+            index = self.rng.randrange(count)
+            recalculate = getattr(app, 'recalculate_times', None) or app.recalculate_departure_times
+            self.measure('recalculate_times', lambda: recalculate(index))
+
+    def close(self):
+        self.app.on_close()
+
+
+def use_real_tk():
+    # Настоящий tkinter со скрытым окном; диалоги отвечают из списка
+    import tkinter
+    from tkinter import messagebox, simpledialog
+    simpledialog.askstring = simpledialog.askinteger = headless_tk.dialogs.answer
+    messagebox.showerror = messagebox.showwarning = messagebox.showinfo = headless_tk.dialogs.message
+    messagebox.askyesno = headless_tk.dialogs.confirm
+    root = tkinter.Tk()
+    root.withdraw()
+    return root
+
+
+def report(results):
+    print(f"{'операция':<18} {'прил.':<6} {'n':>5} {'окно p50':>9} {'окно p99':>9} "
+          f"{'p50, мс':>8} {'p90, мс':>8} {'p99, мс':>8} {'запросов':>9}")
+    for operation in OPERATIONS:
+        for name in APPS:
+            handlers, totals, counts = results[name][operation]
+            if not totals:
+                continue
+            print(f"{operation:<18} {name:<6} {len(totals):>5} "
+                  f"{percentile(handlers, 0.5) * 1000:>9.3f} {percentile(handlers, 0.99) * 1000:>9.3f} "
+                  f"{percentile(totals, 0.5) * 1000:>8.3f} {percentile(totals, 0.9) * 1000:>8.3f} "
+                  f"{percentile(totals, 0.99) * 1000:>8.3f} {sum(counts) / len(counts):>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры операций окна Appl1/App2")
+    parser.add_argument('--routes', type=int, default=1000)
+    parser.add_argument('--stations', type=int, default=50)
+    parser.add_argument('--ops', type=int, default=100, help="повторов каждой операции")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--real-tk', action='store_true', help="скрытое окно Tk вместо headless")
+    args = parser.parse_args(argv)
+
+    if not args.real_tk:
+        headless_tk.install()
+    import Appl1
+    import App2
+    modules = {'Appl1': Appl1, 'App2': App2}
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.db')
+        start = time.perf_counter()
+        generate(template, args.routes, args.stations, seed=args.seed)
+        print(f"база: {args.routes} маршрутов x {args.stations} станций, "
+              f"{time.perf_counter() - start:.1f} с")
+        for name in APPS:
+            # Каждое приложение получает свою копию одной и той же базы
+            workdir = os.path.join(tmp, name)
+            os.makedirs(workdir)
+            shutil.copy(template, os.path.join(workdir, 'trains.db'))
+            os.chdir(workdir)
+            try:
+                root = use_real_tk() if args.real_tk else headless_tk.HeadlessRoot()
+                driver = Driver(modules[name], root, args.real_tk, seed=args.seed)
+                driver.run(args.ops)
+                driver.close()
+                results[name] = driver.results
+            finally:
+                os.chdir(cwd)
+    report(results)
+    if headless_tk.dialogs.messages:
+        print("сообщения окна:", headless_tk.dialogs.messages[:5])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Сравнение пересчёта времени отправления: построчный UPDATE в цикле
+# (как было раньше) против одного оконного запроса из cascade.py.
+# Запуск: python benchmarks/bench_recalculate.py [число_станций ...]
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timetable.cascade import recalculate_from_previous, recalculate_from_station
+from timetable.database import connect
+
+REPEATS = 20
+
+
+def build_database(path, stops):
+    conn = connect(path)
+    conn.execute("INSERT INTO routes (id, name) VALUES (1, 'Маршрут')")
+    conn.executemany("""
+        INSERT INTO stations (route_id, order_index, city, departure_time, travel_time)
+        VALUES (1, ?, ?, ?, ?)
+    """, ((i, f"Город {i}", 360 + i * 10, 10) for i in range(1, stops + 1)))
+    conn.commit()
+    return conn
+
+
+def legacy_recalculate(conn, route_id, start_order):
+    # Прежняя реализация Appl1.recalculate_times: UPDATE на каждую станцию
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, departure_time, travel_time
+        FROM stations
+        WHERE route_id=? AND order_index >= ?
+        ORDER BY order_index
+    """, (route_id, start_order))
+    stations = cursor.fetchall()
+    if not stations:
+        return
+    cursor.execute("""
+        SELECT departure_time, travel_time
+        FROM stations
+        WHERE route_id=? AND order_index=?
+    """, (route_id, start_order - 1))
+    prev_data = cursor.fetchone()
+    current_time = prev_data[0] + (prev_data[1] or 0) if prev_data else stations[0][1]
+    for station in stations:
+        cursor.execute("UPDATE stations SET departure_time=? WHERE id=?", (current_time, station[0]))
+        current_time += station[2] or 0
+
+
+def measure(conn, recalculate):
+    timings = []
+    for repeat in range(REPEATS):
+        # Меняем время в пути второй станции, чтобы хвост действительно сдвигался
+        conn.execute("UPDATE stations SET travel_time=? WHERE route_id=1 AND order_index=2",
+                     (10 + repeat % 2,))
+        start = time.perf_counter()
+        recalculate(conn, 1, 2)
+        conn.commit()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main(sizes):
+    print(f"{'станций':>8} {'цикл, мс':>10} {'Appl1, мс':>10} {'App2, мс':>10} {'ускорение':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for stops in sizes:
+            path = os.path.join(tmp, f"bench_{stops}.db")
+            conn = build_database(path, stops)
+            legacy = measure(conn, legacy_recalculate)
+            previous = measure(conn, recalculate_from_previous)
+            station = measure(conn, recalculate_from_station)
+            conn.close()
+            print(f"{stops:>8} {legacy * 1000:>10.2f} {previous * 1000:>10.2f} "
+                  f"{station * 1000:>10.2f} {legacy / previous:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [50, 200, 1000, 5000])
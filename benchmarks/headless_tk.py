@@ -0,0 +1,240 @@
+# Минимальная замена tkinter для замеров без дисплея: виджеты хранят
+# состояние в памяти, root.after складывает вызовы в очередь, которую
+# прокачивает HeadlessRoot.pump(). Реализована только та часть API,
+# которой пользуются Appl1.py, App2.py и widgets.py.
+#
+#   import headless_tk
+#   headless_tk.install()      # до импорта Appl1/App2
+import sys
+import time
+import types
+
+END = 'end'
+NORMAL = 'normal'
+DISABLED = 'disabled'
+
+
+class TclError(Exception):
+    pass
+
+
+class Widget:
+    def __init__(self, master=None, **options):
+        self.master = master
+        self.options = dict(options)
+        self.bindings = {}
+
+    def pack(self, **options):
+        pass
+
+    def config(self, **options):
+        self.options.update(options)
+
+    configure = config
+
+    def cget(self, name):
+        return self.options.get(name, '')
+
+    def __getitem__(self, name):
+        return self.options.get(name, NORMAL if name == 'state' else '')
+
+    def bind(self, sequence=None, func=None, add=None):
+        self.bindings[sequence] = func
+
+    def after(self, ms, func=None, *args):
+        return self.winfo_toplevel().after(ms, func, *args)
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def winfo_toplevel(self):
+        widget = self
+        while widget.master is not None:
+            widget = widget.master
+        return widget
+
+
+class HeadlessRoot(Widget):
+    def __init__(self):
+        super().__init__()
+        self.pending = []
+
+    def title(self, text=None):
+        pass
+
+    def geometry(self, spec=None):
+        pass
+
+    def protocol(self, name, func=None):
+        pass
+
+    def withdraw(self):
+        pass
+
+    def destroy(self):
+        self.pending.clear()
+
+    def after(self, ms, func=None, *args):
+        if func is None:
+            time.sleep(ms / 1000)
+            return None
+        self.pending.append((time.perf_counter() + ms / 1000, func, args))
+        return f"after#{len(self.pending)}"
+
+    def after_cancel(self, identifier):
+        pass
+
+    def pump(self):
+        # Выполнить отложенные вызовы, срок которых наступил
+        now = time.perf_counter()
+        due = [item for item in self.pending if item[0] <= now]
+        if not due:
+            return False
+        self.pending = [item for item in self.pending if item[0] > now]
+        for _, func, args in due:
+            func(*args)
+        return True
+
+
+class Frame(Widget):
+    pass
+
+
+class Label(Widget):
+    pass
+
+
+class Button(Widget):
+    pass
+
+
+class Checkbutton(Widget):
+    pass
+
+
+class BooleanVar:
+    def __init__(self, master=None, value=False):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class Scrollbar(Widget):
+    def set(self, first, last):
+        self.options['position'] = (first, last)
+
+
+class Entry(Widget):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.text = ''
+
+    def get(self):
+        return self.text
+
+    def insert(self, index, text):
+        self.text = text + self.text if index == 0 else self.text + text
+
+    def delete(self, first, last=None):
+        self.text = ''
+
+
+class Listbox(Widget):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.items = []
+        self.selection = set()
+
+    def insert(self, index, *items):
+        if index == END:
+            self.items.extend(items)
+        else:
+            self.items[index:index] = items
+
+    def delete(self, first, last=None):
+        self.items = [] if last == END else self.items[:first] + self.items[(last or first) + 1:]
+        self.selection.clear()
+
+    def get(self, first, last=None):
+        if last is None:
+            return self.items[first]
+        return tuple(self.items[first:] if last == END else self.items[first:last + 1])
+
+    def size(self):
+        return len(self.items)
+
+    def curselection(self):
+        return tuple(sorted(self.selection))
+
+    def selection_set(self, first, last=None):
+        self.selection.add(first)
+
+    def selection_clear(self, first, last=None):
+        self.selection.clear()
+
+    def see(self, index):
+        pass
+
+    def itemconfig(self, index, **options):
+        pass
+
+
+class Font:
+    def __init__(self, font=None, **options):
+        pass
+
+    def metrics(self, name):
+        return 16
+
+
+class Dialogs:
+    # messagebox и simpledialog: ответы задаются списком answers
+    def __init__(self):
+        self.answers = []
+        self.messages = []
+
+    def answer(self, *args, **kwargs):
+        return self.answers.pop(0) if self.answers else None
+
+    def message(self, *args, **kwargs):
+        self.messages.append(args)
+
+    def confirm(self, *args, **kwargs):
+        return True
+
+
+dialogs = Dialogs()
+
+
+def install():
+    tkinter = types.ModuleType('tkinter')
+    for name, value in list(globals().items()):
+        if isinstance(value, type) or name in ('END', 'NORMAL', 'DISABLED'):
+            setattr(tkinter, name, value)
+    tkinter.Tk = HeadlessRoot
+    for name in ('LEFT', 'RIGHT', 'TOP', 'BOTTOM', 'X', 'Y', 'BOTH', 'W', 'E', 'N', 'S',
+                 'VERTICAL', 'HORIZONTAL', 'SUNKEN'):
+        setattr(tkinter, name, name.lower())
+    font = types.ModuleType('tkinter.font')
+    font.Font = Font
+    ttk = types.ModuleType('tkinter.ttk')
+    messagebox = types.ModuleType('tkinter.messagebox')
+    messagebox.showerror = messagebox.showwarning = messagebox.showinfo = dialogs.message
+    messagebox.askyesno = dialogs.confirm
+    simpledialog = types.ModuleType('tkinter.simpledialog')
+    simpledialog.askstring = simpledialog.askinteger = dialogs.answer
+    tkinter.font = font
+    tkinter.ttk = ttk
+    tkinter.messagebox = messagebox
+    tkinter.simpledialog = simpledialog
+    sys.modules.update({
+        'tkinter': tkinter,
+        'tkinter.font': font,
+        'tkinter.ttk': ttk,
+        'tkinter.messagebox': messagebox,
+        'tkinter.simpledialog': simpledialog,
+    })
@@ -0,0 +1,95 @@
+import random
+
+from timetable import Schedule, MINUTES_PER_DAY
+from timetable.board import CityDepartures, ID_BITS
+
+# Табло против простого перебора: все отправления города по времени суток,
+# начиная с запрошенного, после полуночи - со следующих суток. Ключи
+# массива - (время << ID_BITS | id станции), поиск по ним - bisect.
+
+CITIES = ("Москва", "Тверь", "Клин", "Бологое")
+
+
+def expected_after(rows, minute, limit, until=None):
+    # rows: (время суток, id станции, id маршрута)
+    rows = sorted(rows)
+    day = minute - minute % MINUTES_PER_DAY
+    later = [(time + day, station_id, route_id) for time, station_id, route_id in rows
+             if time >= minute % MINUTES_PER_DAY]
+    earlier = [(time + day + MINUTES_PER_DAY, station_id, route_id) for time, station_id, route_id in rows
+               if time < minute % MINUTES_PER_DAY]
+    result = (later + earlier)[:limit]
+    if until is not None:
+        result = [row for row in result if row[0] <= until]
+    return result
+
+
+def test_city_departures_match_sorted_scan():
+    # Большие id станций и одинаковое время у разных станций: порядок
+    # ключей - (время, id станции)
+    rng = random.Random(11)
+    for _ in range(200):
+        rows = {}
+        for _ in range(rng.randrange(0, 40)):
+            station_id = rng.choice((rng.randrange(1, 50), rng.randrange(1 << (ID_BITS - 1), 1 << ID_BITS)))
+            rows[station_id] = (rng.randrange(0, MINUTES_PER_DAY, 15), station_id, rng.randrange(1, 10))
+        departures = CityDepartures(rows.values())
+        # Добавление и удаление правят массив так же, как сборка заново
+        for station_id in rng.sample(sorted(rows), len(rows) // 3):
+            departures.remove(*rows.pop(station_id)[:2])
+        for station_id in range(100, 100 + rng.randrange(5)):
+            rows[station_id] = (rng.randrange(0, MINUTES_PER_DAY, 15), station_id, rng.randrange(1, 10))
+            departures.add(*rows[station_id])
+        for _ in range(20):
+            minute = rng.randrange(0, 3 * MINUTES_PER_DAY)
+            limit = rng.randrange(1, 50)
+            until = rng.choice((None, minute + rng.randrange(0, 2 * MINUTES_PER_DAY)))
+            assert departures.after(minute, limit, until) == expected_after(rows.values(), minute, limit, until)
+
+
+def board_rows(schedule, city):
+    # Отправления города по всем маршрутам и рейсам, кроме конечных станций
+    return [(departure % MINUTES_PER_DAY, station_id, route_id)
+            for route_id, station_id, departure in schedule.conn.execute("""
+                SELECT route_id, id, departure_time FROM route_stations
+                WHERE city=? AND dwell_minutes IS NOT NULL
+            """, (city,))]
+
+
+def check_board(schedule, rng):
+    for city in CITIES:
+        minute = rng.randrange(0, 2 * MINUTES_PER_DAY)
+        limit = rng.randrange(1, 30)
+        assert schedule.board.next_departures(city, minute, limit) == \
+            expected_after(board_rows(schedule, city), minute, limit), city
+
+
+def test_board_follows_route_edits(tmp_path):
+    rng = random.Random(1111)
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='full')
+    try:
+        routes = []
+        for n in range(8):
+            route_id = schedule.create_route(f"Маршрут {n}")
+            departure = rng.randrange(20 * 60, 26 * 60)
+            for city in rng.sample(CITIES, 3):
+                schedule.add_station(route_id, city, departure=departure, travel=rng.randrange(10, 200))
+            routes.append(route_id)
+        schedule.generate_trips(routes[0], 6 * 60, 22 * 60, 120)
+        check_board(schedule, rng)
+        for step in range(40):
+            route_id = rng.choice(routes)
+            size = len(schedule.route(route_id))
+            operation = rng.randrange(3)
+            if operation == 0:
+                schedule.insert_station(route_id, rng.randrange(1, size + 1), rng.choice(CITIES),
+                                        travel=rng.randrange(10, 200))
+            elif operation == 1 and size > 2:
+                schedule.delete_station(route_id, rng.randrange(size))
+            else:
+                index = rng.randrange(size)
+                schedule.update_station(route_id, index, rng.choice(CITIES),
+                                        rng.randrange(0, MINUTES_PER_DAY), rng.randrange(10, 200))
+            check_board(schedule, rng)
+    finally:
+        schedule.close()
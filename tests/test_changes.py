@@ -0,0 +1,104 @@
+from timetable import Schedule
+from timetable import changes
+
+# Два экземпляра приложения на одной базе: запись, зафиксированная через
+# другое соединение, видна в poll_changes(), а кэши маршрутов, табло и
+# планировщика перечитываются. Свои записи в ленту не попадают.
+
+
+def open_pair(tmp_path):
+    path = str(tmp_path / 'trains.db')
+    return Schedule(path, policy='full'), Schedule(path, policy='full')
+
+
+def build_route(schedule, name, cities):
+    route_id = schedule.create_route(name)
+    schedule.add_station(route_id, cities[0], departure=8 * 60)
+    for city in cities[1:]:
+        schedule.add_station(route_id, city, travel=60)
+    # Перегон от первой станции задаётся правкой
+    schedule.update_station(route_id, 0, cities[0], 8 * 60, 60)
+    return route_id
+
+
+def test_own_writes_are_not_reported(tmp_path):
+    first, second = open_pair(tmp_path)
+    try:
+        assert first.poll_changes() is None
+        build_route(first, "Москва - Тверь", ["Москва", "Тверь"])
+        assert first.poll_changes() is None
+        assert second.poll_changes().affected_routes() == {first.find_route("Москва - Тверь")}
+        assert second.poll_changes() is None
+    finally:
+        first.close()
+        second.close()
+
+
+def test_write_from_second_connection(tmp_path):
+    first, second = open_pair(tmp_path)
+    try:
+        route_id = build_route(first, "Москва - Тверь", ["Москва", "Клин", "Тверь"])
+        other_id = build_route(first, "Казань - Самара", ["Казань", "Самара"])
+        assert list(first.route(route_id).cities) == ["Москва", "Клин", "Тверь"]
+        assert [row[0] for row in first.departures("Клин", 0, 10)] == [9 * 60]
+        assert first.plan_journey("Москва", "Тверь", 0)[-1][4] == 10 * 60
+        assert second.poll_changes() is not None
+
+        second.update_station(route_id, 1, "Солнечногорск", 9 * 60, 90)
+        found = first.poll_changes()
+        assert found.affected_routes() == {route_id}
+        # Пересчёт переписал и следующую станцию
+        assert second.station(route_id, 1)[0] in found.stations[route_id]
+        assert not found.deleted
+        # Кэш маршрута, табло и планировщик видят чужую правку
+        model = first.route(route_id)
+        assert list(model.cities) == ["Москва", "Солнечногорск", "Тверь"]
+        assert list(model.departures) == [8 * 60, 9 * 60, 10 * 60 + 30]
+        assert first.departures("Клин", 0, 10) == []
+        assert [row[0] for row in first.departures("Солнечногорск", 0, 10)] == [9 * 60]
+        assert first.plan_journey("Москва", "Тверь", 0)[-1][4] == 10 * 60 + 30
+        assert list(first.route(other_id).cities) == ["Казань", "Самара"]
+
+        second.delete_route(other_id)
+        found = first.poll_changes()
+        assert other_id in found.deleted
+        assert first.find_route("Казань - Самара") is None
+    finally:
+        first.close()
+        second.close()
+
+
+def test_write_sees_foreign_change_without_poll(tmp_path):
+    # Транзакция записи сама проверяет ленту: правка идёт по свежему
+    # маршруту, даже если опроса после чужой записи не было
+    first, second = open_pair(tmp_path)
+    try:
+        route_id = build_route(first, "Москва - Тверь", ["Москва", "Тверь"])
+        assert len(first.route(route_id)) == 2
+        second.poll_changes()
+        second.add_station(route_id, "Бологое", travel=60)
+        first.add_station(route_id, "Санкт-Петербург", travel=60)
+        assert list(first.route(route_id).cities) == ["Москва", "Тверь", "Бологое", "Санкт-Петербург"]
+        # Чужая правка, найденная внутри транзакции, всё равно достаётся опросу
+        assert first.poll_changes().affected_routes() == {route_id}
+        second.poll_changes()
+        assert list(second.route(route_id).cities) == list(first.route(route_id).cities)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_bulk_write_asks_full_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(changes, 'FULL_RELOAD_ENTRIES', 5)
+    first, second = open_pair(tmp_path)
+    try:
+        route_id = build_route(first, "Москва - Тверь", ["Москва", "Тверь"])
+        assert first.route(route_id) is not None
+        build_route(second, "Казань - Самара", ["Казань", "Ульяновск", "Сызрань", "Самара"])
+        found = first.poll_changes()
+        assert found.full
+        assert first.routes.cached(route_id) is None
+        assert list(first.route(first.find_route("Казань - Самара")).cities)[-1] == "Самара"
+    finally:
+        first.close()
+        second.close()
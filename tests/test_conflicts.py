@@ -0,0 +1,113 @@
+import random
+
+from timetable import Schedule, MINUTES_PER_DAY, get_policy
+from timetable.conflicts import occupancy_intervals, sweep
+
+# Заметание против попарной проверки O(n^2): те же пересечения, в том числе
+# у стоянок, переходящих через полночь, и после правок маршрутов, когда
+# перепроверяются только изменённые города.
+
+CITIES = ("Москва", "Тверь", "Клин")
+
+
+def pairwise(intervals):
+    # Все пересечения интервалов разных маршрутов, границы включаются
+    found = []
+    for i, (start, end, route_id, station_id) in enumerate(intervals):
+        for other_start, other_end, other_route, other_station in intervals[:i]:
+            if route_id != other_route and max(start, other_start) <= min(end, other_end):
+                found.append((max(start, other_start), min(end, other_end),
+                              tuple(sorted(((route_id, station_id), (other_route, other_station))))))
+    return sorted(found)
+
+
+def minutes(policy, departure, arrival, last):
+    # Минуты суток, когда поезд стоит на станции
+    start, end = policy.occupancy(arrival, departure, last)
+    return {(start + m) % MINUTES_PER_DAY for m in range(min(end - start, MINUTES_PER_DAY - 1) + 1)}
+
+
+def test_sweep_matches_pairwise():
+    rng = random.Random(20)
+    for _ in range(200):
+        intervals = []
+        for station_id in range(rng.randrange(1, 30)):
+            start = rng.randrange(0, 200)
+            intervals.append((start, start + rng.randrange(0, 30), rng.randrange(5), station_id))
+        found = [(start, end, tuple(sorted((first, second))))
+                 for start, end, first, second in sweep(intervals)]
+        assert sorted(found) == pairwise(intervals)
+
+
+def test_occupancy_across_midnight():
+    # Стоянки около полуночи и на следующих сутках: пересекаются те станции,
+    # у которых есть общая минута суток
+    rng = random.Random(2020)
+    policy = get_policy('adjustable')
+    for _ in range(200):
+        rows = []
+        for station_id in range(rng.randrange(2, 15)):
+            arrival = rng.randrange(0, 3 * MINUTES_PER_DAY)
+            if rng.random() < 0.5:
+                arrival = rng.randrange(1, 3) * MINUTES_PER_DAY - rng.randrange(0, 40)
+            first = rng.random() < 0.1
+            last = not first and rng.random() < 0.2
+            departure = arrival + rng.randrange(0, 90)
+            rows.append((station_id, rng.randrange(4), departure, None if first else arrival, last))
+        expected = set()
+        for i, row in enumerate(rows):
+            for other in rows[:i]:
+                if row[1] != other[1] and minutes(policy, *row[2:]) & minutes(policy, *other[2:]):
+                    expected.add(frozenset(((row[1], row[0]), (other[1], other[0]))))
+        found = {frozenset((first, second))
+                 for _, _, first, second in sweep(occupancy_intervals(rows, policy))}
+        assert found == expected
+
+
+def expected_conflicts(schedule):
+    # Попарная проверка по всем станциям базы, рейсы по шаблону тоже
+    stations = schedule.conn.execute("""
+        SELECT route_id, id, city, departure_time, arrival_time, dwell_minutes IS NULL
+        FROM route_stations
+    """).fetchall()
+    policy = schedule.policy
+    occupied = [(route_id, station_id, city, minutes(policy, departure, arrival, last))
+                for route_id, station_id, city, departure, arrival, last in stations]
+    found = set()
+    for i, (route_id, station_id, city, busy) in enumerate(occupied):
+        for other_route, other_station, other_city, other_busy in occupied[:i]:
+            if city == other_city and route_id != other_route and busy & other_busy:
+                found.add((city, frozenset(((route_id, station_id), (other_route, other_station)))))
+    return found
+
+
+def found_conflicts(schedule):
+    return {(city, frozenset((first[0::2], second[0::2])))
+            for city, _, _, first, second in schedule.find_conflicts()}
+
+
+def test_detector_matches_pairwise_after_edits(tmp_path):
+    rng = random.Random(202)
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='adjustable')
+    try:
+        routes = []
+        for n in range(6):
+            route_id = schedule.create_route(f"Маршрут {n}")
+            departure = rng.randrange(22 * 60, 25 * 60)
+            for city in rng.sample(CITIES, 3):
+                schedule.add_station(route_id, city, departure=departure)
+            for index in range(2):
+                schedule.update_station(route_id, index, schedule.station(route_id, index)[1],
+                                        departure + index * 60 + rng.randrange(0, 30), rng.randrange(5, 60))
+            routes.append(route_id)
+        schedule.generate_trips(routes[0], 23 * 60, 24 * 60 + 30, 45)
+        assert found_conflicts(schedule) == expected_conflicts(schedule)
+        for step in range(30):
+            route_id = rng.choice(routes)
+            index = rng.randrange(len(schedule.route(route_id)) - 1)
+            station = schedule.station(route_id, index)
+            schedule.update_station(route_id, index, rng.choice(CITIES),
+                                    (station[2] + rng.randrange(-60, 60)) % MINUTES_PER_DAY, rng.randrange(5, 60))
+            assert found_conflicts(schedule) == expected_conflicts(schedule), step
+    finally:
+        schedule.close()
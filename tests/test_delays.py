@@ -0,0 +1,61 @@
+from timetable import Schedule, connect
+from timetable.delays import DelayStream
+
+# Номер пачки задержек (delay_batches) растёт и после удаления маршрутов:
+# окно, прочитавшее пачку N, видит следующую, даже если строки пачки N
+# удалились вместе со своим маршрутом.
+
+
+def event(route_id, station_id, delay):
+    return f'{{"route": {route_id}, "station": {station_id}, "delay": {delay}}}'
+
+
+def test_seq_survives_route_delete(tmp_path):
+    path = str(tmp_path / 'trains.db')
+    schedule = Schedule(path, policy='adjustable')
+    # Поток событий пишет своим соединением, как python -m timetable.delays
+    stream = DelayStream(connect(path))
+    try:
+        kept = schedule.create_route("Остаётся")
+        deleted = schedule.create_route("Удаляется")
+        for route_id in (kept, deleted):
+            schedule.add_station(route_id, "Москва", departure=8 * 60, travel=60)
+            schedule.add_station(route_id, "Тверь", travel=0)
+        kept_station = schedule.route(kept).ids[0]
+        deleted_station = schedule.route(deleted).ids[0]
+
+        stream.feed([event(kept, kept_station, 5), event(deleted, deleted_station, 7)])
+        stream.flush()
+        assert schedule.poll_delays() == {kept: (kept_station, 5), deleted: (deleted_station, 7)}
+
+        # Самая новая пачка - только у удаляемого маршрута
+        stream.feed([event(deleted, deleted_station, 12)])
+        stream.flush()
+        assert schedule.poll_delays() == {deleted: (deleted_station, 12)}
+        last_seq = schedule.delay_feed.seq
+        schedule.delete_route(deleted)
+
+        stream.feed([event(kept, kept_station, 9)])
+        stream.flush()
+        assert schedule.poll_delays() == {kept: (kept_station, 9)}
+        assert schedule.delay_feed.seq > last_seq
+    finally:
+        stream.conn.close()
+        schedule.close()
+
+
+def test_unknown_route_is_not_written(tmp_path):
+    path = str(tmp_path / 'trains.db')
+    schedule = Schedule(path, policy='adjustable')
+    stream = DelayStream(connect(path))
+    try:
+        route_id = schedule.create_route("Маршрут")
+        schedule.add_station(route_id, "Москва", departure=8 * 60, travel=60)
+        station_id = schedule.route(route_id).ids[0]
+        stream.feed([event(route_id, station_id, 3), event(route_id + 100, 1, 4), 'не событие'])
+        stream.flush()
+        assert (stream.written, stream.unknown, stream.rejected) == (1, 1, 1)
+        assert schedule.poll_delays() == {route_id: (station_id, 3)}
+    finally:
+        stream.conn.close()
+        schedule.close()
@@ -0,0 +1,137 @@
+import sqlite3
+
+from timetable import Schedule, connect
+from timetable import migrations
+from timetable.migrations import MIGRATIONS, migrate, schema_version
+
+# Миграции базы, созданной исходными Appl1/App2: время отправления текстом
+# "ЧЧ:ММ", повторяющиеся названия маршрутов, дыры и повторы order_index,
+# станции удалённых маршрутов.
+
+
+def legacy_database(path, routes, stations):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE routes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE stations (
+            id INTEGER PRIMARY KEY,
+            route_id INTEGER NOT NULL,
+            order_index INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            departure_time TEXT NOT NULL,
+            travel_time INTEGER,
+            FOREIGN KEY (route_id) REFERENCES routes(id)
+        )
+    """)
+    conn.executemany("INSERT INTO routes (id, name) VALUES (?, ?)", routes)
+    conn.executemany("""
+        INSERT INTO stations (route_id, order_index, city, departure_time, travel_time)
+        VALUES (?, ?, ?, ?, ?)
+    """, stations)
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_database_reaches_latest_version(tmp_path):
+    path = str(tmp_path / 'trains.db')
+    legacy_database(path, [(1, "Москва - Тверь"), (2, "Москва - Тверь")], [
+        # Поезд идёт через полночь, order_index с дырой и повтором
+        (1, 1, "Москва", "22:30", 90),
+        (1, 3, "Клин", "00:10", 70),
+        (1, 3, "Тверь", "01:20", 0),
+        (2, 1, "Москва", "08:00", 60),
+        # Станция маршрута, которого уже нет
+        (7, 1, "Орёл", "09:00", 0),
+    ])
+    conn = connect(path)
+    try:
+        assert schema_version(conn) == len(MIGRATIONS)
+        assert conn.execute("SELECT id, name FROM routes ORDER BY id").fetchall() == [
+            (1, "Москва - Тверь"), (2, "Москва - Тверь (2)")]
+        rows = conn.execute("""
+            SELECT city, departure_time FROM stations WHERE route_id=1 ORDER BY order_index
+        """).fetchall()
+        assert rows == [("Москва", 22 * 60 + 30), ("Клин", 24 * 60 + 10), ("Тверь", 25 * 60 + 20)]
+        assert conn.execute("SELECT COUNT(*) FROM stations WHERE route_id=7").fetchone() == (0,)
+    finally:
+        conn.close()
+    # Мигрированная база открывается и правится как новая
+    schedule = Schedule(path, policy='full')
+    try:
+        assert list(schedule.route(1).cities) == ["Москва", "Клин", "Тверь"]
+        schedule.add_station(2, "Тверь", travel=0)
+        assert len(schedule.route(2)) == 2
+        assert len(schedule.departures("Москва", 0)) == 2
+    finally:
+        schedule.close()
+
+
+def test_duplicate_names_with_taken_suffix(tmp_path):
+    # Название "A (2)" уже занято - переименованный дубль получает другое
+    path = str(tmp_path / 'trains.db')
+    legacy_database(path, [(1, "A"), (2, "A"), (3, "A (2)"), (4, "A (2)"), (5, "A")], [])
+    conn = connect(path)
+    try:
+        assert schema_version(conn) == len(MIGRATIONS)
+        names = dict(conn.execute("SELECT id, name FROM routes"))
+        assert names[1] == "A" and names[3] == "A (2)"
+        assert len(set(names.values())) == len(names)
+    finally:
+        conn.close()
+
+
+def test_terminal_departure_zero_is_aligned(tmp_path, monkeypatch):
+    # App2 до исправления: конечная B сохранена с отправлением 0, затем
+    # к маршруту добавили C, которая тоже отправилась "в 00:00"
+    version = MIGRATIONS.index(migrations.align_terminal_departures)
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS[:version])
+    conn = sqlite3.connect(str(tmp_path / 'trains.db'))
+    migrate(conn)
+    conn.execute("INSERT INTO routes (id, name) VALUES (1, 'A - D')")
+    conn.executemany("""
+        INSERT INTO stations (route_id, order_index, city, departure_time, travel_time,
+                              arrival_time, dwell_minutes, offset_minutes)
+        VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+    """, [(1024, "A", 600, 120, None, 0, 0),
+          (2048, "B", 0, 30, 720, -720, -600),
+          (3072, "C", 0, 0, 30, -30, -600),
+          (4096, "D", 0, 0, 0, None, -600)])
+    conn.commit()
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS)
+    migrate(conn)
+    rows = conn.execute("""
+        SELECT departure_time, arrival_time, dwell_minutes, offset_minutes
+        FROM stations ORDER BY order_index
+    """).fetchall()
+    assert rows == [(600, None, 0, 0), (720, 720, 0, 120), (750, 750, 0, 150), (750, 750, None, 150)]
+    conn.close()
+
+
+def test_negative_stored_times_are_clamped(tmp_path, monkeypatch):
+    version = MIGRATIONS.index(migrations.clamp_stored_times)
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS[:version])
+    conn = sqlite3.connect(str(tmp_path / 'trains.db'))
+    migrate(conn)
+    conn.execute("INSERT INTO routes (id, name) VALUES (1, 'A - C')")
+    conn.executemany("""
+        INSERT INTO stations (route_id, order_index, city, departure_time, travel_time,
+                              arrival_time, dwell_minutes, offset_minutes)
+        VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+    """, [(1024, "A", 600, 120, None, 0, 0),
+          (2048, "B", 700, 30, 720, -20, 100),
+          (3072, "C", 500, 0, 730, None, -100)])
+    conn.commit()
+    log = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS)
+    migrate(conn)
+    rows = conn.execute("""
+        SELECT dwell_minutes, offset_minutes FROM stations ORDER BY order_index
+    """).fetchall()
+    assert rows == [(0, 0), (0, 100), (None, 0)]
+    assert conn.execute("SELECT COUNT(*) FROM change_log").fetchone() == log
+    conn.close()
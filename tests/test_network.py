@@ -0,0 +1,88 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from timetable import Schedule, connect
+from timetable import network
+
+# Массовые операции: без пула и с пулом процессов результат одинаковый,
+# соединения заданий закрываются, а главное соединение после ошибки
+# остаётся без транзакции.
+
+
+def build_database(path):
+    schedule = Schedule(path, policy='full')
+    for n in range(12):
+        route_id = schedule.create_route(f"Маршрут {n}")
+        schedule.add_station(route_id, "Москва", departure=6 * 60 + n * 40)
+        schedule.add_station(route_id, "Клин", travel=60)
+        schedule.add_station(route_id, "Тверь", travel=50)
+    schedule.close()
+
+
+def stored(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("""
+            SELECT id, departure_time, arrival_time, dwell_minutes, offset_minutes
+            FROM stations ORDER BY id
+        """).fetchall()
+    finally:
+        conn.close()
+
+
+def run(path, workers, *args):
+    conn = connect(path)
+    try:
+        report = network.run(conn, path, *args, workers=workers, chunk=5)
+        assert not conn.in_transaction
+    finally:
+        conn.close()
+    return report
+
+
+@pytest.mark.parametrize('operation, params', [
+    ('shift', (7 * 60, 10 * 60, 15)),
+    ('recalculate', ()),
+    ('validate', ()),
+])
+def test_workers_agree(tmp_path, operation, params):
+    path = str(tmp_path / 'trains.db')
+    build_database(path)
+    pooled = str(tmp_path / 'pooled.db')
+    shutil.copy(path, pooled)
+    before = stored(path)
+    single = run(path, 1, operation, params)
+    assert run(pooled, 2, operation, params) == single
+    assert stored(path) == stored(pooled)
+    assert single['routes'] == single['total'] == 12
+    if operation == 'shift':
+        assert single['stations'] == 4 * 3
+        assert stored(path) != before
+    # Соединение процесса пула в главном процессе не открывается
+    assert network.worker_conn is None
+
+
+def test_reader_closed_after_error(tmp_path, monkeypatch):
+    path = str(tmp_path / 'trains.db')
+    build_database(path)
+    readers = []
+    connect_readonly = network.connect_readonly
+
+    def opened(path):
+        readers.append(connect_readonly(path))
+        return readers[-1]
+
+    def broken(conn, policy, task):
+        raise RuntimeError("сбой задания")
+
+    monkeypatch.setattr(network, 'connect_readonly', opened)
+    monkeypatch.setattr(network, 'scan_routes', broken)
+    before = stored(path)
+    with pytest.raises(RuntimeError):
+        run(path, 1, 'recalculate')
+    assert len(readers) == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        readers[0].execute("SELECT 1")
+    assert stored(path) == before
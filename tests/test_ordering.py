@@ -0,0 +1,75 @@
+import random
+
+from timetable import Schedule, RouteRepository
+from timetable import repository
+from timetable.ordering import ORDER_GAP, key_between, spread_keys
+
+# Разреженные ключи порядка: вставка между соседями берёт ключ посередине,
+# а когда места не осталось, ключи маршрута раскладываются заново.
+
+
+def test_key_between():
+    assert key_between(None, None) == ORDER_GAP
+    assert key_between(3 * ORDER_GAP, None) == 4 * ORDER_GAP
+    assert key_between(None, ORDER_GAP) == ORDER_GAP // 2
+    assert key_between(ORDER_GAP, 2 * ORDER_GAP) == ORDER_GAP + ORDER_GAP // 2
+    assert key_between(5, 7) == 6
+    assert key_between(5, 6) is None
+    assert key_between(None, 1) is None
+    assert list(spread_keys(3)) == [ORDER_GAP, 2 * ORDER_GAP, 3 * ORDER_GAP]
+
+
+def stored_order(schedule, route_id):
+    return schedule.conn.execute("""
+        SELECT id, city, order_index FROM stations WHERE route_id=? ORDER BY order_index
+    """, (route_id,)).fetchall()
+
+
+def test_rebalance_when_gap_runs_out(tmp_path, monkeypatch):
+    calls = []
+    rebalance_keys = repository.rebalance_keys
+    monkeypatch.setattr(repository, 'rebalance_keys',
+                        lambda conn, route_id: calls.append(route_id) or rebalance_keys(conn, route_id))
+    rng = random.Random(10)
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='adjustable')
+    try:
+        route_id = schedule.create_route("Маршрут")
+        cities = ["Начало", "Конец"]
+        for city in cities:
+            schedule.add_station(route_id, city, departure=8 * 60)
+        # Вставки всё время в одно место быстро съедают промежуток ключей,
+        # случайные - проверяют порядок после перераскладки
+        for step in range(60):
+            index = 1 if step < 30 else rng.randrange(len(cities) + 1)
+            schedule.insert_station(route_id, index, f"Станция {step}")
+            cities.insert(index, f"Станция {step}")
+            rows = stored_order(schedule, route_id)
+            assert [row[1] for row in rows] == cities, step
+            keys = [row[2] for row in rows]
+            assert keys == sorted(set(keys))
+            model = schedule.route(route_id)
+            assert list(model.orders) == keys
+            assert list(model.ids) == [row[0] for row in rows]
+        assert calls
+        # Перераскладка не меняет id станций и видна при загрузке заново
+        fresh = RouteRepository(schedule.conn, 'adjustable').get(route_id)
+        assert list(fresh.cities) == cities
+        assert list(fresh.orders) == list(schedule.route(route_id).orders)
+    finally:
+        schedule.close()
+
+
+def test_insert_touches_one_row(tmp_path):
+    # Пока ключ между соседями есть, остальные станции маршрута не переписываются
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='adjustable')
+    try:
+        route_id = schedule.create_route("Маршрут")
+        for k in range(5):
+            schedule.add_station(route_id, f"Город {k}", departure=8 * 60)
+        before = {row[0]: row[2] for row in stored_order(schedule, route_id)}
+        schedule.insert_station(route_id, 2, "Новый")
+        after = {row[0]: row[2] for row in stored_order(schedule, route_id)}
+        assert len(after) == len(before) + 1
+        assert all(after[station_id] == key for station_id, key in before.items())
+    finally:
+        schedule.close()
@@ -0,0 +1,157 @@
+import random
+
+from timetable import Schedule
+from timetable.planner import JourneyPlanner
+
+# Connection Scan против перебора всех поездок на маленькой сети: самое
+# раннее прибытие должно совпасть, а найденные поездки - быть возможными.
+# После правок маршрутов соединения меняются через patch(), без сборки
+# заново, и должны совпасть с только что собранными.
+
+CITIES = [f"Город {n}" for n in range(7)]
+
+
+def network(schedule):
+    # route_id -> [(город, отправление, время в пути)], рейсы по шаблону тоже
+    routes = {}
+    for route_id, city, departure, travel in schedule.conn.execute("""
+            SELECT route_id, city, departure_time, travel_time
+            FROM route_stations
+            ORDER BY route_id, order_index"""):
+        routes.setdefault(route_id, []).append((city, departure, travel or 0))
+    return routes
+
+
+def brute_force(routes, origin, destination, after, transfer):
+    # Самое раннее прибытие перебором всех поездок по маршруту от посадки
+    # до высадки: в городе можно сесть на поезд, который отправляется не
+    # раньше прибытия + пересадка (в начальном - не раньше after). Раннее
+    # прибытие в город не хуже позднего, поэтому прибытия улучшаются, пока
+    # меняются
+    arrived = {origin: after}
+    changed = True
+    while changed:
+        changed = False
+        for stations in routes.values():
+            for k in range(len(stations) - 1):
+                city, departure = stations[k][:2]
+                if city not in arrived:
+                    continue
+                ready = after if city == origin else arrived[city] + transfer
+                if departure < ready:
+                    continue
+                for j in range(k + 1, len(stations)):
+                    arrival = stations[j - 1][1] + stations[j - 1][2]
+                    if stations[j][0] != origin and arrival < arrived.get(stations[j][0], arrival + 1):
+                        arrived[stations[j][0]] = arrival
+                        changed = True
+    return arrived.get(destination)
+
+
+def check_journey(routes, legs, origin, destination, after, transfer):
+    # Поездка возможна: каждый участок - часть маршрута, пересадки не короче transfer
+    ready = after
+    city = origin
+    for route_id, start, departure, end, arrival in legs:
+        assert start == city and departure >= ready
+        stations = routes[route_id]
+        starts = [k for k, station in enumerate(stations[:-1]) if station[:2] == (start, departure)]
+        assert starts, (route_id, start, departure)
+        k = starts[0]
+        ends = [j for j in range(k + 1, len(stations))
+                if stations[j][0] == end and stations[j - 1][1] + stations[j - 1][2] == arrival]
+        assert ends, (route_id, end, arrival)
+        ready = arrival + transfer
+        city = end
+    assert city == destination
+
+
+def check_queries(schedule, rng, count=60):
+    routes = network(schedule)
+    for _ in range(count):
+        origin, destination = rng.sample(CITIES, 2)
+        after = rng.randrange(0, 30 * 60)
+        transfer = rng.choice((0, 10, 20))
+        legs = schedule.planner.earliest_arrival(origin, destination, after, transfer)
+        expected = brute_force(routes, origin, destination, after, transfer)
+        if expected is None:
+            assert not legs, (origin, destination, after, transfer, legs)
+            continue
+        assert legs, (origin, destination, after, transfer)
+        check_journey(routes, legs, origin, destination, after, transfer)
+        assert legs[-1][4] == expected, (origin, destination, after, transfer, legs)
+
+
+def connections(planner):
+    return sorted(zip(planner.dep_times, planner.arr_times, planner.trips,
+                      planner.dep_stops, planner.arr_stops))
+
+
+def check_patched(schedule):
+    # Склеенные patch() массивы - те же соединения, что у собранных заново,
+    # и порядок по (отправление, прибытие) не нарушен
+    planner = schedule.planner
+    fresh = JourneyPlanner(schedule.conn)
+    fresh.stop_ids = dict(planner.stop_ids)
+    fresh.stop_names = list(planner.stop_names)
+    fresh.load()
+    assert connections(planner) == connections(fresh)
+    keys = list(zip(planner.dep_times, planner.arr_times))
+    assert keys == sorted(keys)
+
+
+def random_route(schedule, rng, name):
+    # Время кратно 10 минутам: много соединений с одним отправлением,
+    # и порядок по прибытию внутри них проверяется
+    route_id = schedule.create_route(name)
+    departure = rng.randrange(30, 156) * 10
+    for city in rng.sample(CITIES, rng.randrange(2, 5)):
+        travel = rng.randrange(1, 12) * 10
+        schedule.add_station(route_id, city, departure=departure, travel=travel)
+        departure += travel
+    return route_id
+
+
+def test_earliest_arrival_matches_brute_force(tmp_path):
+    rng = random.Random(12)
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='full')
+    try:
+        for n in range(10):
+            random_route(schedule, rng, f"Маршрут {n}")
+        check_queries(schedule, rng)
+    finally:
+        schedule.close()
+
+
+def test_earliest_arrival_after_patch(tmp_path):
+    rng = random.Random(1212)
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='full')
+    try:
+        routes = [random_route(schedule, rng, f"Маршрут {n}") for n in range(8)]
+        schedule.generate_trips(routes[0], 6 * 60, 9 * 60, 60)
+        check_queries(schedule, rng, 10)
+        for step in range(40):
+            route_id = rng.choice(routes)
+            size = len(schedule.route(route_id))
+            operation = rng.randrange(5)
+            if operation == 0:
+                schedule.insert_station(route_id, rng.randrange(1, size + 1), rng.choice(CITIES),
+                                        travel=rng.randrange(1, 12) * 10)
+            elif operation == 1 and size > 2:
+                schedule.delete_station(route_id, rng.randrange(size))
+            elif operation == 2:
+                index = rng.randrange(size)
+                station = schedule.station(route_id, index)
+                schedule.update_station(route_id, index, station[1],
+                                        station[2] + rng.randrange(-3, 9) * 10, rng.randrange(1, 12) * 10)
+            elif operation == 3 and route_id != routes[0]:
+                schedule.delete_route(route_id)
+                routes.remove(route_id)
+                routes.append(random_route(schedule, rng, f"Новый {step}"))
+            else:
+                schedule.update_station(route_id, 0, rng.choice(CITIES), rng.randrange(30, 156) * 10,
+                                        rng.randrange(1, 12) * 10)
+            check_queries(schedule, rng, 8)
+            check_patched(schedule)
+    finally:
+        schedule.close()
@@ -0,0 +1,224 @@
+import random
+
+import pytest
+
+from timetable import Schedule, RouteRepository, MINUTES_PER_DAY
+from timetable import cascade
+
+# Пересчёт времени по правилам политик (cascade.py в базе и RouteModel в
+# кэше) против наивного пересчёта по списку станций. Маршруты начинаются
+# поздно вечером и идут несколько суток, отправление в правке вводится
+# временем суток, как из поля ввода без "+N".
+
+POLICIES = ('full', 'adjustable', 'absorbing')
+
+
+def align(minutes, reference):
+    while minutes < reference:
+        minutes += MINUTES_PER_DAY
+    return minutes
+
+
+def expected_update(policy, departures, travels, index, departure, travel):
+    # Schedule.update_station станции index на списках отправлений и
+    # времени в пути -> новые списки
+    departures = list(departures)
+    travels = list(travels)
+    last = len(departures) - 1
+    if policy != 'full' and index == last:
+        # Отправлением конечной станции хранится прибытие
+        if index:
+            departure = departures[index - 1] + travels[index - 1]
+        travel = 0
+    else:
+        if policy == 'full' and index == last:
+            travel = 0
+        if index > 0:
+            departure = align(departure, departures[index - 1] + travels[index - 1])
+    departures[index] = departure
+    travels[index] = travel
+    if index == last:
+        return departures, travels
+    if policy == 'full':
+        # Appl1: отправление выводится из предыдущей станции, начиная с изменённой
+        for k in range(max(index, 1), len(departures)):
+            departures[k] = departures[k - 1] + travels[k - 1]
+    elif policy == 'adjustable':
+        for k in range(index + 1, len(departures)):
+            departures[k] = departures[k - 1] + travels[k - 1]
+    else:
+        # Сдвигаются только станции, к которым поезд не успевает
+        for k in range(index + 1, len(departures)):
+            arrival = departures[k - 1] + travels[k - 1]
+            if arrival <= departures[k]:
+                break
+            departures[k] = arrival
+    return departures, travels
+
+
+def expected_stored(departures, travels):
+    # (прибытие, стоянка, смещение) станций, как их хранит база
+    stored = []
+    for k, departure in enumerate(departures):
+        arrival = departures[k - 1] + travels[k - 1] if k else None
+        if k == len(departures) - 1:
+            dwell = None
+        else:
+            dwell = max(departure - (departure if arrival is None else arrival), 0)
+        stored.append((arrival, dwell, max(departure - departures[0], 0)))
+    return stored
+
+
+def route_rows(schedule, route_id):
+    return schedule.conn.execute("""
+        SELECT departure_time, COALESCE(travel_time, 0),
+               arrival_time, dwell_minutes, offset_minutes
+        FROM stations
+        WHERE route_id=?
+        ORDER BY order_index
+    """, (route_id,)).fetchall()
+
+
+def build_route(schedule, rng, name, size):
+    route_id = schedule.create_route(name)
+    departure = rng.randrange(22 * 60, MINUTES_PER_DAY)
+    for k in range(size):
+        travel = rng.randrange(15, 400)
+        schedule.add_station(route_id, f"Город {k}", departure=departure, travel=travel)
+        departure += travel
+    # Запас стоянки вручную: из ранних отправлений правилами 'full' не получить
+    if schedule.policy.name != 'full':
+        for k in range(1, size - 1):
+            if rng.random() < 0.4:
+                station = schedule.station(route_id, k)
+                schedule.update_station(route_id, k, station[1], station[2] + rng.randrange(1, 60), station[3])
+    return route_id
+
+
+@pytest.fixture(params=(True, False), ids=('update-from', 'executemany'))
+def set_based(request, monkeypatch):
+    # Оба пути cascade.py: UPDATE ... FROM и пакет для старых SQLite
+    monkeypatch.setattr(cascade, 'HAS_UPDATE_FROM', request.param)
+    return request.param
+
+
+def insert_stations(schedule, name, stations):
+    # Станции прямо в базу, в обход политик: (город, отправление, время в пути)
+    route_id = schedule.create_route(name)
+    schedule.conn.executemany("""
+        INSERT INTO stations (route_id, order_index, city, departure_time, travel_time)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(route_id, (k + 1) * 1024) + station for k, station in enumerate(stations)])
+    cascade.store_times(schedule.conn, route_id)
+    return route_id
+
+
+def test_stored_times_across_midnight(tmp_path, set_based):
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='adjustable')
+    try:
+        route_id = insert_stations(schedule, "Ночной", [
+            ("A", 23 * 60 + 30, 50), ("B", 24 * 60 + 25, 60), ("C", 25 * 60 + 25, 0)])
+        assert [row[2:] for row in route_rows(schedule, route_id)] == [
+            (None, 0, 0), (24 * 60 + 20, 5, 55), (25 * 60 + 25, None, 115)]
+    finally:
+        schedule.close()
+
+
+def test_stored_times_are_not_negative(tmp_path, set_based):
+    # Отправление раньше прибытия и конечная с отправлением 0 (старые
+    # данные App2) не дают отрицательных стоянки и смещения
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='adjustable')
+    try:
+        route_id = insert_stations(schedule, "Старый", [
+            ("A", 23 * 60 + 30, 50), ("B", 24 * 60 + 10, 40), ("C", 25 * 60, 0), ("D", 0, 0)])
+        assert [row[2:] for row in route_rows(schedule, route_id)] == [
+            (None, 0, 0), (24 * 60 + 20, 0, 40), (24 * 60 + 50, 10, 90), (25 * 60, None, 0)]
+    finally:
+        schedule.close()
+
+
+@pytest.mark.parametrize('policy', POLICIES)
+def test_update_matches_reference(tmp_path, set_based, policy):
+    rng = random.Random(policy)
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy=policy)
+    try:
+        routes = [build_route(schedule, rng, f"Маршрут {n}", rng.randrange(2, 12)) for n in range(4)]
+        for step in range(150):
+            route_id = rng.choice(routes)
+            rows = route_rows(schedule, route_id)
+            departures = [row[0] for row in rows]
+            travels = [row[1] for row in rows]
+            index = rng.randrange(len(rows))
+            departure = rng.randrange(MINUTES_PER_DAY)
+            travel = rng.randrange(0, 400)
+            schedule.update_station(route_id, index, f"Город {index}", departure, travel)
+
+            departures, travels = expected_update(policy, departures, travels, index, departure, travel)
+            rows = route_rows(schedule, route_id)
+            assert [row[0] for row in rows] == departures, (step, index)
+            assert [row[1] for row in rows] == travels, (step, index)
+            assert [row[2:] for row in rows] == expected_stored(departures, travels), (step, index)
+            model = schedule.route(route_id)
+            assert list(model.departures) == departures
+            assert list(model.arrivals[1:]) == [d + t for d, t in zip(departures, travels)][:-1]
+    finally:
+        schedule.close()
+
+
+@pytest.mark.parametrize('policy', POLICIES)
+def test_cached_model_matches_fresh_load(tmp_path, set_based, policy):
+    # Вставка, удаление и пересчёт меняют кэш той же арифметикой, что и базу
+    rng = random.Random(policy + 'cache')
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy=policy)
+    try:
+        route_id = build_route(schedule, rng, "Маршрут", 6)
+        for step in range(120):
+            size = len(schedule.route(route_id))
+            operation = rng.randrange(4)
+            if operation == 0:
+                schedule.insert_station(route_id, rng.randrange(size + 1), f"Новый {step}",
+                                        departure=rng.randrange(MINUTES_PER_DAY),
+                                        travel=rng.randrange(15, 400))
+            elif operation == 1 and size > 2:
+                schedule.delete_station(route_id, rng.randrange(size))
+            elif operation == 2:
+                schedule.recalculate(route_id, rng.randrange(size))
+            else:
+                index = rng.randrange(size)
+                schedule.update_station(route_id, index, f"Город {step}",
+                                        rng.randrange(MINUTES_PER_DAY), rng.randrange(400))
+            cached = schedule.route(route_id)
+            fresh = RouteRepository(schedule.conn, policy).get(route_id)
+            for column in ('ids', 'orders', 'cities', 'departures', 'travels', 'arrivals', 'dwells'):
+                assert list(getattr(cached, column)) == list(getattr(fresh, column)), (step, operation, column)
+            rows = route_rows(schedule, route_id)
+            assert [row[2:] for row in rows] == expected_stored(list(cached.departures), list(cached.travels))
+    finally:
+        schedule.close()
+
+
+@pytest.mark.parametrize('policy', ('adjustable', 'absorbing'))
+def test_append_after_saved_last_station(tmp_path, policy):
+    # App2 сохраняет конечную станцию с "00:00" в выключенном поле
+    # отправления; станция, добавленная следом, идёт от прибытия на неё
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy=policy)
+    try:
+        route_id = schedule.create_route("A - C")
+        schedule.add_station(route_id, "A", departure=10 * 60)
+        schedule.add_station(route_id, "B")
+        schedule.update_station(route_id, 0, "A", 10 * 60, 120)
+        schedule.update_station(route_id, 1, "B", 0, 0)
+        rows = route_rows(schedule, route_id)
+        assert rows[1] == (12 * 60, 0, 12 * 60, None, 120)
+
+        schedule.add_station(route_id, "C")
+        schedule.update_station(route_id, 1, "B", 12 * 60 + 10, 45)
+        rows = route_rows(schedule, route_id)
+        assert [row[0] for row in rows] == [10 * 60, 12 * 60 + 10, 12 * 60 + 55]
+        assert all(row[3] is None or row[3] >= 0 for row in rows)
+        assert all(row[4] >= 0 for row in rows)
+
+        assert schedule.plan_journey("B", "C", 0) == [("A - C", "B", 12 * 60 + 10, "C", 12 * 60 + 55)]
+        assert [row[0] for row in schedule.departures("B", 0)] == [12 * 60 + 10]
+    finally:
+        schedule.close()
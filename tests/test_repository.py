@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from timetable import Schedule, RouteRepository, MINUTES_PER_DAY
+
+# RoutePatch из Schedule.edit: окно правит им свой снимок маршрута вместо
+# перечитывания, и снимок должен совпасть с маршрутом, заново загруженным
+# из базы.
+
+COLUMNS = ('ids', 'orders', 'cities', 'departures', 'travels', 'arrivals', 'dwells')
+
+
+def assert_same_route(snapshot, fresh, context):
+    for column in COLUMNS:
+        assert list(getattr(snapshot, column)) == list(getattr(fresh, column)), context + (column,)
+
+
+@pytest.mark.parametrize('policy', ('full', 'adjustable', 'absorbing'))
+def test_patches_match_fresh_load(tmp_path, policy):
+    rng = random.Random(policy)
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy=policy)
+    try:
+        route_id = schedule.create_route("Маршрут")
+        departure = rng.randrange(22 * 60, MINUTES_PER_DAY)
+        for k in range(5):
+            schedule.add_station(route_id, f"Город {k}", departure=departure, travel=rng.randrange(15, 300))
+        snapshot = schedule.route_snapshot(route_id)
+        for step in range(200):
+            size = len(snapshot)
+            operation = rng.randrange(4)
+            if operation == 0:
+                # Вставка в середину или добавление в конец маршрута
+                args = (Schedule.insert_station, route_id, rng.randrange(size + 1), f"Новый {step}",
+                        rng.randrange(MINUTES_PER_DAY), rng.randrange(15, 300))
+            elif operation == 1 and size > 2:
+                args = (Schedule.delete_station, route_id, rng.randrange(size))
+            elif operation == 2:
+                args = (Schedule.recalculate, route_id, rng.randrange(size))
+            else:
+                args = (Schedule.update_station, route_id, rng.randrange(size), f"Город {step}",
+                        rng.randrange(MINUTES_PER_DAY), rng.randrange(300))
+            patch = schedule.edit(*args)
+            assert patch.apply(snapshot), (step, operation)
+            fresh = RouteRepository(schedule.conn, policy).get(route_id)
+            assert_same_route(snapshot, fresh, (step, operation))
+    finally:
+        schedule.close()
+
+
+def test_patch_after_foreign_change_is_full(tmp_path):
+    # Маршрут изменил другой экземпляр: по патчу снимок не поправить,
+    # окно перечитывает маршрут целиком
+    path = str(tmp_path / 'trains.db')
+    schedule = Schedule(path, policy='adjustable')
+    other = Schedule(path, policy='adjustable')
+    try:
+        route_id = schedule.create_route("Маршрут")
+        for k in range(4):
+            schedule.add_station(route_id, f"Город {k}", departure=8 * 60, travel=30)
+        snapshot = schedule.route_snapshot(route_id)
+        other.delete_station(route_id, 1)
+        patch = schedule.edit(Schedule.update_station, route_id, 0, "Город 0", 9 * 60, 30)
+        assert patch.full
+        assert not patch.apply(snapshot)
+        assert len(schedule.route(route_id)) == 3
+    finally:
+        other.close()
+        schedule.close()
@@ -0,0 +1,78 @@
+import pytest
+
+from timetable import Schedule
+from timetable.search import distance
+
+# Поиск маршрутов по названию и по городам через индексы FTS5: сначала по
+# началу слов, при нехватке совпадений - с исправлением опечаток по словарям
+# индексов.
+
+ROUTES = {
+    "Москва - Санкт-Петербург": ["Москва", "Тверь", "Бологое", "Санкт-Петербург"],
+    "Казань - Самара": ["Казань", "Ульяновск", "Самара"],
+    "Владимир - Иваново": ["Владимир", "Иваново"],
+}
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    schedule = Schedule(str(tmp_path / 'trains.db'), policy='full')
+    for name, cities in ROUTES.items():
+        route_id = schedule.create_route(name)
+        for city in cities:
+            schedule.add_station(route_id, city, departure=8 * 60, travel=60)
+    yield schedule
+    schedule.close()
+
+
+def found_names(schedule, text):
+    return sorted(label for _, label in schedule.search.search(text))
+
+
+@pytest.mark.parametrize('a, b, expected', [
+    ("москва", "москва", 0),
+    ("моксва", "москва", 1),     # перестановка соседних букв
+    ("мосва", "москва", 1),      # пропущенная буква
+    ("масква", "москва", 1),     # замена
+    ("мсква", "москва", 1),
+    ("мсокав", "москва", 2),     # две перестановки
+])
+def test_distance(a, b, expected):
+    assert distance(a, b, 2) == expected
+
+
+def test_distance_stops_at_limit():
+    assert distance("абвгде", "жзийкл", 2) == 3
+
+
+def test_prefix_search(schedule):
+    assert found_names(schedule, "моск") == ["Москва - Санкт-Петербург"]
+    assert found_names(schedule, "санкт петер") == ["Москва - Санкт-Петербург"]
+    # Город, через который маршрут проходит, подписывается рядом с ним
+    assert found_names(schedule, "бологое") == ["Москва - Санкт-Петербург (Бологое)"]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("моксва", ["Москва - Санкт-Петербург"]),
+    ("Самра", ["Казань - Самара"]),
+    ("болгое", ["Москва - Санкт-Петербург (Бологое)"]),
+    ("ульяновкс", ["Казань - Самара (Ульяновск)"]),
+    ("владимр иваново", ["Владимир - Иваново"]),
+])
+def test_search_with_typos(schedule, text, expected):
+    assert found_names(schedule, text) == expected
+
+
+def test_no_fuzzy_match(schedule):
+    # Далёкие слова и слишком короткие опечатки не исправляются
+    assert found_names(schedule, "владивосток") == []
+    assert found_names(schedule, "мк") == []
+
+
+def test_index_follows_edits(schedule):
+    route_id = schedule.find_route("Казань - Самара")
+    schedule.update_station(route_id, 1, "Сызрань", 9 * 60, 60)
+    assert found_names(schedule, "ульяновск") == []
+    assert found_names(schedule, "сызрнь") == ["Казань - Самара (Сызрань)"]
+    schedule.delete_route(route_id)
+    assert found_names(schedule, "казань") == []
@@ -0,0 +1,67 @@
+import json
+import sqlite3
+
+import pytest
+
+from timetable import Schedule
+from timetable.migrations import MIGRATIONS
+from timetable.server import TimetableServer
+
+# HTTP-сервис открывает базу только для чтения (mode=ro): не меняет режим
+# журнала, не выполняет миграции и не запускается на базе со старой схемой.
+
+
+def build_database(path):
+    schedule = Schedule(path, policy='full')
+    route_id = schedule.create_route("Москва - Тверь")
+    schedule.add_station(route_id, "Москва", departure=8 * 60)
+    schedule.add_station(route_id, "Тверь", travel=90)
+    return schedule
+
+
+def file_state(path):
+    conn = sqlite3.connect(path)
+    try:
+        return (conn.execute("PRAGMA user_version").fetchone()[0],
+                conn.execute("PRAGMA journal_mode").fetchone()[0])
+    finally:
+        conn.close()
+
+
+def test_serves_current_database(tmp_path):
+    path = str(tmp_path / 'trains.db')
+    schedule = build_database(path)
+    server = TimetableServer(path, workers=1)
+    try:
+        _, body = server.render('/routes', {}, server.data_version())
+        assert [route['name'] for route in json.loads(body)['routes']] == ["Москва - Тверь"]
+        reader = server.reader()
+        with pytest.raises(sqlite3.OperationalError):
+            reader.conn.execute("DELETE FROM routes")
+        # Запись приложения видна сервису
+        schedule.create_route("Тверь - Клин")
+        assert server.data_version() != server.version
+        assert reader.routes(0, 10)['total'] == 2
+    finally:
+        server.close()
+        schedule.close()
+
+
+def test_refuses_outdated_schema(tmp_path):
+    path = str(tmp_path / 'trains.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE routes (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    conn.execute(f"PRAGMA user_version={len(MIGRATIONS) - 1}")
+    conn.commit()
+    conn.close()
+    before = file_state(path)
+    with pytest.raises(ValueError):
+        TimetableServer(path, workers=1)
+    assert file_state(path) == before == (len(MIGRATIONS) - 1, 'delete')
+
+
+def test_missing_database_is_not_created(tmp_path):
+    path = tmp_path / 'trains.db'
+    with pytest.raises(sqlite3.OperationalError):
+        TimetableServer(str(path), workers=1)
+    assert not path.exists()
@@ -0,0 +1,39 @@
+# Ядро расписания поездов без интерфейса: база, миграции, кэш маршрутов
+# и правила пересчёта времени. Модули подгружаются при первом обращении,
+# поэтому "import timetable" не тянет за собой ни tkinter, ни sqlite3.
+#
+#   from timetable import Schedule, parse_time
+#   schedule = Schedule('trains.db', policy='full')
+
+_EXPORTS = {
+    'Schedule': 'schedule',
+    'connect': 'database',
+    'connect_readonly': 'database',
+    'migrate': 'migrations',
+    'RouteRepository': 'repository',
+    'RouteModel': 'repository',
+    'FullCascadePolicy': 'policies',
+    'AdjustableDeparturePolicy': 'policies',
+    'get_policy': 'policies',
+    'DbWorker': 'worker',
+    'parse_time': 'timeutil',
+    'format_time': 'timeutil',
+    'is_valid_time': 'timeutil',
+    'MINUTES_PER_DAY': 'timeutil',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'timetable' has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
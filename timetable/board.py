@@ -0,0 +1,121 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .timeutil import MINUTES_PER_DAY
+
+# Табло отправлений: какие поезда проходят через город после времени T.
+# Для каждого запрошенного города в памяти лежит отсортированный массив
+# ключей (время суток << ID_BITS | id станции), поиск - bisect. Город
+# читается из базы по индексу (city, departure_time) при первом запросе,
+# дальше массив правится по изменениям маршрутов (update). Конечные
+# станции маршрутов не отправляются и на табло не попадают. Рейсы по
+# шаблону (patterns.py) отправляются со станций шаблона со своим сдвигом.
+
+ID_BITS = 40
+ID_MASK = (1 << ID_BITS) - 1
+
+
+class CityDepartures:
+    __slots__ = ('keys', 'routes')
+
+    def __init__(self, rows):
+        # rows: (время суток, id станции, id маршрута)
+        rows = sorted(rows)
+        self.keys = array('q', ((minute << ID_BITS) | station_id for minute, station_id, _ in rows))
+        self.routes = array('q', (route_id for _, _, route_id in rows))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, minute, station_id, route_id):
+        key = (minute << ID_BITS) | station_id
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.routes.insert(index, route_id)
+
+    def remove(self, minute, station_id):
+        key = (minute << ID_BITS) | station_id
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+            del self.routes[index]
+
+    def after(self, minute, limit, until=None):
+        # -> [(время, id станции, id маршрута)] начиная с minute; после полуночи
+        # список продолжается со следующих суток (время + MINUTES_PER_DAY)
+        keys = self.keys
+        start = bisect_left(keys, (minute % MINUTES_PER_DAY) << ID_BITS)
+        day = minute - minute % MINUTES_PER_DAY
+        result = []
+        for step in range(min(limit, len(keys))):
+            index = start + step
+            if index >= len(keys):
+                index -= len(keys)
+                offset = day + MINUTES_PER_DAY
+            else:
+                offset = day
+            time = (keys[index] >> ID_BITS) + offset
+            if until is not None and time > until:
+                break
+            result.append((time, keys[index] & ID_MASK, self.routes[index]))
+        return result
+
+
+class DepartureBoard:
+    def __init__(self, conn, capacity=256):
+        self.conn = conn
+        self.capacity = capacity
+        self.cities = OrderedDict()
+
+    def city(self, city):
+        departures = self.cities.get(city)
+        if departures is not None:
+            self.cities.move_to_end(city)
+            return departures
+        # У последней станции маршрута нет стоянки (dwell_minutes IS NULL),
+        # рейс отправляется в start_time + offset_minutes (cascade.store_times)
+        rows = self.conn.execute("""
+            WITH departing AS (
+                SELECT departure_time, offset_minutes, id, route_id
+                FROM stations
+                WHERE city=? AND dwell_minutes IS NOT NULL
+            )
+            SELECT departure_time, id, route_id FROM departing
+            UNION ALL
+            SELECT t.start_time + d.offset_minutes, d.id, t.id
+            FROM departing d JOIN routes t ON t.pattern_id = d.route_id
+        """, (city,)).fetchall()
+        departures = CityDepartures(
+            (departure % MINUTES_PER_DAY, station_id, route_id)
+            for departure, station_id, route_id in rows)
+        self.cities[city] = departures
+        while len(self.cities) > self.capacity:
+            self.cities.popitem(last=False)
+        return departures
+
+    def next_departures(self, city, after, limit=10, until=None):
+        return self.city(city).after(after, limit, until)
+
+    def clear(self):
+        self.cities.clear()
+
+    def tracking(self):
+        # Следить за изменениями нужно, только если какой-то город загружен
+        return bool(self.cities)
+
+    def entries(self, model):
+        # id станции -> (город, время суток) для отправлений маршрута
+        if model is None:
+            return {}
+        return {model.ids[i]: (model.cities[i], model.departures[i] % MINUTES_PER_DAY)
+                for i in range(len(model) - 1)}
+
+    def update(self, route_id, before, after):
+        # before/after - entries() маршрута до и после записи
+        for station_id, (city, minute) in before.items():
+            if after.get(station_id) != (city, minute) and city in self.cities:
+                self.cities[city].remove(minute, station_id)
+        for station_id, (city, minute) in after.items():
+            if before.get(station_id) != (city, minute) and city in self.cities:
+                self.cities[city].add(minute, station_id, route_id)
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import os
+import sys
+from itertools import groupby, islice
+
+from .cascade import store_times
+from .database import connect
+from .ordering import ORDER_GAP
+from .timeutil import parse_time, format_time
+
+# Потоковая загрузка и выгрузка расписаний без диалогов приложения.
+# Файлы читаются генераторами и пишутся в базу пакетами executemany
+# в больших транзакциях, поэтому расход памяти не зависит от размера файла.
+#
+#   python -m timetable.bulk import timetable.csv
+#   python -m timetable.bulk import --gtfs gtfs_dir
+#   python -m timetable.bulk export timetable.csv
+#   python -m timetable.bulk export --gtfs gtfs_dir
+#
+# Формат CSV: route,city,departure_time,travel_time - станции одного
+# маршрута идут подряд в порядке следования, время в виде "ЧЧ:ММ" или "ЧЧ:ММ+N".
+
+CSV_FIELDS = ('route', 'city', 'departure_time', 'travel_time')
+BATCH_SIZE = 50000
+
+
+# --- чтение
+
+def read_csv(path):
+    # -> (название маршрута, [(город, отправление, время в пути), ...])
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for name, rows in groupby(reader, key=lambda row: row['route']):
+            yield name, [(row['city'], parse_time(row['departure_time']),
+                          int(row['travel_time'] or 0)) for row in rows]
+
+
+def parse_gtfs_time(value):
+    # "ЧЧ:ММ:СС", часы могут быть больше 24 - это следующие сутки
+    hours, minutes, seconds = value.strip().split(':')
+    return int(hours) * 60 + int(minutes) + (1 if int(seconds) >= 30 else 0)
+
+
+def read_gtfs(directory):
+    # Справочники stops.txt/routes.txt/trips.txt невелики и читаются целиком,
+    # stop_times.txt читается потоково; строки одного рейса должны идти подряд
+    def rows(name):
+        with open(os.path.join(directory, name), newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+
+    stop_names = {row['stop_id']: row['stop_name'] for row in rows('stops.txt')}
+    route_names = {row['route_id']: (row.get('route_short_name') or row.get('route_long_name')
+                                     or row['route_id'])
+                   for row in rows('routes.txt')}
+    trip_routes = {}
+    trips_per_route = {}
+    for row in rows('trips.txt'):
+        trip_routes[row['trip_id']] = row['route_id']
+        trips_per_route[row['route_id']] = trips_per_route.get(row['route_id'], 0) + 1
+
+    for trip_id, stop_times in groupby(rows('stop_times.txt'), key=lambda row: row['trip_id']):
+        stop_times = sorted(stop_times, key=lambda row: int(row['stop_sequence']))
+        route_id = trip_routes.get(trip_id, trip_id)
+        name = route_names.get(route_id, route_id)
+        if trips_per_route.get(route_id, 1) > 1:
+            name = f"{name} / {trip_id}"
+        stops = []
+        for i, row in enumerate(stop_times):
+            departure = parse_gtfs_time(row['departure_time'] or row['arrival_time'])
+            if i + 1 < len(stop_times):
+                following = stop_times[i + 1]
+                arrival = parse_gtfs_time(following['arrival_time'] or following['departure_time'])
+                travel = max(arrival - departure, 0)
+            else:
+                travel = 0
+            stops.append((stop_names.get(row['stop_id'], row['stop_id']), departure, travel))
+        yield name, stops
+
+
+# --- загрузка
+
+def station_rows(conn, routes, report):
+    # Создаёт маршруты и разворачивает их в строки stations. Маршрут
+    # вставляется сразу в текущей транзакции, поэтому повтор названия
+    # находится по индексу и в пределах одного файла
+    cursor = conn.cursor()
+    for name, stops in routes:
+        if cursor.execute("SELECT 1 FROM routes WHERE name=?", (name,)).fetchone():
+            report['skipped'] += 1
+            continue
+        cursor.execute("INSERT INTO routes (name) VALUES (?)", (name,))
+        route_id = cursor.lastrowid
+        report['routes'] += 1
+        for number, (city, departure, travel) in enumerate(stops, start=1):
+            yield (route_id, number * ORDER_GAP, city, departure, travel)
+
+
+def import_routes(conn, routes, batch_size=BATCH_SIZE, progress=None):
+    report = {'routes': 0, 'stations': 0, 'skipped': 0}
+    rows = station_rows(conn, routes, report)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        conn.executemany("""
+            INSERT INTO stations (route_id, order_index, city, departure_time, travel_time)
+            VALUES (?, ?, ?, ?, ?)
+        """, batch)
+        # Маршрут на границе пакетов досчитается со следующим пакетом
+        store_times(conn, batch[0][0], batch[-1][0])
+        conn.commit()
+        report['stations'] += len(batch)
+        if progress:
+            progress(report)
+    return report
+
+
+# --- выгрузка
+
+def export_csv(conn, path):
+    # Рейсы по шаблону выгружаются отдельными маршрутами со своими станциями
+    cursor = conn.execute("""
+        SELECT r.name, s.city, s.departure_time, s.travel_time
+        FROM routes r JOIN route_stations s ON s.route_id = r.id
+        ORDER BY r.id, s.order_index
+    """)
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for name, city, departure, travel in cursor:
+            writer.writerow((name, city, format_time(departure), travel or 0))
+            count += 1
+    return count
+
+
+def format_gtfs_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def export_gtfs(conn, directory):
+    os.makedirs(directory, exist_ok=True)
+
+    def writer(name, header):
+        f = open(os.path.join(directory, name), 'w', newline='', encoding='utf-8')
+        w = csv.writer(f)
+        w.writerow(header)
+        return f, w
+
+    stop_ids = {}
+    f, w = writer('stops.txt', ('stop_id', 'stop_name', 'stop_lat', 'stop_lon'))
+    with f:
+        for (city,) in conn.execute("SELECT DISTINCT city FROM stations ORDER BY city"):
+            stop_ids[city] = len(stop_ids) + 1
+            w.writerow((stop_ids[city], city, '', ''))
+
+    routes_file, routes_writer = writer('routes.txt', ('route_id', 'route_short_name', 'route_type'))
+    trips_file, trips_writer = writer('trips.txt', ('route_id', 'service_id', 'trip_id'))
+    with routes_file, trips_file:
+        for route_id, name in conn.execute("SELECT id, name FROM routes ORDER BY id"):
+            routes_writer.writerow((route_id, name, 2))
+            trips_writer.writerow((route_id, 'daily', route_id))
+
+    f, w = writer('stop_times.txt', ('trip_id', 'arrival_time', 'departure_time',
+                                     'stop_id', 'stop_sequence'))
+    count = 0
+    with f:
+        previous_route = None
+        arrival = 0
+        for route_id, order_index, city, departure, travel in conn.execute("""
+            SELECT route_id, order_index, city, departure_time, travel_time
+            FROM route_stations
+            ORDER BY route_id, order_index
+        """):
+            if route_id != previous_route:
+                previous_route = route_id
+                arrival = departure
+            w.writerow((route_id, format_gtfs_time(arrival), format_gtfs_time(departure),
+                        stop_ids[city], order_index))
+            arrival = departure + (travel or 0)
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка и выгрузка расписаний")
+    parser.add_argument('--db', default='trains.db', help="файл базы (по умолчанию trains.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('import', 'export'):
+        sub = commands.add_parser(command)
+        sub.add_argument('path', help="CSV-файл или каталог GTFS")
+        sub.add_argument('--gtfs', action='store_true', help="формат GTFS (каталог с .txt файлами)")
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    try:
+        if args.command == 'import':
+            routes = read_gtfs(args.path) if args.gtfs else read_csv(args.path)
+            report = import_routes(conn, routes, progress=lambda r: print(
+                f"\rстанций: {r['stations']}", end='', file=sys.stderr))
+            print(file=sys.stderr)
+            print(f"Загружено маршрутов: {report['routes']}, станций: {report['stations']}, "
+                  f"пропущено существующих маршрутов: {report['skipped']}")
+        else:
+            count = export_gtfs(conn, args.path) if args.gtfs else export_csv(conn, args.path)
+            print(f"Выгружено станций: {count}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import sqlite3
+from itertools import groupby
+
+# Пересчёт времени отправления последующих станций одним запросом.
+# Отправление станции k = base + сумма travel_time станций от start_order до k-1,
+# то есть нарастающий итог SUM(travel_time) OVER (ORDER BY order_index).
+
+# UPDATE ... FROM поддерживается начиная с SQLite 3.33
+HAS_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+SHIFT_SQL = """
+    WITH shifted AS (
+        SELECT id,
+               ? + COALESCE(SUM(COALESCE(travel_time, 0)) OVER (
+                   ORDER BY order_index
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ), 0) AS new_departure
+        FROM stations
+        WHERE route_id=? AND order_index >= ?
+    )
+    UPDATE stations
+    SET departure_time = shifted.new_departure
+    FROM shifted
+    WHERE stations.id = shifted.id
+      AND stations.departure_time != shifted.new_departure
+"""
+
+
+def shift_departures(conn, route_id, start_order, base):
+    if HAS_UPDATE_FROM:
+        conn.execute(SHIFT_SQL, (base, route_id, start_order))
+        return
+    # Для старых версий SQLite - один пакетный executemany
+    cursor = conn.execute("""
+        SELECT id, departure_time, travel_time
+        FROM stations
+        WHERE route_id=? AND order_index >= ?
+        ORDER BY order_index
+    """, (route_id, start_order))
+    updates = []
+    current_time = base
+    for station_id, departure, travel in cursor.fetchall():
+        if departure != current_time:
+            updates.append((current_time, station_id))
+        current_time += travel or 0
+    conn.executemany("UPDATE stations SET departure_time=? WHERE id=?", updates)
+
+
+def recalculate_from_previous(conn, route_id, start_order):
+    # Appl1: отправление начальной станции тоже пересчитывается -
+    # от предыдущей станции, а для первой станции маршрута остаётся как есть.
+    # После удаления станций в order_index бывают дыры, поэтому берётся
+    # ближайшая предыдущая станция, а не order_index - 1
+    row = conn.execute("""
+        SELECT departure_time + COALESCE(travel_time, 0)
+        FROM stations
+        WHERE route_id=? AND order_index < ?
+        ORDER BY order_index DESC
+        LIMIT 1
+    """, (route_id, start_order)).fetchone()
+    if row is not None:
+        base = row[0]
+    else:
+        row = conn.execute("""
+            SELECT departure_time
+            FROM stations
+            WHERE route_id=? AND order_index >= ?
+            ORDER BY order_index
+            LIMIT 1
+        """, (route_id, start_order)).fetchone()
+        if row is None:
+            return
+        base = row[0]
+    shift_departures(conn, route_id, start_order, base)
+
+
+def recalculate_from_station(conn, route_id, start_order):
+    # App2: отправление начальной станции задано вручную и не меняется
+    row = conn.execute("""
+        SELECT departure_time
+        FROM stations
+        WHERE route_id=? AND order_index >= ?
+        ORDER BY order_index
+        LIMIT 1
+    """, (route_id, start_order)).fetchone()
+    if row is None:
+        return
+    shift_departures(conn, route_id, start_order, row[0])
+
+
+# Поглощение задержки стоянками: отправление следующей станции сдвигается,
+# только если поезд прибывает позже него, и цепочка обрывается на первой
+# станции, где стоянки хватило. Рекурсивный запрос идёт по станциям через
+# индекс (route_id, order_index) и читает только затронутые строки
+ABSORB_SQL = """
+    WITH RECURSIVE chain(id, order_index, departure, travel) AS (
+        SELECT id, order_index, departure_time, COALESCE(travel_time, 0)
+        FROM stations
+        WHERE id = (
+            SELECT id FROM stations
+            WHERE route_id=:route_id AND order_index >= :start_order
+            ORDER BY order_index
+            LIMIT 1
+        )
+        UNION ALL
+        SELECT next.id, next.order_index, chain.departure + chain.travel,
+               COALESCE(next.travel_time, 0)
+        FROM chain
+        JOIN stations next ON next.id = (
+            SELECT id FROM stations
+            WHERE route_id=:route_id AND order_index > chain.order_index
+            ORDER BY order_index
+            LIMIT 1
+        )
+        WHERE next.departure_time < chain.departure + chain.travel
+    )
+    UPDATE stations
+    SET departure_time = (SELECT departure FROM chain WHERE chain.id = stations.id)
+    WHERE id IN (SELECT id FROM chain WHERE order_index > :start_order)
+"""
+
+
+def absorb_delay(conn, route_id, start_order):
+    # Отправление начальной станции, как в recalculate_from_station, не меняется
+    conn.execute(ABSORB_SQL, {'route_id': route_id, 'start_order': start_order})
+
+
+# Хранимые времена станции (migrations.add_stored_times), пересчитываются
+# в той же транзакции, что и запись маршрута:
+#   arrival_time   - отправление предыдущей станции + время в пути, у первой NULL;
+#   dwell_minutes  - отправление - прибытие без поправок политики, у первой 0,
+#                    у последней NULL (поезд дальше не идёт);
+#   offset_minutes - отправление от начала маршрута; рейс по шаблону
+#                    отправляется со станции в start_time + offset_minutes.
+# Стоянка и смещение не бывают отрицательными: отправление раньше прибытия
+# или раньше начала маршрута (старые или загруженные данные) даёт 0.
+# Переписываются только строки, где что-то изменилось
+TIMES_SQL = """
+    WITH times AS (
+        SELECT id, order_index,
+               LAG(departure_time + COALESCE(travel_time, 0)) OVER route AS arrival,
+               MAX(departure_time - FIRST_VALUE(departure_time) OVER route, 0) AS elapsed,
+               LEAD(id) OVER route AS next_id,
+               departure_time
+        FROM stations
+        WHERE route_id BETWEEN :first AND :last
+        WINDOW route AS (PARTITION BY route_id ORDER BY order_index)
+    ),
+    stored AS (
+        SELECT id, order_index, arrival, elapsed,
+               CASE WHEN next_id IS NULL THEN NULL
+                    ELSE MAX(departure_time - COALESCE(arrival, departure_time), 0) END AS dwell
+        FROM times
+    )
+    UPDATE stations
+    SET arrival_time = stored.arrival, dwell_minutes = stored.dwell,
+        offset_minutes = stored.elapsed
+    FROM stored
+    WHERE stations.id = stored.id
+      AND (:start IS NULL OR stored.order_index >= :start)
+      AND (stations.arrival_time IS NOT stored.arrival
+           OR stations.dwell_minutes IS NOT stored.dwell
+           OR stations.offset_minutes IS NOT stored.elapsed)
+"""
+
+
+def stored_times(rows):
+    # rows: (id, departure_time, travel_time) маршрута по order_index
+    # -> [(прибытие, стоянка, смещение, id)] как в TIMES_SQL
+    result = []
+    arrival = None
+    first = rows[0][1] if rows else 0
+    for index, (station_id, departure, travel) in enumerate(rows):
+        if index == len(rows) - 1:
+            dwell = None
+        else:
+            dwell = max(departure - (departure if arrival is None else arrival), 0)
+        result.append((arrival, dwell, max(departure - first, 0), station_id))
+        arrival = departure + (travel or 0)
+    return result
+
+
+def store_times(conn, first_route, last_route=None, start_order=None):
+    # Хранимые времена станций маршрутов first_route..last_route; start_order -
+    # с какой станции они могли измениться (None - весь маршрут)
+    if last_route is None:
+        last_route = first_route
+    if HAS_UPDATE_FROM:
+        conn.execute(TIMES_SQL, {'first': first_route, 'last': last_route, 'start': start_order})
+        return
+    cursor = conn.execute("""
+        SELECT route_id, id, order_index, departure_time, travel_time,
+               arrival_time, dwell_minutes, offset_minutes
+        FROM stations
+        WHERE route_id BETWEEN ? AND ?
+        ORDER BY route_id, order_index
+    """, (first_route, last_route))
+    updates = []
+    for _, rows in groupby(cursor.fetchall(), key=lambda row: row[0]):
+        rows = list(rows)
+        for row, times in zip(rows, stored_times([(row[1], row[3], row[4]) for row in rows])):
+            if (start_order is None or row[2] >= start_order) and tuple(row[5:]) != times[:3]:
+                updates.append(times)
+    conn.executemany("""
+        UPDATE stations SET arrival_time=?, dwell_minutes=?, offset_minutes=? WHERE id=?
+    """, updates)
@@ -0,0 +1,111 @@
+# Лента изменений общей базы trains.db для нескольких открытых экземпляров
+# приложения. PRAGMA data_version меняется, когда другое соединение
+# зафиксировало транзакцию; тогда новые записи change_log (заполняется
+# триггерами, см. migrations.add_change_log) говорят, какие маршруты
+# и станции перечитать.
+
+# Сколько последних записей журнала хранить
+KEEP_ENTRIES = 50000
+# Как часто (в опросах) чистить журнал
+PRUNE_EVERY = 200
+# При большем числе новых записей (массовая загрузка) проще перечитать всё
+FULL_RELOAD_ENTRIES = 5000
+
+
+class RouteChanges:
+    def __init__(self):
+        self.routes = set()      # маршруты, у которых менялась сама строка routes
+        self.deleted = set()     # удалённые маршруты
+        self.stations = {}       # route_id -> id изменённых станций
+        self.full = False        # журнал обрезан - перечитать всё
+
+    def __bool__(self):
+        return bool(self.full or self.routes or self.stations)
+
+    def affected_routes(self):
+        return self.routes | self.stations.keys()
+
+    def add(self, route_id, station_id, op):
+        if station_id is None:
+            self.routes.add(route_id)
+            if op == 'DELETE':
+                self.deleted.add(route_id)
+            elif op == 'INSERT':
+                self.deleted.discard(route_id)
+        else:
+            self.stations.setdefault(route_id, set()).add(station_id)
+
+    def merge(self, other):
+        self.full = self.full or other.full
+        self.routes |= other.routes
+        self.deleted = (self.deleted - other.routes) | other.deleted
+        for route_id, station_ids in other.stations.items():
+            self.stations.setdefault(route_id, set()).update(station_ids)
+
+
+class ChangeFeed:
+    def __init__(self, conn):
+        self.conn = conn
+        self.data_version = self.current_version()
+        row = conn.execute("SELECT MAX(id) FROM change_log").fetchone()
+        self.last_id = row[0] or 0
+        self.polls = 0
+        self.writes = 0
+
+    def current_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll(self):
+        # -> RouteChanges или None, если другие соединения ничего не меняли
+        version = self.current_version()
+        if version == self.data_version:
+            return None
+        self.data_version = version
+        self.polls += 1
+        if self.polls % PRUNE_EVERY == 0:
+            self.prune()
+        last_id = self.conn.execute("SELECT MAX(id) FROM change_log").fetchone()[0] or 0
+        if last_id <= self.last_id:
+            return None
+        changes = RouteChanges()
+        if last_id - self.last_id > FULL_RELOAD_ENTRIES:
+            changes.full = True
+            self.last_id = last_id
+            return changes
+        rows = self.conn.execute("""
+            SELECT id, route_id, station_id, op
+            FROM change_log
+            WHERE id > ?
+            ORDER BY id
+        """, (self.last_id,)).fetchall()
+        if not rows:
+            return None
+        if rows[0][0] > self.last_id + 1:
+            # Пропущенные записи уже удалены из журнала
+            changes.full = True
+        for entry_id, route_id, station_id, op in rows:
+            changes.add(route_id, station_id, op)
+        self.last_id = rows[-1][0]
+        return changes
+
+    def skip_to_end(self):
+        # Вызывается в своей пишущей транзакции перед фиксацией
+        self.writes += 1
+        if self.writes % PRUNE_EVERY == 0:
+            self.prune()
+        row = self.conn.execute("SELECT MAX(id) FROM change_log").fetchone()
+        self.last_id = row[0] or 0
+
+    def prune(self):
+        in_transaction = self.conn.in_transaction
+        try:
+            self.conn.execute("""
+                DELETE FROM change_log
+                WHERE id <= (SELECT MAX(id) FROM change_log) - ?
+            """, (KEEP_ENTRIES,))
+            if not in_transaction:
+                self.conn.commit()
+        except Exception:
+            # Журнал почистит следующий опрос или другой экземпляр
+            if not in_transaction:
+                self.conn.rollback()
@@ -0,0 +1,143 @@
+import heapq
+
+from .policies import get_policy
+from .timeutil import MINUTES_PER_DAY
+
+# Поиск конфликтов: два разных маршрута стоят в одном городе в одни и те же
+# минуты. Для каждой станции города строится интервал занятости
+# [прибытие, отправление] по правилам политики (policy.occupancy), затем
+# интервалы города проверяются заметанием: сортировка по началу и куча
+# концов активных интервалов - O(n log n) плюс число найденных пересечений.
+# Расписание суточное, поэтому время берётся по модулю суток, а интервал,
+# переходящий через полночь, делится на две части.
+#
+# Прибытие, последняя ли станция и смещение рейса берутся из хранимых
+# столбцов станции (cascade.store_times). Полная проверка читает все станции
+# одним проходом, после записи перепроверяются только города изменённого
+# маршрута (invalidate).
+
+# Больше пересечений в одном городе не ищется: при таком числе расписание
+# города всё равно надо переделывать, а список не должен расти квадратично
+CITY_LIMIT = 100
+
+
+def occupancy_intervals(rows, policy):
+    # rows: (id станции, id маршрута, отправление, прибытие или None, последняя ли)
+    # -> [(с, по, id маршрута, id станции)] в пределах суток
+    intervals = []
+    for station_id, route_id, departure, arrival, last in rows:
+        start, end = policy.occupancy(arrival, departure, last)
+        length = min(end - start, MINUTES_PER_DAY - 1)
+        start %= MINUTES_PER_DAY
+        end = start + length
+        if end >= MINUTES_PER_DAY:
+            intervals.append((start, MINUTES_PER_DAY - 1, route_id, station_id))
+            intervals.append((0, end - MINUTES_PER_DAY, route_id, station_id))
+        else:
+            intervals.append((start, end, route_id, station_id))
+    return intervals
+
+
+def sweep(intervals, limit=None):
+    # -> [(с, по, (маршрут, станция), (маршрут, станция))] пересечений
+    # интервалов разных маршрутов; границы включаются
+    found = []
+    active = []
+    for start, end, route_id, station_id in sorted(intervals):
+        while active and active[0][0] < start:
+            heapq.heappop(active)
+        for other_end, other_route, other_station in active:
+            if other_route != route_id:
+                found.append((start, min(end, other_end),
+                              (other_route, other_station), (route_id, station_id)))
+                if limit is not None and len(found) >= limit:
+                    return found
+        heapq.heappush(active, (end, route_id, station_id))
+    return found
+
+
+class ConflictDetector:
+    def __init__(self, conn, policy=None):
+        self.conn = conn
+        self.policy = get_policy(policy)
+        # город -> конфликты; None - полной проверки ещё не было
+        self.found = None
+        self.dirty = set()
+
+    def loaded(self):
+        return self.found is not None
+
+    def city_rows(self, city):
+        # Станции города; рейсы по шаблону - станции шаблона, сдвинутые
+        # на начало рейса
+        return self.conn.execute("""
+            WITH here AS (
+                SELECT id, route_id, departure_time, arrival_time,
+                       dwell_minutes IS NULL AS last, offset_minutes
+                FROM stations
+                WHERE city=?
+            )
+            SELECT id, route_id, departure_time, arrival_time, last FROM here
+            UNION ALL
+            SELECT h.id, t.id, t.start_time + h.offset_minutes,
+                   h.arrival_time + t.start_time + h.offset_minutes - h.departure_time, h.last
+            FROM here h JOIN routes t ON t.pattern_id = h.route_id
+        """, (city,)).fetchall()
+
+    def all_rows(self):
+        # -> город -> строки как у city_rows для всех станций базы
+        trips = {}
+        for trip_id, pattern_id, start in self.conn.execute(
+                "SELECT id, pattern_id, start_time FROM routes WHERE pattern_id IS NOT NULL"):
+            trips.setdefault(pattern_id, []).append((trip_id, start))
+        cities = {}
+        rows = self.conn.execute("""
+            SELECT route_id, id, city, departure_time, arrival_time,
+                   dwell_minutes IS NULL, offset_minutes
+            FROM stations
+        """)
+        for route_id, station_id, city, departure, arrival, last, offset in rows:
+            city_rows = cities.setdefault(city, [])
+            city_rows.append((station_id, route_id, departure, arrival, last))
+            for trip_id, start in trips.get(route_id, ()):
+                delta = start + offset - departure
+                city_rows.append((station_id, trip_id, departure + delta,
+                                  None if arrival is None else arrival + delta, last))
+        return cities
+
+    def check(self, rows):
+        return sweep(occupancy_intervals(rows, self.policy), CITY_LIMIT)
+
+    def scan(self):
+        self.found = {}
+        self.dirty.clear()
+        for city, rows in self.all_rows().items():
+            conflicts = self.check(rows)
+            if conflicts:
+                self.found[city] = conflicts
+
+    def invalidate(self, cities):
+        # Города, где после записи нужно перепроверить конфликты
+        if self.found is not None:
+            self.dirty.update(cities)
+
+    def clear(self):
+        # Какие города изменились, неизвестно - следующая проверка полная
+        self.found = None
+        self.dirty.clear()
+
+    def conflicts(self, limit=None):
+        # -> [(город, с, по, (маршрут, станция), (маршрут, станция))] по времени
+        if self.found is None:
+            self.scan()
+        for city in self.dirty:
+            conflicts = self.check(self.city_rows(city))
+            if conflicts:
+                self.found[city] = conflicts
+            else:
+                self.found.pop(city, None)
+        self.dirty.clear()
+        result = sorted(((city,) + conflict
+                         for city, conflicts in self.found.items() for conflict in conflicts),
+                        key=lambda conflict: (conflict[1], conflict[0]))
+        return result[:limit] if limit is not None else result
@@ -0,0 +1,96 @@
+import functools
+import sqlite3
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from .migrations import migrate, schema_version, MIGRATIONS
+
+DEFAULT_PATH = 'trains.db'
+
+# Сколько секунд SQLite ждёт освобождения блокировки, прежде чем вернуть ошибку
+BUSY_TIMEOUT = 5.0
+
+# Настройки соединения, которые не меняют файл базы
+READ_PRAGMAS = (
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+# WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL безопасен и заметно быстрее FULL
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+) + READ_PRAGMAS
+
+
+def connect(path=DEFAULT_PATH, timeout=BUSY_TIMEOUT, readonly=False, tracer=None):
+    # readonly - соединение только для чтения (например, для постраничных
+    # списков в потоке окна, пока пишет поток базы);
+    # tracer - tracing.Tracer, если запросы нужно замерять
+    if tracer is None:
+        conn = sqlite3.connect(path, timeout=timeout)
+    else:
+        # Трассировка необязательна - модуль загружается, только когда нужен
+        from .tracing import TracingConnection
+        conn = sqlite3.connect(path, timeout=timeout, factory=TracingConnection)
+        conn.tracer = tracer
+        conn.set_trace_callback(tracer.statement)
+    with tracer.action('connect') if tracer is not None else nullcontext():
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        migrate(conn)
+        conn.execute("PRAGMA foreign_keys=ON")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def connect_readonly(path=DEFAULT_PATH, timeout=BUSY_TIMEOUT):
+    # Соединение процесса, который базу только читает (HTTP-сервис): файл
+    # открывается в режиме mode=ro, режим журнала и схема не трогаются.
+    # Миграции выполняет приложение; со старой схемой запросы не сработают,
+    # поэтому такая база не открывается (ValueError)
+    uri = Path(path).resolve().as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, timeout=timeout, uri=True)
+    try:
+        version = schema_version(conn)
+        if version < len(MIGRATIONS):
+            raise ValueError(f"{path}: схема базы версии {version}, нужна {len(MIGRATIONS)} - "
+                             f"сначала откройте базу приложением")
+        for pragma in READ_PRAGMAS:
+            conn.execute(pragma)
+        conn.execute("PRAGMA query_only=ON")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def is_busy_error(error):
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(attempts=5, delay=0.05, on_retry=None):
+    # Повторяет операцию, если база занята другим экземпляром приложения.
+    # busy_timeout не помогает, когда в WAL устарел снимок читающей
+    # транзакции (SQLITE_BUSY_SNAPSHOT) - тогда нужна повторная попытка целиком.
+    # on_retry(self) вызывается перед повтором, например чтобы сбросить кэш
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(self, *args, **kwargs)
+                except sqlite3.OperationalError as error:
+                    if not is_busy_error(error) or attempt == attempts - 1:
+                        raise
+                    if on_retry is not None:
+                        on_retry(self)
+                    time.sleep(delay * (2 ** attempt))
+        return wrapper
+    return decorator
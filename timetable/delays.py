@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import stat
+import sys
+import time
+
+from .database import connect, is_busy_error, DEFAULT_PATH
+from .prediction import DelayOverlay
+
+# Фактические задержки поездов и ожидаемое время поверх расписания.
+# Событие - строка JSON {"route": id, "station": id, "delay": минуты}:
+# поезд маршрута отправился со станции (с последней - прибыл) на столько
+# минут позже расписания; 0 - идёт по расписанию. События приходят из
+# файла JSON lines, стандартного ввода или локального сокета.
+# Приём события - одна запись словаря в памяти (DelayOverlay), без
+# запросов к базе: у маршрута важна только последняя задержка. В таблицу
+# delays они пишутся пачками - одна транзакция раз в FLUSH_SECONDS или
+# на FLUSH_ROUTES маршрутов, номер пачки - из счётчика delay_batches.
+# Окна приложения читают новые пачки (prediction.DelayFeed) и считают
+# ожидаемое время станций по снимку маршрута (prediction.predict):
+# задержка идёт по перегонам и гасится запасом стоянки. asyncio и
+# argparse загружаются только при запуске приёма.
+#
+#   python -m timetable.delays events.jsonl
+#   tail -f events.jsonl | python -m timetable.delays
+#   python -m timetable.delays --socket /tmp/delays.sock
+
+# Маршрутов с новой задержкой, после которых пачка пишется сразу
+FLUSH_ROUTES = 5000
+# Дольше этого (секунд) задержка не ждёт записи в базу
+FLUSH_SECONDS = 1.0
+# Сколько байт читать из потока событий за раз
+READ_BYTES = 65536
+
+
+class DelayStream:
+    # Приём событий: задержки копятся в памяти, в базу уходят пачками.
+    # Задержка маршрута, которого нет в базе, не записывается
+    def __init__(self, conn, flush_routes=FLUSH_ROUTES, flush_seconds=FLUSH_SECONDS):
+        self.conn = conn
+        self.overlay = DelayOverlay()
+        self.dirty = set()
+        self.flush_routes = flush_routes
+        self.flush_seconds = flush_seconds
+        self.deadline = time.monotonic() + flush_seconds
+        self.events = 0
+        self.rejected = 0
+        self.written = 0
+        self.unknown = 0
+
+    def feed(self, lines):
+        # lines - строки событий (bytes или str)
+        delays = self.overlay.delays
+        dirty = self.dirty
+        accepted = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                route_id = int(event['route'])
+                entry = (int(event['station']), int(event['delay']))
+            except (ValueError, KeyError, TypeError):
+                self.rejected += 1
+                continue
+            delays[route_id] = entry
+            dirty.add(route_id)
+            accepted += 1
+        self.events += accepted
+        if len(dirty) >= self.flush_routes:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self):
+        # Записать пачку, если задержки ждут дольше FLUSH_SECONDS
+        if self.dirty and time.monotonic() >= self.deadline:
+            self.flush()
+
+    def flush(self):
+        # -> число записанных маршрутов; если база занята другой записью,
+        # пачка остаётся в памяти до следующей попытки
+        self.deadline = time.monotonic() + self.flush_seconds
+        if not self.dirty:
+            return 0
+        delays = self.overlay.delays
+        conn = self.conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute("INSERT INTO delay_batches DEFAULT VALUES").lastrowid
+            conn.execute("DELETE FROM delay_batches WHERE id < ?", (seq,))
+            cursor = conn.executemany("""
+                INSERT INTO delays (route_id, station_id, delay_minutes, seq)
+                SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM routes WHERE id=?)
+                ON CONFLICT(route_id) DO UPDATE
+                SET station_id=excluded.station_id, delay_minutes=excluded.delay_minutes,
+                    seq=excluded.seq
+            """, ((route_id,) + delays[route_id] + (seq, route_id) for route_id in self.dirty))
+            conn.commit()
+        except sqlite3.OperationalError as error:
+            conn.rollback()
+            if not is_busy_error(error):
+                raise
+            return 0
+        count = len(self.dirty)
+        self.written += cursor.rowcount
+        self.unknown += count - cursor.rowcount
+        self.dirty = set()
+        return count
+
+
+def split_lines(tail, chunk):
+    # -> (целые строки, начало недочитанной строки)
+    lines = (tail + chunk).split(b'\n')
+    return lines, lines.pop()
+
+
+def read_file(stream, file):
+    # Обычный файл читается до конца без цикла событий
+    tail = b''
+    while True:
+        chunk = file.read(READ_BYTES)
+        if not chunk:
+            break
+        lines, tail = split_lines(tail, chunk)
+        stream.feed(lines)
+    stream.feed([tail])
+
+
+async def consume(stream, reader):
+    tail = b''
+    while True:
+        chunk = await reader.read(READ_BYTES)
+        if not chunk:
+            break
+        lines, tail = split_lines(tail, chunk)
+        stream.feed(lines)
+    stream.feed([tail])
+
+
+async def flush_periodically(stream):
+    # Пока событий нет, накопленные задержки всё равно записываются
+    import asyncio
+    while True:
+        await asyncio.sleep(stream.flush_seconds / 4)
+        stream.tick()
+
+
+async def read_pipe(stream, file):
+    # Канал или терминал: события приходят, пока пишущая сторона открыта
+    import asyncio
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=READ_BYTES)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), file)
+    flusher = asyncio.create_task(flush_periodically(stream))
+    try:
+        await consume(stream, reader)
+    finally:
+        flusher.cancel()
+
+
+async def serve(stream, path):
+    # Локальный сокет: каждое подключение присылает свои строки событий
+    import asyncio
+    async def handle(reader, writer):
+        try:
+            await consume(stream, reader)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        # Сокет остался от прошлого запуска
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path, limit=READ_BYTES)
+    try:
+        async with server:
+            await flush_periodically(stream)
+    finally:
+        os.unlink(path)
+
+
+def main(argv=None):
+    import argparse
+    import asyncio
+    parser = argparse.ArgumentParser(prog='python -m timetable.delays',
+                                     description="Приём задержек поездов из потока событий JSON lines")
+    parser.add_argument('source', nargs='?', default='-', help="файл событий (по умолчанию - стандартный ввод)")
+    parser.add_argument('--db', default=DEFAULT_PATH, help="файл базы (по умолчанию trains.db)")
+    parser.add_argument('--socket', help="принимать события на локальном сокете вместо файла")
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    stream = DelayStream(conn)
+    start = time.perf_counter()
+    try:
+        if args.socket:
+            print(f"Сокет: {args.socket}", file=sys.stderr)
+            asyncio.run(serve(stream, args.socket))
+        else:
+            file = sys.stdin.buffer if args.source == '-' else open(args.source, 'rb')
+            with file:
+                if stat.S_ISREG(os.fstat(file.fileno()).st_mode):
+                    read_file(stream, file)
+                else:
+                    asyncio.run(read_pipe(stream, file))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.flush()
+        conn.close()
+    elapsed = time.perf_counter() - start
+    print(f"Событий: {stream.events} ({stream.events / max(elapsed, 1e-9):.0f} в секунду), "
+          f"отклонено: {stream.rejected}, записано задержек маршрутов: {stream.written}, "
+          f"неизвестных маршрутов: {stream.unknown}")
+
+
+if __name__ == '__main__':
+    main()
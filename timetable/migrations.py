@@ -0,0 +1,440 @@
+from .ordering import ORDER_GAP
+from .timeutil import parse_time, align_after
+
+# Версионные миграции схемы trains.db. Номер применённой миграции хранится
+# в PRAGMA user_version, каждая миграция выполняется в своей транзакции.
+# Новые миграции добавляются только в конец списка MIGRATIONS.
+
+
+def create_base_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS routes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stations (
+            id INTEGER PRIMARY KEY,
+            route_id INTEGER NOT NULL,
+            order_index INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            departure_time INTEGER NOT NULL,
+            travel_time INTEGER,
+            FOREIGN KEY (route_id) REFERENCES routes(id)
+        )
+    ''')
+
+
+def convert_text_times(cursor):
+    # Старые базы хранят departure_time текстом "ЧЧ:ММ" без даты, поэтому
+    # внутри маршрута время, меньшее предыдущего, относится к следующим суткам
+    cursor.execute("PRAGMA table_info(stations)")
+    column_types = {row[1]: row[2].upper() for row in cursor.fetchall()}
+    if column_types.get('departure_time') == 'INTEGER':
+        return
+    cursor.execute("""
+        SELECT id, route_id, departure_time
+        FROM stations
+        ORDER BY route_id, order_index
+    """)
+    updates = []
+    current_route = None
+    previous = 0
+    for station_id, route_id, departure in cursor.fetchall():
+        if route_id != current_route:
+            current_route = route_id
+            previous = 0
+        if isinstance(departure, str):
+            try:
+                minutes = parse_time(departure)
+            except ValueError:
+                minutes = previous
+            minutes = align_after(minutes, previous)
+        else:
+            minutes = int(departure)
+        updates.append((minutes, station_id))
+        previous = minutes
+    cursor.execute('''
+        CREATE TABLE stations_new (
+            id INTEGER PRIMARY KEY,
+            route_id INTEGER NOT NULL,
+            order_index INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            departure_time INTEGER NOT NULL,
+            travel_time INTEGER,
+            FOREIGN KEY (route_id) REFERENCES routes(id)
+        )
+    ''')
+    cursor.execute("""
+        INSERT INTO stations_new (id, route_id, order_index, city, departure_time, travel_time)
+        SELECT id, route_id, order_index, city, 0, travel_time FROM stations
+    """)
+    cursor.executemany("UPDATE stations_new SET departure_time=? WHERE id=?", updates)
+    cursor.execute("DROP TABLE stations")
+    cursor.execute("ALTER TABLE stations_new RENAME TO stations")
+
+
+def add_indexes_and_cascade(cursor):
+    # Повторяющиеся названия маршрутов получают суффикс с id; название с
+    # таким суффиксом уже может быть у другого маршрута - тогда суффикс
+    # дополняется номером, пока название не станет свободным
+    cursor.execute("SELECT id, name FROM routes ORDER BY id")
+    routes = cursor.fetchall()
+    taken = {name for _, name in routes}
+    kept = set()
+    renames = []
+    for route_id, name in routes:
+        if name not in kept:
+            kept.add(name)
+            continue
+        new_name = f"{name} ({route_id})"
+        number = 2
+        while new_name in taken:
+            new_name = f"{name} ({route_id}-{number})"
+            number += 1
+        taken.add(new_name)
+        renames.append((new_name, route_id))
+    cursor.executemany("UPDATE routes SET name=? WHERE id=?", renames)
+    # Станции удалённых маршрутов больше не нужны
+    cursor.execute("DELETE FROM stations WHERE route_id NOT IN (SELECT id FROM routes)")
+    # Пересобираем stations с ON DELETE CASCADE; порядок станций
+    # перенумеровывается подряд, чтобы убрать дыры и повторы order_index
+    cursor.execute('''
+        CREATE TABLE stations_new (
+            id INTEGER PRIMARY KEY,
+            route_id INTEGER NOT NULL,
+            order_index INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            departure_time INTEGER NOT NULL,
+            travel_time INTEGER,
+            FOREIGN KEY (route_id) REFERENCES routes(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("""
+        INSERT INTO stations_new (id, route_id, order_index, city, departure_time, travel_time)
+        SELECT id, route_id,
+               ROW_NUMBER() OVER (PARTITION BY route_id ORDER BY order_index, id),
+               city, departure_time, travel_time
+        FROM stations
+    """)
+    cursor.execute("DROP TABLE stations")
+    cursor.execute("ALTER TABLE stations_new RENAME TO stations")
+    cursor.execute("CREATE UNIQUE INDEX idx_routes_name ON routes(name)")
+    cursor.execute("CREATE UNIQUE INDEX idx_stations_route_order ON stations(route_id, order_index)")
+
+
+def add_change_log(cursor):
+    # Журнал изменений для других экземпляров приложения (changes.ChangeFeed).
+    # Для станции пишется и маршрут, чтобы обновлять только его
+    cursor.execute('''
+        CREATE TABLE change_log (
+            id INTEGER PRIMARY KEY,
+            route_id INTEGER NOT NULL,
+            station_id INTEGER,
+            op TEXT NOT NULL
+        )
+    ''')
+    for op, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f'''
+            CREATE TRIGGER log_routes_{op.lower()} AFTER {op} ON routes
+            BEGIN
+                INSERT INTO change_log (route_id, station_id, op) VALUES ({row}.id, NULL, '{op}');
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER log_stations_{op.lower()} AFTER {op} ON stations
+            BEGIN
+                INSERT INTO change_log (route_id, station_id, op) VALUES ({row}.route_id, {row}.id, '{op}');
+            END
+        ''')
+
+
+def spread_order_keys(cursor):
+    # Ключи порядка станций с шагом ORDER_GAP (см. ordering.py), чтобы
+    # станцию можно было вставить в середину маршрута без перенумерации.
+    # Отрицательные значения - обход уникального индекса на время пересчёта
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+    last_entry = cursor.fetchone()[0]
+    cursor.execute("UPDATE stations SET order_index = -order_index")
+    cursor.execute("""
+        SELECT ROW_NUMBER() OVER (PARTITION BY route_id ORDER BY order_index DESC) * ?, id
+        FROM stations
+    """, (ORDER_GAP,))
+    cursor.executemany("UPDATE stations SET order_index=? WHERE id=?", cursor.fetchall())
+    # В журнал изменений - одна запись на маршрут вместо записи на каждую станцию
+    cursor.execute("DELETE FROM change_log WHERE id > ?", (last_entry,))
+    cursor.execute("INSERT INTO change_log (route_id, station_id, op) SELECT id, NULL, 'UPDATE' FROM routes")
+
+
+def add_city_departure_index(cursor):
+    # Табло отправлений по городу (board.py)
+    cursor.execute("CREATE INDEX idx_stations_city_departure ON stations(city, departure_time)")
+
+
+def create_fts(cursor, content, column):
+    # Полнотекстовый индекс по столбцу таблицы content (search.py), который
+    # обновляется триггерами, и словарь его слов для нечёткого поиска
+    index = f'{content}_search'
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE {index} USING fts5(
+            {column}, content='{content}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+    ''')
+    cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+    cursor.execute(f"CREATE VIRTUAL TABLE {content}_vocab USING fts5vocab({index}, row)")
+    cursor.execute(f'''
+        CREATE TRIGGER {index}_insert AFTER INSERT ON {content}
+        BEGIN
+            INSERT INTO {index} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER {index}_delete AFTER DELETE ON {content}
+        BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER {index}_update AFTER UPDATE OF {column} ON {content}
+        BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+            INSERT INTO {index} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+        END
+    ''')
+
+
+def add_search_index(cursor):
+    # Поиск маршрутов по названию и по городам (search.py). Города
+    # индексируются один раз: таблица cities хранит различные города
+    # со счётчиком станций и поддерживается триггерами на stations
+    cursor.execute('''
+        CREATE TABLE cities (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            stations INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT INTO cities (name, stations) SELECT city, COUNT(*) FROM stations GROUP BY city")
+    cursor.execute('''
+        CREATE TRIGGER cities_station_insert AFTER INSERT ON stations
+        BEGIN
+            INSERT INTO cities (name, stations) VALUES (NEW.city, 1)
+                ON CONFLICT (name) DO UPDATE SET stations = stations + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER cities_station_delete AFTER DELETE ON stations
+        BEGIN
+            UPDATE cities SET stations = stations - 1 WHERE name = OLD.city;
+            DELETE FROM cities WHERE name = OLD.city AND stations <= 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER cities_station_update AFTER UPDATE OF city ON stations
+        WHEN OLD.city != NEW.city
+        BEGIN
+            INSERT INTO cities (name, stations) VALUES (NEW.city, 1)
+                ON CONFLICT (name) DO UPDATE SET stations = stations + 1;
+            UPDATE cities SET stations = stations - 1 WHERE name = OLD.city;
+            DELETE FROM cities WHERE name = OLD.city AND stations <= 0;
+        END
+    ''')
+    create_fts(cursor, 'routes', 'name')
+    create_fts(cursor, 'cities', 'name')
+
+
+def add_trip_patterns(cursor):
+    # Рейсы по шаблону (patterns.py): строка routes с pattern_id - id
+    # маршрута-шаблона и start_time - отправлением рейса, без своих станций.
+    # Рейсы удаляются вместе с шаблоном
+    cursor.execute("ALTER TABLE routes ADD COLUMN pattern_id INTEGER REFERENCES routes(id) ON DELETE CASCADE")
+    cursor.execute("ALTER TABLE routes ADD COLUMN start_time INTEGER")
+    cursor.execute("CREATE INDEX idx_routes_pattern ON routes(pattern_id)")
+    # Станции любого маршрута по его id: у рейса - станции шаблона,
+    # сдвинутые на разницу между началом рейса и отправлением шаблона
+    cursor.execute('''
+        CREATE VIEW route_stations AS
+        SELECT r.id AS route_id, s.id AS id, s.order_index AS order_index, s.city AS city,
+               s.departure_time + COALESCE(r.start_time - (
+                   SELECT f.departure_time FROM stations f
+                   WHERE f.route_id = r.pattern_id
+                   ORDER BY f.order_index
+                   LIMIT 1
+               ), 0) AS departure_time,
+               s.travel_time AS travel_time,
+               r.pattern_id AS pattern_id
+        FROM routes r JOIN stations s ON s.route_id = COALESCE(r.pattern_id, r.id)
+    ''')
+
+
+def add_stored_times(cursor):
+    # Прибытие, стоянка и смещение от начала маршрута хранятся в строке
+    # станции, чтобы табло, поиск конфликтов и чтение одной станции не
+    # искали соседние станции маршрута. Дальше их поддерживает
+    # cascade.store_times; здесь - расчёт на момент этой миграции, не
+    # зависящий от того, как cascade.py изменится потом
+    for column in ('arrival_time', 'dwell_minutes', 'offset_minutes'):
+        cursor.execute(f"ALTER TABLE stations ADD COLUMN {column} INTEGER")
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+    last_entry = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT id, route_id, departure_time, travel_time
+        FROM stations
+        ORDER BY route_id, order_index
+    """)
+    rows = cursor.fetchall()
+    updates = []
+    for index, (station_id, route_id, departure, travel) in enumerate(rows):
+        if index == 0 or rows[index - 1][1] != route_id:
+            # Первая станция: прибытия нет, смещение считается от неё
+            first = departure
+            arrival = None
+        last = index == len(rows) - 1 or rows[index + 1][1] != route_id
+        # У последней станции стоянки нет
+        dwell = None if last else departure - (departure if arrival is None else arrival)
+        updates.append((arrival, dwell, departure - first, station_id))
+        arrival = departure + (travel or 0)
+    cursor.executemany("""
+        UPDATE stations SET arrival_time=?, dwell_minutes=?, offset_minutes=? WHERE id=?
+    """, updates)
+    # Видимые данные станций не изменились - журнал не нужен
+    cursor.execute("DELETE FROM change_log WHERE id > ?", (last_entry,))
+    # Рейс по шаблону отправляется со станции в start_time + offset_minutes
+    cursor.execute("DROP VIEW route_stations")
+    cursor.execute('''
+        CREATE VIEW route_stations AS
+        SELECT r.id AS route_id, s.id AS id, s.order_index AS order_index, s.city AS city,
+               COALESCE(r.start_time + s.offset_minutes, s.departure_time) AS departure_time,
+               s.travel_time AS travel_time,
+               r.pattern_id AS pattern_id,
+               s.arrival_time + COALESCE(r.start_time + s.offset_minutes - s.departure_time, 0)
+                   AS arrival_time,
+               s.dwell_minutes AS dwell_minutes
+        FROM routes r JOIN stations s ON s.route_id = COALESCE(r.pattern_id, r.id)
+    ''')
+
+
+def add_delays(cursor):
+    # Последняя задержка поезда каждого маршрута из потока событий
+    # (delays.py). seq - номер пачки записи: окна приложения читают только
+    # задержки из пачек новее прочитанной
+    cursor.execute('''
+        CREATE TABLE delays (
+            route_id INTEGER PRIMARY KEY REFERENCES routes(id) ON DELETE CASCADE,
+            station_id INTEGER NOT NULL,
+            delay_minutes INTEGER NOT NULL,
+            seq INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX idx_delays_seq ON delays(seq)")
+
+
+def add_delay_batches(cursor):
+    # Номер пачки задержек берётся из счётчика AUTOINCREMENT, а не из
+    # MAX(seq): строки delays удаляются вместе с маршрутом, и номер
+    # удалённой пачки не должен достаться следующей
+    cursor.execute("CREATE TABLE delay_batches (id INTEGER PRIMARY KEY AUTOINCREMENT)")
+    cursor.execute("INSERT INTO delay_batches (id) SELECT MAX(seq) FROM delays HAVING MAX(seq) IS NOT NULL")
+
+
+def align_terminal_departures(cursor):
+    # App2 записывал отправлением конечной станции 0 ("00:00"), и станция,
+    # добавленная после неё, отправлялась в 00:00 первых суток - раньше,
+    # чем поезд прибыл. Такое отправление становится равным прибытию, а
+    # хранимые времена этих маршрутов считаются заново
+    cursor.execute("""
+        SELECT id, route_id, departure_time, travel_time
+        FROM stations
+        ORDER BY route_id, order_index
+    """)
+    rows = cursor.fetchall()
+    departures = []
+    changed = set()
+    for index, (station_id, route_id, departure, travel) in enumerate(rows):
+        if index > 0 and rows[index - 1][1] == route_id:
+            arrival = departures[-1] + (rows[index - 1][3] or 0)
+            if departure == 0 and arrival > 0:
+                departure = arrival
+                changed.add(route_id)
+        departures.append(departure)
+    updates = []
+    for index, (station_id, route_id, _, travel) in enumerate(rows):
+        if route_id not in changed:
+            continue
+        departure = departures[index]
+        if index == 0 or rows[index - 1][1] != route_id:
+            first = departure
+            arrival = None
+        last = index == len(rows) - 1 or rows[index + 1][1] != route_id
+        dwell = None if last else departure - (departure if arrival is None else arrival)
+        updates.append((departure, arrival, dwell, departure - first, station_id))
+        arrival = departure + (travel or 0)
+    cursor.executemany("""
+        UPDATE stations
+        SET departure_time=?, arrival_time=?, dwell_minutes=?, offset_minutes=?
+        WHERE id=?
+    """, updates)
+
+
+def clamp_stored_times(cursor):
+    # Отрицательные стоянка и смещение, записанные до того, как
+    # cascade.store_times стал их ограничивать, становятся нулём
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+    last_entry = cursor.fetchone()[0]
+    cursor.execute("""
+        UPDATE stations
+        SET dwell_minutes = MAX(dwell_minutes, 0), offset_minutes = MAX(offset_minutes, 0)
+        WHERE dwell_minutes < 0 OR offset_minutes < 0
+    """)
+    # Видимые данные станций не изменились - журнал не нужен
+    cursor.execute("DELETE FROM change_log WHERE id > ?", (last_entry,))
+
+
+MIGRATIONS = [
+    create_base_tables,
+    convert_text_times,
+    add_indexes_and_cascade,
+    add_change_log,
+    spread_order_keys,
+    add_city_departure_index,
+    add_search_index,
+    add_trip_patterns,
+    add_stored_times,
+    add_delays,
+    add_delay_batches,
+    align_terminal_departures,
+    clamp_stored_times,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    # Внешние ключи отключаются на время пересборки таблиц;
+    # PRAGMA foreign_keys не действует внутри транзакции
+    conn.commit()
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        version = schema_version(conn)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Другой экземпляр приложения мог успеть применить миграцию
+                if schema_version(conn) >= number:
+                    conn.rollback()
+                    continue
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version={number}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute(f"PRAGMA foreign_keys={'ON' if foreign_keys else 'OFF'}")
+    return schema_version(conn)
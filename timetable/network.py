@@ -0,0 +1,230 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import groupby
+
+from .cascade import stored_times
+from .database import connect, connect_readonly, DEFAULT_PATH
+from .policies import get_policy, POLICIES
+from .repository import RouteModel
+from .timeutil import MINUTES_PER_DAY, parse_time
+
+# Массовые операции над всей сетью маршрутов без окна приложения:
+#   shift       - сдвинуть маршруты и рейсы, отправляющиеся в окне времени;
+#   recalculate - пересчитать отправления всех маршрутов от первой станции
+#                 по правилам политики (например, после загрузки);
+#   validate    - найти станции с отрицательным временем в пути или
+#                 отправлением раньше прибытия, досчитать хранимые времена.
+# Маршруты делятся на диапазоны id, которые считают процессы пула, каждый
+# со своим соединением только для чтения. Запись - одна транзакция в
+# главном процессе: блокировка записи берётся до раздачи диапазонов,
+# поэтому процессы читают ровно то, что будет перезаписано. Процессы
+# пула запускаются до транзакции: порождать их, пока главное соединение
+# держит блокировку, небезопасно.
+#
+#   python -m timetable.network shift 06:00 10:00 15
+#   python -m timetable.network recalculate --policy adjustable
+#   python -m timetable.network validate --workers 8
+
+# Маршрутов в одном задании процесса
+CHUNK_ROUTES = 2000
+# Заданий в работе на процесс: больше - только лишняя память под результаты
+TASKS_PER_WORKER = 2
+
+# Соединение и политика процесса пула (open_worker)
+worker_conn = None
+worker_policy = None
+
+
+def open_worker(path, policy):
+    # Схему уже обновило пишущее соединение главного процесса
+    global worker_conn, worker_policy
+    worker_conn = connect_readonly(path)
+    worker_policy = get_policy(policy)
+
+
+def in_window(minutes, start, end):
+    # Время суток в [start, end); окно может переходить через полночь
+    minutes %= MINUTES_PER_DAY
+    if start <= end:
+        return start <= minutes < end
+    return minutes >= start or minutes < end
+
+
+def new_departures(operation, params, route_id, rows, policy):
+    # rows - строки stations маршрута без route_id; -> (отправления после
+    # операции, найденные ошибки)
+    departures = [row[3] for row in rows]
+    if operation == 'shift':
+        start, end, delta = params
+        if in_window(departures[0], start, end):
+            departures = [departure + delta for departure in departures]
+        return departures, []
+    model = RouteModel(route_id, [row[:5] for row in rows])
+    if operation == 'validate':
+        return departures, route_issues(model, rows)
+    policy.recalculate_model(model, 0)
+    return model.departures, []
+
+
+def route_issues(model, rows):
+    # Станции, которые не сходятся ни по одной политике
+    issues = []
+    for i, row in enumerate(rows):
+        station_id, city = row[0], row[2]
+        if model.travels[i] < 0:
+            issues.append((model.route_id, station_id, city, "отрицательное время в пути"))
+        if 0 < i < len(model) - 1 and model.departures[i] < model.arrivals[i]:
+            issues.append((model.route_id, station_id, city, "отправление раньше прибытия"))
+    return issues
+
+
+def process_routes(task):
+    # Задание процесса пула
+    return scan_routes(worker_conn, worker_policy, task)
+
+
+def scan_routes(conn, policy, task):
+    # Маршруты first..last -> (число маршрутов, [(отправление, прибытие,
+    # стоянка, смещение, id)] изменившихся станций, найденные ошибки)
+    operation, params, first, last = task
+    cursor = conn.execute("""
+        SELECT route_id, id, order_index, city, departure_time, travel_time,
+               arrival_time, dwell_minutes, offset_minutes
+        FROM stations
+        WHERE route_id BETWEEN ? AND ?
+        ORDER BY route_id, order_index
+    """, (first, last))
+    routes = 0
+    updates = []
+    issues = []
+    for route_id, rows in groupby(cursor, key=lambda row: row[0]):
+        rows = [row[1:] for row in rows]
+        routes += 1
+        departures, found = new_departures(operation, params, route_id, rows, policy)
+        issues.extend(found)
+        times = stored_times([(row[0], departure, row[4])
+                              for row, departure in zip(rows, departures)])
+        for row, departure, (arrival, dwell, offset, station_id) in zip(rows, departures, times):
+            if (departure, arrival, dwell, offset) != (row[3],) + tuple(row[5:]):
+                updates.append((departure, arrival, dwell, offset, station_id))
+    return routes, updates, issues
+
+
+def route_ranges(conn, chunk=CHUNK_ROUTES):
+    # -> [(первый id, последний id)] маршрутов со своими станциями
+    ids = [row[0] for row in conn.execute(
+        "SELECT id FROM routes WHERE pattern_id IS NULL ORDER BY id")]
+    return [(ids[i], ids[min(i + chunk, len(ids)) - 1]) for i in range(0, len(ids), chunk)]
+
+
+def run(conn, path, operation, params=(), policy=None, workers=None, progress=None,
+        chunk=CHUNK_ROUTES):
+    # conn - пишущее соединение с базой path; workers=1 - без пула процессов.
+    # -> {'routes', 'total', 'stations', 'trips', 'issues'}
+    policy = get_policy(policy)
+    workers = workers or os.cpu_count() or 1
+    report = {'routes': 0, 'total': 0, 'stations': 0, 'trips': 0, 'issues': []}
+
+    def write(result):
+        routes, updates, issues = result
+        conn.executemany("""
+            UPDATE stations
+            SET departure_time=?, arrival_time=?, dwell_minutes=?, offset_minutes=?
+            WHERE id=?
+        """, updates)
+        report['routes'] += routes
+        report['stations'] += len(updates)
+        report['issues'].extend(issues)
+        if progress:
+            progress(report)
+
+    reader = pool = None
+    try:
+        if workers == 1:
+            # Без пула задания считаются здесь же, через своё соединение вызова
+            reader = connect_readonly(path)
+        else:
+            # Процессы порождаются сразу (они запускаются по первым заданиям)
+            # и открывают свои соединения до блокировки записи
+            pool = ProcessPoolExecutor(workers, initializer=open_worker, initargs=(path, policy.name))
+            for future in [pool.submit(int) for _ in range(workers)]:
+                future.result()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ranges = route_ranges(conn, chunk)
+            report['total'] = conn.execute(
+                "SELECT COUNT(*) FROM routes WHERE pattern_id IS NULL").fetchone()[0]
+            tasks = [(operation, tuple(params), first, last) for first, last in ranges]
+            if pool is None:
+                for task in tasks:
+                    write(scan_routes(reader, policy, task))
+            else:
+                tasks = iter(tasks)
+                pending = set()
+                while True:
+                    for task in tasks:
+                        pending.add(pool.submit(process_routes, task))
+                        if len(pending) >= workers * TASKS_PER_WORKER:
+                            break
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write(future.result())
+            if operation == 'shift':
+                # Рейс по шаблону хранит только своё отправление
+                start, end, delta = params
+                trips = [(delta, trip_id) for trip_id, start_time in conn.execute(
+                    "SELECT id, start_time FROM routes WHERE pattern_id IS NOT NULL")
+                    if in_window(start_time, start, end)]
+                conn.executemany("UPDATE routes SET start_time = start_time + ? WHERE id=?", trips)
+                report['trips'] = len(trips)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if reader is not None:
+            reader.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m timetable.network',
+                                     description="Массовые операции над всеми маршрутами")
+    parser.add_argument('--db', default=DEFAULT_PATH, help="файл базы (по умолчанию trains.db)")
+    parser.add_argument('--workers', type=int, default=None, help="процессов (по умолчанию - по числу ядер)")
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='full',
+                        help="правила пересчёта времени")
+    commands = parser.add_subparsers(dest='command', required=True)
+    shift = commands.add_parser('shift', help="сдвинуть маршруты, отправляющиеся с первой станции в окне")
+    shift.add_argument('start', help="начало окна ЧЧ:ММ")
+    shift.add_argument('end', help="конец окна ЧЧ:ММ (не включается)")
+    shift.add_argument('minutes', type=int, help="сдвиг в минутах, может быть отрицательным")
+    commands.add_parser('recalculate', help="пересчитать отправления от первой станции")
+    commands.add_parser('validate', help="проверить маршруты и досчитать хранимые времена")
+    args = parser.parse_args(argv)
+
+    params = ()
+    if args.command == 'shift':
+        params = (parse_time(args.start), parse_time(args.end), args.minutes)
+    conn = connect(args.db)
+    try:
+        report = run(conn, args.db, args.command, params, args.policy, args.workers,
+                     progress=lambda r: print(f"\rмаршрутов: {r['routes']}/{r['total']}",
+                                              end='', file=sys.stderr))
+        print(file=sys.stderr)
+    finally:
+        conn.close()
+    print(f"Маршрутов: {report['routes']}, изменено станций: {report['stations']}, "
+          f"рейсов: {report['trips']}")
+    for route_id, station_id, city, problem in report['issues']:
+        print(f"маршрут {route_id}, станция {station_id} ({city}): {problem}")
+
+
+if __name__ == '__main__':
+    main()
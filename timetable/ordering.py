@@ -0,0 +1,34 @@
+# Разреженные ключи порядка станций. order_index идут с шагом ORDER_GAP,
+# поэтому новая станция между соседями получает ключ посередине и
+# остальные строки маршрута не меняются. Когда между соседями места
+# не осталось, ключи маршрута один раз перераскладываются (rebalance).
+
+ORDER_GAP = 1024
+
+
+def key_between(before, after):
+    # -> ключ между соседями или None, если между ними нет свободного значения;
+    # before=None - вставка в начало, after=None - в конец
+    if after is None:
+        return (before or 0) + ORDER_GAP
+    low = before if before is not None else 0
+    if after - low < 2:
+        return None
+    return (low + after) // 2
+
+
+def spread_keys(count):
+    return range(ORDER_GAP, ORDER_GAP * (count + 1), ORDER_GAP)
+
+
+def rebalance(conn, route_id):
+    # Ключи маршрута заново через ORDER_GAP с сохранением порядка.
+    # Сначала они уводятся в отрицательные, чтобы уникальный индекс
+    # (route_id, order_index) не сработал на промежуточных значениях
+    ids = [row[0] for row in conn.execute("""
+        SELECT id FROM stations WHERE route_id=? ORDER BY order_index
+    """, (route_id,))]
+    conn.execute("UPDATE stations SET order_index = -order_index WHERE route_id=?", (route_id,))
+    conn.executemany("UPDATE stations SET order_index=? WHERE id=?",
+                     zip(spread_keys(len(ids)), ids))
+    return len(ids)
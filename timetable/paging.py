@@ -0,0 +1,192 @@
+from collections import OrderedDict
+
+from .timeutil import format_time
+
+# Источники строк для виртуального списка (widgets.VirtualList).
+# Источник отдаёт общее число строк и окно строк (ключ, подпись) по смещению,
+# не загружая в память весь список.
+
+MIN_KEY = -(2 ** 63)
+
+
+class KeysetPager:
+    # Постраничное чтение по ключу: WHERE key > последний_ключ LIMIT n.
+    # Для каждой страницы запоминается ключ, после которого она начинается,
+    # поэтому последовательная прокрутка обходится без OFFSET. При прыжке
+    # на далёкую страницу её начало находится один раз по индексу ключа.
+    def __init__(self, conn, count_sql, page_sql, key_at_sql, params=(),
+                 format_row=None, page_size=200, max_pages=8):
+        self.conn = conn
+        self.count_sql = count_sql
+        self.page_sql = page_sql
+        self.key_at_sql = key_at_sql
+        self.params = tuple(params)
+        self.format_row = format_row or (lambda row: str(row[1]))
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+        self.anchors = {0: MIN_KEY}
+        self.total = None
+
+    def count(self):
+        if self.total is None:
+            self.total = self.conn.execute(self.count_sql, self.params).fetchone()[0]
+        return self.total
+
+    def reset(self):
+        self.pages.clear()
+        self.anchors = {0: MIN_KEY}
+        self.total = None
+
+    def page(self, number):
+        rows = self.pages.get(number)
+        if rows is not None:
+            self.pages.move_to_end(number)
+            return rows
+        anchor = self.anchors.get(number)
+        if anchor is None:
+            row = self.conn.execute(self.key_at_sql,
+                                    self.params + (number * self.page_size - 1,)).fetchone()
+            if row is None:
+                return []
+            anchor = row[0]
+            self.anchors[number] = anchor
+        rows = [(row[0], self.format_row(row)) for row in
+                self.conn.execute(self.page_sql, self.params + (anchor, self.page_size))]
+        if len(rows) == self.page_size:
+            self.anchors[number + 1] = rows[-1][0]
+        self.pages[number] = rows
+        # В памяти держим только несколько последних страниц
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        return rows
+
+    def rows(self, offset, limit):
+        result = []
+        size = self.page_size
+        position = offset
+        end = min(offset + limit, self.count())
+        while position < end:
+            number, start = divmod(position, size)
+            page = self.page(number)
+            if not page:
+                break
+            chunk = page[start:start + end - position]
+            result.extend(chunk)
+            position += len(chunk)
+            if len(page) < size:
+                break
+        return result
+
+    def prefetch(self, offset, limit):
+        # Заранее загружаем страницу сразу за видимым окном
+        number = (offset + limit) // self.page_size
+        if number * self.page_size < self.count():
+            self.page(number)
+
+
+def route_pager(conn, page_size=200):
+    return KeysetPager(
+        conn,
+        "SELECT COUNT(*) FROM routes",
+        "SELECT id, name FROM routes WHERE id > ? ORDER BY id LIMIT ?",
+        "SELECT id FROM routes ORDER BY id LIMIT 1 OFFSET ?",
+        page_size=page_size,
+    )
+
+
+class StationRows:
+    # Станции загруженного маршрута уже лежат в кэше (repository.RouteModel),
+    # подписи строятся только для видимого окна
+    def __init__(self, model):
+        self.model = model
+
+    def count(self):
+        return len(self.model)
+
+    def reset(self):
+        pass
+
+    def rows(self, offset, limit):
+        model = self.model
+        end = min(offset + limit, len(model))
+        return [(model.ids[i], f"{model.cities[i]} ({format_time(model.departures[i])})")
+                for i in range(offset, end)]
+
+    def prefetch(self, offset, limit):
+        pass
+
+
+class PreviewRows(StationRows):
+    # Станции с несохранённой правкой (repository.preview_update): у станций,
+    # время которых изменится, рядом со временем - сдвиг от сохранённого
+    def __init__(self, saved, preview):
+        super().__init__(preview)
+        self.saved = saved
+
+    def changed(self, index):
+        saved = self.saved
+        model = self.model
+        return (model.departures[index] != saved.departures[index]
+                or model.arrivals[index] != saved.arrivals[index]
+                or model.dwells[index] != saved.dwells[index])
+
+    def rows(self, offset, limit):
+        rows = super().rows(offset, limit)
+        saved = self.saved
+        departures = self.model.departures
+        for position, (key, label) in enumerate(rows):
+            delta = departures[offset + position] - saved.departures[offset + position]
+            if delta:
+                rows[position] = (key, f"{label} {delta:+d} мин")
+        return rows
+
+
+class PredictedRows(StationRows):
+    # Станции поезда с задержкой (prediction.Prediction): у станций, к которым
+    # он опаздывает, рядом с расписанием - ожидаемое время и отклонение
+    def __init__(self, model, prediction):
+        super().__init__(model)
+        self.prediction = prediction
+
+    def rows(self, offset, limit):
+        rows = super().rows(offset, limit)
+        prediction = self.prediction
+        for position, (key, label) in enumerate(rows):
+            if prediction.late(offset + position):
+                expected, delay, departure = prediction.expected(offset + position)
+                kind = "отпр." if departure else "приб."
+                rows[position] = (key, f"{label} ожид. {kind} {format_time(expected)} ({delay:+d} мин)")
+        return rows
+
+
+class ListRows:
+    # Готовый небольшой список строк (ключ, подпись), например результаты поиска
+    def __init__(self, rows):
+        self.items = rows
+
+    def count(self):
+        return len(self.items)
+
+    def reset(self):
+        pass
+
+    def rows(self, offset, limit):
+        return self.items[offset:offset + limit]
+
+    def prefetch(self, offset, limit):
+        pass
+
+
+class EmptyRows:
+    def count(self):
+        return 0
+
+    def reset(self):
+        pass
+
+    def rows(self, offset, limit):
+        return []
+
+    def prefetch(self, offset, limit):
+        pass
@@ -0,0 +1,31 @@
+import re
+
+from .timeutil import parse_time
+
+# Рейсы по шаблону. Шаблон - обычный маршрут: его станции хранят города,
+# время в пути и отправления один раз. Рейс - строка routes с pattern_id
+# шаблона и временем отправления start_time; его станции - станции
+# шаблона, сдвинутые на start_time минус отправление первой станции
+# шаблона (представление route_stations, см. migrations.add_trip_patterns).
+# Правка шаблона сразу меняет все его рейсы, а сами рейсы не правятся.
+#
+# Правило частоты: "06:00-22:00/30" - с 06:00 до 22:00 каждые 30 минут.
+
+FREQUENCY_RE = re.compile(r'^\s*(\d{1,2}:\d{2}(?:\+\d+)?)\s*[-–]\s*(\d{1,2}:\d{2}(?:\+\d+)?)\s*/\s*(\d+)\s*$')
+
+
+def parse_frequency(text):
+    # "06:00-22:00/30" -> (первый рейс, последний рейс, интервал) в минутах
+    match = FREQUENCY_RE.match(text or '')
+    if match is None:
+        raise ValueError(f"Неверное правило рейсов: {text!r}")
+    first = parse_time(match.group(1))
+    last = parse_time(match.group(2))
+    every = int(match.group(3))
+    if every <= 0 or last < first:
+        raise ValueError(f"Неверное правило рейсов: {text!r}")
+    return first, last, every
+
+
+def trip_starts(first, last, every):
+    return range(first, last + 1, every)
@@ -0,0 +1,237 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+
+# Планировщик поездок с пересадками по алгоритму Connection Scan.
+# Каждая пара соседних станций маршрута - элементарное соединение:
+# из города A в departure_time, в следующий город через travel_time.
+# Все соединения лежат в плоских массивах, отсортированных по времени
+# отправления, и запрос - один проход по ним от времени отправки.
+#
+# Соединения компилируются по маршрутам и кэшируются; изменённый маршрут
+# сбрасывается (forget) и перечитывается при следующем запросе, а в общих
+# массивах заменяются только его соединения. Соединения рейса по шаблону
+# (patterns.py) - соединения шаблона, сдвинутые на начало рейса.
+
+INFINITY = float('inf')
+
+
+class RouteConnections:
+    __slots__ = ('dep_stops', 'arr_stops', 'dep_times', 'arr_times')
+
+    def __init__(self):
+        self.dep_stops = array('l')
+        self.arr_stops = array('l')
+        self.dep_times = array('q')
+        self.arr_times = array('q')
+
+    def __len__(self):
+        return len(self.dep_times)
+
+    def shifted(self, delta):
+        piece = RouteConnections()
+        piece.dep_stops = self.dep_stops[:]
+        piece.arr_stops = self.arr_stops[:]
+        piece.dep_times = array('q', (time + delta for time in self.dep_times))
+        piece.arr_times = array('q', (time + delta for time in self.arr_times))
+        return piece
+
+
+class JourneyPlanner:
+    def __init__(self, conn):
+        self.conn = conn
+        self.stop_ids = {}       # город -> номер остановки
+        self.stop_names = []
+        self.pieces = None       # route_id -> RouteConnections; None - не загружено
+        self.stale = set()       # маршруты, которые нужно перечитать
+        self.dep_stops = array('l')
+        self.arr_stops = array('l')
+        self.dep_times = array('q')
+        self.arr_times = array('q')
+        self.trips = array('q')
+
+    def stop_id(self, city):
+        stop = self.stop_ids.get(city)
+        if stop is None:
+            stop = self.stop_ids[city] = len(self.stop_names)
+            self.stop_names.append(city)
+        return stop
+
+    # --- кэш соединений
+
+    def forget(self, route_id):
+        if self.pieces is not None:
+            self.stale.add(route_id)
+
+    def clear(self):
+        self.pieces = None
+        self.stale.clear()
+
+    def compile_route(self, stations):
+        # stations: (city, departure_time, travel_time) по порядку маршрута
+        piece = RouteConnections()
+        previous = None
+        for city, departure, travel in stations:
+            stop = self.stop_id(city)
+            if previous is not None:
+                prev_stop, prev_departure, prev_travel = previous
+                piece.dep_stops.append(prev_stop)
+                piece.arr_stops.append(stop)
+                piece.dep_times.append(prev_departure)
+                piece.arr_times.append(prev_departure + (prev_travel or 0))
+            previous = (stop, departure, travel)
+        return piece
+
+    def load(self):
+        if self.pieces is None:
+            self.pieces = {}
+            cursor = self.conn.execute("""
+                SELECT route_id, city, departure_time, travel_time
+                FROM stations
+                ORDER BY route_id, order_index
+            """)
+            for route_id, rows in groupby(cursor, key=lambda row: row[0]):
+                self.pieces[route_id] = self.compile_route(row[1:] for row in rows)
+            for trip_id, pattern_id, start in self.conn.execute(
+                    "SELECT id, pattern_id, start_time FROM routes WHERE pattern_id IS NOT NULL"):
+                pattern = self.pieces.get(pattern_id)
+                if pattern:
+                    self.pieces[trip_id] = pattern.shifted(start - pattern.dep_times[0])
+            self.stale.clear()
+            self.build()
+        if not self.stale:
+            return
+        changed = {}
+        for route_id in self.stale:
+            rows = self.conn.execute("""
+                SELECT city, departure_time, travel_time
+                FROM route_stations
+                WHERE route_id=?
+                ORDER BY order_index
+            """, (route_id,)).fetchall()
+            new = self.compile_route(rows) if rows else None
+            changed[route_id] = (self.pieces.pop(route_id, None), new)
+            if new is not None:
+                self.pieces[route_id] = new
+        self.stale.clear()
+        self.patch(changed)
+
+    def build(self):
+        # Куски маршрутов склеиваются и сортируются по (отправление, прибытие):
+        # соединение без времени в пути идёт раньше отправлений того же момента.
+        # Ключ сортировки - одно целое (отправление, прибытие, номер)
+        dep_stops = array('l')
+        arr_stops = array('l')
+        dep_times = array('q')
+        arr_times = array('q')
+        trips = array('q')
+        for route_id, piece in self.pieces.items():
+            dep_stops.extend(piece.dep_stops)
+            arr_stops.extend(piece.arr_stops)
+            dep_times.extend(piece.dep_times)
+            arr_times.extend(piece.arr_times)
+            trips.extend([route_id] * len(piece))
+        keys = sorted((((departure << 32) | arrival) << 32) | i
+                      for i, (departure, arrival) in enumerate(zip(dep_times, arr_times)))
+        order = [key & 0xFFFFFFFF for key in keys]
+        self.dep_stops = array('l', [dep_stops[i] for i in order])
+        self.arr_stops = array('l', [arr_stops[i] for i in order])
+        self.dep_times = array('q', [dep_times[i] for i in order])
+        self.arr_times = array('q', [arr_times[i] for i in order])
+        self.trips = array('q', [trips[i] for i in order])
+
+    def patch(self, changed):
+        # Замена соединений изменённых маршрутов без полной пересборки:
+        # старые соединения находятся bisect-ом, новые вставляются на место,
+        # а массивы склеиваются из срезов между этими позициями.
+        # changed: route_id -> (старый кусок или None, новый кусок или None)
+        dep_stops = self.dep_stops
+        arr_stops = self.arr_stops
+        dep_times = self.dep_times
+        arr_times = self.arr_times
+        trips = self.trips
+        removed = set()
+        added = []
+        for route_id, (old, new) in changed.items():
+            if old is not None:
+                for j in range(len(old)):
+                    i = bisect_left(dep_times, old.dep_times[j])
+                    while (i in removed or trips[i] != route_id
+                           or arr_times[i] != old.arr_times[j]
+                           or dep_stops[i] != old.dep_stops[j]
+                           or arr_stops[i] != old.arr_stops[j]):
+                        i += 1
+                    removed.add(i)
+            if new is not None:
+                added.extend((new.dep_times[j], new.arr_times[j], route_id,
+                              new.dep_stops[j], new.arr_stops[j]) for j in range(len(new)))
+        added.sort(key=lambda connection: connection[:2])
+        events = [(i, 1, None) for i in removed]
+        for connection in added:
+            departure, arrival = connection[:2]
+            low = bisect_left(dep_times, departure)
+            high = bisect_right(dep_times, departure, low)
+            events.append((bisect_right(arr_times, arrival, low, high), 0, connection))
+        events.sort(key=lambda event: event[:2])
+        columns = (dep_times, arr_times, trips, dep_stops, arr_stops)
+        result = tuple(array(column.typecode) for column in columns)
+        previous = 0
+        for position, kind, connection in events:
+            for target, column in zip(result, columns):
+                target.extend(column[previous:position])
+            if kind == 0:
+                for target, value in zip(result, connection):
+                    target.append(value)
+                previous = position
+            else:
+                previous = position + 1
+        for target, column in zip(result, columns):
+            target.extend(column[previous:])
+        self.dep_times, self.arr_times, self.trips, self.dep_stops, self.arr_stops = result
+
+    # --- запрос
+
+    def earliest_arrival(self, origin, destination, after, transfer=0):
+        # -> [(route_id, откуда, отправление, куда, прибытие)] - поездки по
+        # маршрутам с самым ранним прибытием, или None, если доехать нельзя.
+        # transfer - минимальное время пересадки в минутах
+        self.load()
+        source = self.stop_ids.get(origin)
+        target = self.stop_ids.get(destination)
+        if source is None or target is None:
+            return None
+        if source == target:
+            return []
+        earliest = [INFINITY] * len(self.stop_names)
+        earliest[source] = after - transfer
+        boarded = {}                          # маршрут -> соединение посадки
+        reached_by = [None] * len(self.stop_names)   # (посадка, высадка)
+        dep_stops = self.dep_stops
+        arr_stops = self.arr_stops
+        dep_times = self.dep_times
+        arr_times = self.arr_times
+        trips = self.trips
+        for i in range(bisect_left(dep_times, after), len(dep_times)):
+            departure = dep_times[i]
+            if departure >= earliest[target]:
+                break
+            trip = trips[i]
+            if trip not in boarded:
+                if earliest[dep_stops[i]] + transfer > departure:
+                    continue
+                boarded[trip] = i
+            stop = arr_stops[i]
+            if arr_times[i] < earliest[stop]:
+                earliest[stop] = arr_times[i]
+                reached_by[stop] = (boarded[trip], i)
+        if reached_by[target] is None:
+            return None
+        legs = []
+        stop = target
+        while stop != source:
+            enter, leave = reached_by[stop]
+            legs.append((trips[enter], self.stop_names[dep_stops[enter]], dep_times[enter],
+                         self.stop_names[stop], arr_times[leave]))
+            stop = dep_stops[enter]
+        legs.reverse()
+        return legs
@@ -0,0 +1,180 @@
+from .cascade import absorb_delay, recalculate_from_previous, recalculate_from_station
+from .timeutil import MINUTES_PER_DAY, align_after
+
+# Правила пересчёта расписания. Appl1 и App2 отличаются только ими:
+#   FullCascadePolicy       - Appl1: отправление каждой станции, кроме первой,
+#                             выводится из предыдущей станции;
+#   AdjustableDeparturePolicy - App2: отправление можно поправить вручную,
+#                             пересчёт идёт от изменённой станции дальше;
+#   SlackAbsorbingPolicy    - то же, но задержка гасится стоянками: сдвигаются
+#                             только станции, к которым поезд не успевает.
+# Политика пересчитывает и базу (cascade.py), и кэш маршрута (RouteModel).
+
+
+def align_departure(model, index, departure):
+    # Время из поля ввода без "+N" - время суток: поезд, прибывший на
+    # станцию после полуночи, отправляется в те же или следующие сутки
+    if index == 0:
+        return departure
+    return align_after(departure, model.arrivals[index])
+
+
+class FullCascadePolicy:
+    name = 'full'
+    # Для первой станции маршрута время отправления нужно ввести
+    needs_first_departure = True
+    # Время в пути спрашивается при добавлении станции
+    needs_travel_on_add = True
+
+    def new_station(self, model, departure=None, travel=None, index=None):
+        # -> (отправление, время в пути) станции, вставляемой перед index;
+        # по умолчанию - новой последней станции
+        if index is None:
+            index = len(model)
+        if index == 0:
+            if departure is None:
+                raise ValueError("Для первой станции нужно время отправления")
+            if not len(model):
+                return departure, 0
+        if travel is None or travel < 0:
+            raise ValueError("Неверное время в пути")
+        if index == 0:
+            return departure, travel
+        return model.departures[index - 1] + model.travels[index - 1], travel
+
+    def recalculate_after_add(self):
+        return True
+
+    def normalize_update(self, model, index, departure, travel):
+        # У последней станции нет перегона до следующей
+        if index == len(model) - 1:
+            travel = 0
+        return align_departure(model, index, departure), travel or 0
+
+    def recalculate(self, conn, model, index):
+        recalculate_from_previous(conn, model.route_id, model.orders[index])
+        self.recalculate_model(model, index)
+
+    def recalculate_model(self, model, index):
+        # Тот же пересчёт только в памяти (кэш маршрута, предпросмотр правки)
+        if index > 0:
+            base = model.departures[index - 1] + model.travels[index - 1]
+        else:
+            base = model.departures[0]
+        model.shift(index, base)
+
+    def arrival_and_dwell(self, model, index):
+        return model.arrivals[index], model.dwells[index]
+
+    def stored_arrival_and_dwell(self, departure, arrival, dwell):
+        # То же по хранимым столбцам строки станции (cascade.store_times)
+        if arrival is None:
+            return departure, 0
+        return arrival, max(departure - arrival, 0)
+
+    def occupancy(self, arrival, departure, last):
+        # -> (с, по) минуты, когда поезд стоит на станции (conflicts.py);
+        # arrival - None у первой станции: поезд там только отправляется
+        if arrival is None:
+            return departure, departure
+        if last:
+            return arrival, arrival
+        return arrival, arrival + max(departure - arrival, 0)
+
+
+class AdjustableDeparturePolicy:
+    name = 'adjustable'
+    needs_first_departure = False
+    needs_travel_on_add = False
+
+    def new_station(self, model, departure=None, travel=None, index=None):
+        # Новая станция прибывает по расписанию и отправляется без стоянки;
+        # последняя станция - без перегона
+        if index is None:
+            index = len(model)
+        travel = (travel or 0) if index < len(model) else 0
+        if index == 0:
+            # Новая первая станция по умолчанию отправляется вместо прежней
+            if departure is None:
+                departure = model.departures[0] if len(model) else 0
+            return departure, travel
+        # Предыдущая станция отправляется не раньше своего прибытия
+        previous = index - 1
+        base = max(model.departures[previous], model.arrivals[previous])
+        return base + model.travels[previous], travel
+
+    def recalculate_after_add(self):
+        return False
+
+    def normalize_update(self, model, index, departure, travel):
+        # У последней станции нет ни отправления, ни перегона: отправлением
+        # хранится прибытие, от него идёт станция, добавленная следом
+        if index == len(model) - 1:
+            return (model.arrivals[index] if index else departure), 0
+        return align_departure(model, index, departure), travel or 0
+
+    def recalculate(self, conn, model, index):
+        recalculate_from_station(conn, model.route_id, model.orders[index])
+        self.recalculate_model(model, index)
+
+    def recalculate_model(self, model, index):
+        model.shift(index, model.departures[index])
+
+    def arrival_and_dwell(self, model, index):
+        # Первая станция считается прибывшей в 00:00, последняя не стоит
+        if index == len(model) - 1:
+            return (model.arrivals[index] if index else 0), 0
+        arrival = model.arrivals[index] if index else 0
+        return arrival, self.dwell(arrival, model.departures[index])
+
+    def stored_arrival_and_dwell(self, departure, arrival, dwell):
+        # dwell_minutes IS NULL - последняя станция
+        if arrival is None:
+            arrival = 0
+        if dwell is None:
+            return arrival, 0
+        return arrival, self.dwell(arrival, departure)
+
+    def occupancy(self, arrival, departure, last):
+        # Прибытие первой станции в 00:00 - условность отображения,
+        # занимает путь поезд только в минуту отправления
+        if arrival is None:
+            return departure, departure
+        if last:
+            return arrival, arrival
+        return arrival, arrival + self.dwell(arrival, departure)
+
+    def dwell(self, arrival, departure):
+        dwell = departure - arrival
+        if dwell < 0:
+            # Отправление "00:00" у последней станции считается следующими сутками
+            dwell %= MINUTES_PER_DAY
+        return dwell
+
+
+class SlackAbsorbingPolicy(AdjustableDeparturePolicy):
+    name = 'absorbing'
+
+    def recalculate(self, conn, model, index):
+        # Заданные вручную отправления (запас стоянки) сохраняются, а
+        # записываются только станции до той, где задержка поглотилась
+        absorb_delay(conn, model.route_id, model.orders[index])
+        self.recalculate_model(model, index)
+
+    def recalculate_model(self, model, index):
+        model.absorb(index)
+
+
+POLICIES = {
+    FullCascadePolicy.name: FullCascadePolicy,
+    AdjustableDeparturePolicy.name: AdjustableDeparturePolicy,
+    SlackAbsorbingPolicy.name: SlackAbsorbingPolicy,
+}
+
+
+def get_policy(policy):
+    if policy is None:
+        return FullCascadePolicy()
+    if isinstance(policy, str):
+        return POLICIES[policy]()
+    return policy
@@ -0,0 +1,113 @@
+# Ожидаемое время поездов с задержкой поверх расписания. Задержки пишет
+# поток событий (delays.py) в таблицу delays; окна приложения и
+# HTTP-сервис читают их отсюда, не загружая asyncio и разбор аргументов
+# командной строки, которые нужны только приёму событий.
+
+# Нагоняя опоздание, поезд сокращает стоянку до этого числа минут
+MIN_DWELL_MINUTES = 1
+
+
+class Prediction:
+    # Ожидаемое время маршрута с задержкой: станции start..stop-1 поезд
+    # пройдёт не по расписанию, остальные - по расписанию
+    __slots__ = ('model', 'start', 'stop', 'arrivals', 'departures')
+
+    def __init__(self, model, start, stop, arrivals, departures):
+        self.model = model
+        self.start = start
+        self.stop = stop
+        self.arrivals = arrivals
+        self.departures = departures
+
+    def late(self, index):
+        return self.start <= index < self.stop
+
+    def expected(self, index):
+        # -> (ожидаемое время, отклонение от расписания, True - отправление):
+        # на станции, где получена задержка, - отправление, дальше - прибытие
+        model = self.model
+        if index == self.start and index < len(model) - 1:
+            return self.departures[index], self.departures[index] - model.departures[index], True
+        return self.arrivals[index], self.arrivals[index] - model.arrivals[index], False
+
+
+def predict(model, station_id, delay, min_dwell=MIN_DWELL_MINUTES):
+    # Задержка delay минут на станции station_id снимка маршрута
+    # (repository.RouteModel) -> Prediction или None, если станции уже нет
+    # в маршруте или поезд идёт по расписанию. Прибытие = ожидаемое
+    # отправление предыдущей станции + время в пути; на стоянке поезд
+    # нагоняет опоздание до min_dwell минут, но не уходит раньше расписания
+    index = model.index_of(station_id)
+    if index is None or not delay:
+        return None
+    planned_departures = model.departures
+    planned_arrivals = model.arrivals
+    travels = model.travels
+    dwells = model.dwells
+    departures = planned_departures[:]
+    arrivals = planned_arrivals[:]
+    last = len(model) - 1
+    if index == last:
+        arrivals[index] += delay
+        return Prediction(model, index, index + 1, arrivals, departures)
+    departures[index] += delay
+    i = index + 1
+    while i <= last:
+        arrival = departures[i - 1] + travels[i - 1]
+        if arrival == planned_arrivals[i]:
+            # Опоздание погашено - дальше всё по расписанию
+            break
+        arrivals[i] = arrival
+        if i < last:
+            departures[i] = max(planned_departures[i], arrival + min(dwells[i], min_dwell))
+        i += 1
+    return Prediction(model, index, i, arrivals, departures)
+
+
+class DelayOverlay:
+    # Последняя задержка каждого маршрута: id маршрута -> (id станции, минуты)
+    def __init__(self):
+        self.delays = {}
+
+    def __len__(self):
+        return len(self.delays)
+
+    def get(self, route_id):
+        return self.delays.get(route_id)
+
+    def update(self, delays):
+        self.delays.update(delays)
+
+    def predict(self, model):
+        # Ожидаемое время снимка маршрута или None
+        entry = self.delays.get(model.route_id) if model is not None else None
+        if entry is None:
+            return None
+        return predict(model, *entry)
+
+
+class DelayFeed:
+    # Задержки, записанные потоком событий после прошлого опроса.
+    # seq растёт с каждой пачкой записи, поэтому первый опрос читает все
+    # задержки, а следующие - только новые пачки
+    def __init__(self, conn):
+        self.conn = conn
+        self.data_version = None
+        self.seq = 0
+
+    def poll(self):
+        # -> {id маршрута: (id станции, минуты)} или None
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            return None
+        self.data_version = version
+        rows = self.conn.execute("""
+            SELECT route_id, station_id, delay_minutes, seq
+            FROM delays
+            WHERE seq > ?
+            ORDER BY seq
+        """, (self.seq,)).fetchall()
+        if not rows:
+            return None
+        self.seq = rows[-1][3]
+        return {route_id: (station_id, delay) for route_id, station_id, delay, _ in rows}
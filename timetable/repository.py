@@ -0,0 +1,363 @@
+from array import array
+from collections import OrderedDict
+
+from .cascade import store_times
+from .ordering import key_between, rebalance as rebalance_keys, spread_keys
+from .policies import get_policy
+
+# Кэш маршрутов между окном приложения и SQLite. Загруженный маршрут
+# хранится в компактных массивах вместе с заранее посчитанными временами
+# прибытия и стоянки, поэтому выбор станции не требует запросов к базе.
+# Записи идут через репозиторий: он меняет базу и тут же правит кэш.
+# Если на маршруте записывается RoutePatch, модель отмечает в нём, какие
+# строки изменились, чтобы окно поправило только их в своём снимке.
+
+
+class RouteModel:
+    __slots__ = ('route_id', 'pattern_id', 'ids', 'orders', 'cities', 'departures',
+                 'travels', 'arrivals', 'dwells', 'positions', 'patch')
+
+    def __init__(self, route_id, rows, pattern_id=None):
+        # rows: (id, order_index, city, departure_time, travel_time) по order_index;
+        # pattern_id - шаблон, если маршрут - рейс по шаблону (patterns.py)
+        self.route_id = route_id
+        self.pattern_id = pattern_id
+        self.ids = array('q', (row[0] for row in rows))
+        self.orders = array('q', (row[1] for row in rows))
+        self.cities = [row[2] for row in rows]
+        self.departures = array('q', (row[3] for row in rows))
+        self.travels = array('q', (row[4] or 0 for row in rows))
+        self.arrivals = array('q', bytes(8 * len(rows)))
+        self.dwells = array('q', bytes(8 * len(rows)))
+        self.positions = None
+        self.patch = None
+        self.recompute(0)
+
+    @classmethod
+    def from_columns(cls, route_id, ids, cities, departures, travels, pattern_id=None):
+        # Модель из готовых столбцов (snapshot.py) без построчных кортежей;
+        # ключи порядка не нужны, маршрут только для чтения
+        model = cls.__new__(cls)
+        model.route_id = route_id
+        model.pattern_id = pattern_id
+        model.ids = ids
+        model.orders = array('q', bytes(8 * len(ids)))
+        model.cities = cities
+        model.departures = departures
+        model.travels = travels
+        model.arrivals = array('q', bytes(8 * len(ids)))
+        model.dwells = array('q', bytes(8 * len(ids)))
+        model.positions = None
+        model.patch = None
+        model.recompute(0)
+        return model
+
+    def __len__(self):
+        return len(self.ids)
+
+    def station(self, index):
+        # (id, city, departure, travel, order_index, arrival, dwell)
+        return (self.ids[index], self.cities[index], self.departures[index],
+                self.travels[index], self.orders[index],
+                self.arrivals[index], self.dwells[index])
+
+    def index_of(self, station_id):
+        if self.positions is None:
+            self.positions = {sid: i for i, sid in enumerate(self.ids)}
+        return self.positions.get(station_id)
+
+    def copy(self):
+        # Снимок маршрута для другого потока: массивы копируются срезом
+        model = RouteModel.__new__(RouteModel)
+        model.route_id = self.route_id
+        model.pattern_id = self.pattern_id
+        model.ids = self.ids[:]
+        model.orders = self.orders[:]
+        model.cities = self.cities[:]
+        model.departures = self.departures[:]
+        model.travels = self.travels[:]
+        model.arrivals = self.arrivals[:]
+        model.dwells = self.dwells[:]
+        model.positions = None
+        model.patch = None
+        return model
+
+    def last_order(self):
+        return self.orders[-1] if self.ids else 0
+
+    def order_between(self, index):
+        # Ключ порядка для станции, вставляемой перед index, или None
+        before = self.orders[index - 1] if index > 0 else None
+        after = self.orders[index] if index < len(self.orders) else None
+        return key_between(before, after)
+
+    def insert(self, index, station_id, order_index, city, departure, travel):
+        self.ids.insert(index, station_id)
+        self.orders.insert(index, order_index)
+        self.cities.insert(index, city)
+        self.departures.insert(index, departure)
+        self.travels.insert(index, travel or 0)
+        self.arrivals.insert(index, 0)
+        self.dwells.insert(index, 0)
+        self.positions = None
+        if self.patch is not None:
+            self.patch.insert(index)
+        self.recompute(index, index + 2)
+
+    def remove(self, index):
+        for column in (self.ids, self.orders, self.cities, self.departures,
+                       self.travels, self.arrivals, self.dwells):
+            del column[index]
+        self.positions = None
+        if self.patch is not None:
+            self.patch.remove(index)
+        self.recompute(index, index + 1)
+
+    def set_station(self, index, station):
+        # station - кортеж как у station(); для применения RoutePatch
+        (self.ids[index], self.cities[index], self.departures[index], self.travels[index],
+         self.orders[index], self.arrivals[index], self.dwells[index]) = station
+        self.positions = None
+
+    def recompute(self, start, stop=None):
+        # Прибытие = отправление предыдущей станции + время в пути,
+        # для первой станции прибытие совпадает с отправлением
+        departures = self.departures
+        travels = self.travels
+        arrivals = self.arrivals
+        dwells = self.dwells
+        if stop is None or stop > len(departures):
+            stop = len(departures)
+        for i in range(max(start, 0), stop):
+            if i == 0:
+                arrivals[0] = departures[0]
+                dwells[0] = 0
+            else:
+                arrival = departures[i - 1] + travels[i - 1]
+                arrivals[i] = arrival
+                dwells[i] = max(departures[i] - arrival, 0)
+        if self.patch is not None:
+            # Прибытие и стоянка пересчитываются для каждой изменённой строки
+            self.patch.touch(start, stop)
+
+    def shift(self, start, base):
+        # Отправление станции k = base + сумма времени в пути от start до k-1,
+        # как в cascade.shift_departures
+        current_time = base
+        departures = self.departures
+        travels = self.travels
+        for i in range(start, len(departures)):
+            departures[i] = current_time
+            current_time += travels[i]
+        self.recompute(start)
+
+    def absorb(self, start):
+        # Как cascade.absorb_delay: задержка идёт дальше, пока прибытие
+        # позже отправления; -> индекс станции, где она поглотилась
+        departures = self.departures
+        travels = self.travels
+        i = start + 1
+        while i < len(departures):
+            arrival = departures[i - 1] + travels[i - 1]
+            if arrival <= departures[i]:
+                break
+            departures[i] = arrival
+            i += 1
+        self.recompute(start + 1, i + 1)
+        return i
+
+
+class RoutePatch:
+    # Изменения кэша маршрута за одну запись (Schedule.edit): вставленные
+    # и удалённые позиции по порядку и строки [start, stop), которые после
+    # записи отличаются от прежних. Окно применяет его к своему снимку
+    # маршрута и перерисовывает только эти строки списка
+    def __init__(self, route_id):
+        self.route_id = route_id
+        self.structure = []     # (позиция, 1 - вставка / -1 - удаление)
+        self.start = None
+        self.stop = None
+        self.rows = []
+        self.length = None
+        self.full = False       # кэш маршрута перечитан - снимок нужно заменить
+
+    def touch(self, start, stop):
+        start = max(start, 0)
+        if start >= stop:
+            return
+        if self.start is None:
+            self.start, self.stop = start, stop
+        else:
+            self.start = min(self.start, start)
+            self.stop = max(self.stop, stop)
+
+    def insert(self, index):
+        self.structure.append((index, 1))
+        if self.start is not None:
+            if self.start >= index:
+                self.start += 1
+            if self.stop > index:
+                self.stop += 1
+
+    def remove(self, index):
+        self.structure.append((index, -1))
+        if self.start is not None:
+            if self.start > index:
+                self.start -= 1
+            if self.stop > index:
+                self.stop -= 1
+            if self.start >= self.stop:
+                self.start = self.stop = None
+
+    def finish(self, model):
+        # Значения изменённых строк после записи
+        self.length = len(model)
+        if self.start is not None:
+            self.stop = min(self.stop, len(model))
+            self.rows = [model.station(i) for i in range(self.start, self.stop)]
+
+    def apply(self, model):
+        # Правит снимок маршрута (RouteModel.copy); -> False, если снимок
+        # не совпал с кэшем и маршрут нужно перечитать целиком
+        if self.full or model.route_id != self.route_id:
+            return False
+        for index, delta in self.structure:
+            if index > len(model) or (delta < 0 and index == len(model)):
+                return False
+            if delta > 0:
+                model.insert(index, 0, 0, '', 0, 0)
+            else:
+                model.remove(index)
+        if len(model) != self.length:
+            return False
+        for offset, station in enumerate(self.rows):
+            model.set_station(self.start + offset, station)
+        return True
+
+
+def preview_update(policy, model, index, departure, travel):
+    # Правка станции index, как в Schedule.update_station, но на копии
+    # снимка маршрута и без базы: -> (копия, RoutePatch с изменёнными
+    # строками или None, если правка ничего не меняет)
+    preview = model.copy()
+    departure, travel = policy.normalize_update(preview, index, departure, travel)
+    if departure == model.departures[index] and travel == model.travels[index]:
+        return preview, None
+    patch = preview.patch = RoutePatch(model.route_id)
+    preview.departures[index] = departure
+    preview.travels[index] = travel
+    preview.recompute(index, index + 2)
+    if index < len(preview) - 1:
+        policy.recalculate_model(preview, index)
+    preview.patch = None
+    return preview, patch
+
+
+class RouteRepository:
+    def __init__(self, conn, policy=None, capacity=32):
+        # policy - правила пересчёта (policies.py), по умолчанию как в Appl1
+        self.conn = conn
+        self.policy = get_policy(policy)
+        self.capacity = capacity
+        self.routes = OrderedDict()
+
+    def get(self, route_id):
+        model = self.routes.get(route_id)
+        if model is not None:
+            self.routes.move_to_end(route_id)
+            return model
+        # У рейса по шаблону станции шаблона, сдвинутые на начало рейса
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id, order_index, city, departure_time, travel_time, pattern_id
+            FROM route_stations
+            WHERE route_id=?
+            ORDER BY order_index
+        """, (route_id,))
+        rows = cursor.fetchall()
+        if rows:
+            pattern_id = rows[0][5]
+        else:
+            # Пустой маршрут или рейс по шаблону без станций
+            row = cursor.execute("SELECT pattern_id FROM routes WHERE id=?", (route_id,)).fetchone()
+            pattern_id = row[0] if row else None
+        model = RouteModel(route_id, rows, pattern_id)
+        self.routes[route_id] = model
+        # Вытесняем маршрут, который дольше всех не использовался
+        while len(self.routes) > self.capacity:
+            self.routes.popitem(last=False)
+        return model
+
+    def cached(self, route_id):
+        # Маршрут из кэша без обращения к базе или None
+        return self.routes.get(route_id)
+
+    def forget(self, route_id):
+        self.routes.pop(route_id, None)
+
+    def clear(self):
+        self.routes.clear()
+
+    def append_station(self, route_id, city, departure, travel):
+        return self.insert_station(route_id, len(self.get(route_id)), city, departure, travel)
+
+    def insert_station(self, route_id, index, city, departure, travel):
+        # Станция встаёт перед index (index == len - в конец). Ключ порядка
+        # берётся между соседями, остальные строки маршрута не меняются
+        model = self.get(route_id)
+        order_index = model.order_between(index)
+        if order_index is None:
+            self.rebalance(route_id)
+            order_index = model.order_between(index)
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO stations (route_id, order_index, city, departure_time, travel_time)
+            VALUES (?, ?, ?, ?, ?)
+        """, (route_id, order_index, city, departure, travel))
+        model.insert(index, cursor.lastrowid, order_index, city, departure, travel)
+        self.store_times(model, index)
+        return index
+
+    def rebalance(self, route_id):
+        # Между соседними ключами не осталось места - раскладываем ключи заново
+        model = self.get(route_id)
+        rebalance_keys(self.conn, route_id)
+        model.orders = array('q', spread_keys(len(model)))
+        if model.patch is not None:
+            model.patch.touch(0, len(model))
+
+    def update_station(self, route_id, index, city, departure, travel):
+        model = self.get(route_id)
+        self.conn.execute("""
+            UPDATE stations
+            SET city=?, departure_time=?, travel_time=?
+            WHERE id=?
+        """, (city, departure, travel, model.ids[index]))
+        model.cities[index] = city
+        model.departures[index] = departure
+        model.travels[index] = travel or 0
+        # Меняются прибытие и стоянка только этой и следующей станции
+        model.recompute(index, index + 2)
+        self.store_times(model, index)
+
+    def delete_station(self, route_id, index):
+        model = self.get(route_id)
+        self.conn.execute("DELETE FROM stations WHERE id=?", (model.ids[index],))
+        model.remove(index)
+        self.store_times(model, index)
+
+    def recalculate(self, route_id, index):
+        # Пересчёт отправления станций начиная с index: в базе - одним
+        # запросом из cascade.py, в кэше - той же арифметикой в памяти
+        model = self.get(route_id)
+        if index >= len(model):
+            return
+        self.policy.recalculate(self.conn, model, index)
+        self.store_times(model, index)
+
+    def store_times(self, model, index):
+        # Хранимые прибытие и стоянка меняются начиная с предыдущей станции
+        # (её стоянка, если index - новая или удалённая последняя), а при
+        # изменении первой станции - смещения всего маршрута
+        start_order = model.orders[index - 1] if 0 < index <= len(model) else None
+        store_times(self.conn, model.route_id, start_order=start_order)
@@ -0,0 +1,327 @@
+from contextlib import contextmanager
+
+from .board import DepartureBoard
+from .changes import ChangeFeed, RouteChanges
+from .conflicts import ConflictDetector
+from .database import connect, retry_on_busy, DEFAULT_PATH
+from .paging import route_pager
+from .patterns import trip_starts
+from .planner import JourneyPlanner
+from .repository import RouteRepository, RoutePatch
+from .policies import get_policy
+from .prediction import DelayFeed
+from .search import RouteSearch
+from .timeutil import format_time
+
+# Расписание без интерфейса: маршруты, станции и пересчёт времени.
+# Каждая операция записи выполняется в одной транзакции и фиксируется.
+# Если базу одновременно меняет другой экземпляр, запись повторяется,
+# а кэш изменённых им маршрутов сбрасывается по ленте изменений.
+#
+#   schedule = Schedule('trains.db', policy='adjustable')
+#   route_id = schedule.create_route("Москва - Тверь")
+#   schedule.add_station(route_id, "Москва", departure=parse_time("08:00"))
+
+
+class Schedule:
+    def __init__(self, path=DEFAULT_PATH, policy=None, conn=None, capacity=32):
+        self.conn = conn if conn is not None else connect(path)
+        self.policy = get_policy(policy)
+        self.routes = RouteRepository(self.conn, self.policy, capacity)
+        self.board = DepartureBoard(self.conn)
+        self.planner = JourneyPlanner(self.conn)
+        self.search = RouteSearch(self.conn)
+        self.conflicts = ConflictDetector(self.conn, self.policy)
+        self.feed = ChangeFeed(self.conn)
+        self.delay_feed = DelayFeed(self.conn)
+        self.pending_changes = RouteChanges()
+
+    def close(self):
+        self.conn.close()
+
+    def set_policy(self, policy):
+        # Другие правила пересчёта для следующих правок; уже записанное
+        # время не меняется. Снимки и конфликты перечитываются по новым правилам
+        self.policy = get_policy(policy)
+        self.routes.policy = self.policy
+        self.routes.clear()
+        self.conflicts.policy = self.policy
+        self.conflicts.clear()
+
+    # --- транзакции и изменения других экземпляров
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому ожидание
+        # занятой базы происходит здесь, а не посреди операции
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Пока ждали блокировку, другой экземпляр мог изменить маршруты
+            self.refresh_changes()
+            yield
+            # Свои записи журнала пропускаем: блокировка записи у нас,
+            # значит всё новое в change_log сделано этой транзакцией
+            self.feed.skip_to_end()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    @contextmanager
+    def writing(self, route_id):
+        # Транзакция записи; при ошибке кэш маршрута сбрасывается,
+        # потому что его массивы могли измениться до отката.
+        # Загруженные города табло правятся по разнице станций маршрута.
+        # Рейсы маршрута-шаблона меняются вместе с ним. Конфликты
+        # перепроверяются в городах маршрута до и после записи
+        trips = self.trips(route_id)
+        tracking = self.board.tracking()
+        if tracking:
+            before = self.board.entries(self.routes.get(route_id))
+        if self.conflicts.loaded():
+            self.conflicts.invalidate(self.routes.get(route_id).cities)
+        try:
+            with self.transaction():
+                yield
+        except BaseException:
+            self.routes.forget(route_id)
+            raise
+        self.planner.forget(route_id)
+        self.forget_trips(trips)
+        model = self.routes.cached(route_id)
+        if model is not None:
+            self.conflicts.invalidate(model.cities)
+        if tracking and trips:
+            self.board.clear()
+        elif tracking:
+            self.board.update(route_id, before, self.board.entries(self.routes.cached(route_id)))
+
+    def refresh_changes(self):
+        changes = self.feed.poll()
+        if changes is None:
+            return
+        if changes.full:
+            self.routes.clear()
+            self.planner.clear()
+        else:
+            for route_id in changes.affected_routes():
+                self.routes.forget(route_id)
+                self.planner.forget(route_id)
+            # Станции шаблона - это и станции его рейсов
+            for route_id, station_ids in list(changes.stations.items()):
+                trips = self.trips(route_id)
+                self.forget_trips(trips)
+                for trip_id in trips:
+                    changes.stations.setdefault(trip_id, set()).update(station_ids)
+        if changes.full or changes.stations:
+            # Какие города затронуты, по журналу не узнать - табло перечитается
+            self.board.clear()
+            self.conflicts.clear()
+        self.pending_changes.merge(changes)
+
+    def poll_changes(self):
+        # -> RouteChanges с изменениями других экземпляров или None
+        self.refresh_changes()
+        changes = self.pending_changes
+        if not changes:
+            return None
+        self.pending_changes = RouteChanges()
+        return changes
+
+    def poll_delays(self):
+        # -> {id маршрута: (id станции, минуты)} задержек поездов, которые
+        # поток событий (delays.py) записал после прошлого опроса, или None
+        return self.delay_feed.poll()
+
+    # --- маршруты
+
+    def list_routes(self):
+        return self.conn.execute("SELECT id, name FROM routes ORDER BY id").fetchall()
+
+    def route_pager(self, page_size=200):
+        return route_pager(self.conn, page_size)
+
+    def route_names(self, route_ids):
+        # id маршрута -> название для небольшого набора маршрутов
+        route_ids = tuple(route_ids)
+        return dict(self.conn.execute(
+            f"SELECT id, name FROM routes WHERE id IN ({','.join('?' * len(route_ids))})",
+            route_ids))
+
+    def search_routes(self, text, limit=100):
+        # -> [(id маршрута, подпись)] по началу слов названия и городов,
+        # с исправлением опечаток, если точных совпадений мало
+        return self.search.search(text, limit)
+
+    def find_route(self, name):
+        row = self.conn.execute("SELECT id FROM routes WHERE name=?", (name,)).fetchone()
+        return row[0] if row else None
+
+    @retry_on_busy()
+    def create_route(self, name):
+        # Повтор названия - sqlite3.IntegrityError (уникальный индекс)
+        with self.transaction():
+            cursor = self.conn.execute("INSERT INTO routes (name) VALUES (?)", (name,))
+        return cursor.lastrowid
+
+    # --- рейсы по шаблону
+
+    def trips(self, route_id):
+        # id рейсов маршрута-шаблона
+        return [row[0] for row in self.conn.execute(
+            "SELECT id FROM routes WHERE pattern_id=? ORDER BY start_time", (route_id,))]
+
+    def forget_trips(self, trip_ids):
+        for trip_id in trip_ids:
+            self.routes.forget(trip_id)
+            self.planner.forget(trip_id)
+
+    @retry_on_busy()
+    def generate_trips(self, route_id, first, last, every):
+        # Рейсы шаблона route_id с отправлением от first до last каждые every
+        # минут (patterns.parse_frequency) вместо прежних рейсов шаблона.
+        # Рейс в то же время, что и сам шаблон, не создаётся. -> число рейсов
+        old_trips = self.trips(route_id)
+        with self.transaction():
+            model = self.editable_route(route_id)
+            if len(model) < 2:
+                raise ValueError("В маршруте-шаблоне должно быть не меньше двух станций")
+            name = self.conn.execute("SELECT name FROM routes WHERE id=?", (route_id,)).fetchone()[0]
+            self.conn.execute("DELETE FROM routes WHERE pattern_id=?", (route_id,))
+            cursor = self.conn.executemany("""
+                INSERT OR IGNORE INTO routes (name, pattern_id, start_time) VALUES (?, ?, ?)
+            """, ((f"{name} {format_time(start)}", route_id, start)
+                  for start in trip_starts(first, last, every) if start != model.departures[0]))
+            count = cursor.rowcount
+        self.forget_trips(old_trips)
+        self.forget_trips(self.trips(route_id))
+        self.board.clear()
+        self.conflicts.invalidate(model.cities)
+        return count
+
+    @retry_on_busy()
+    def delete_route(self, route_id):
+        # Станции маршрута удаляются каскадно (ON DELETE CASCADE)
+        with self.writing(route_id):
+            self.conn.execute("DELETE FROM routes WHERE id=?", (route_id,))
+            self.routes.forget(route_id)
+
+    # --- табло отправлений
+
+    def departures(self, city, after, limit=10, until=None):
+        # -> [(время, название маршрута, id маршрута, id станции)] ближайших
+        # отправлений из города не раньше after (минуты)
+        found = self.board.next_departures(city, after, limit, until)
+        if not found:
+            return []
+        names = self.route_names({route_id for _, _, route_id in found})
+        return [(time, names.get(route_id), route_id, station_id)
+                for time, station_id, route_id in found]
+
+    # --- конфликты
+
+    def find_conflicts(self, limit=None):
+        # -> [(город, с, по, (маршрут, название, id станции), (то же))]:
+        # разные маршруты стоят в одном городе в одни и те же минуты
+        conflicts = self.conflicts.conflicts(limit)
+        if not conflicts:
+            return []
+        names = self.route_names({route_id for conflict in conflicts
+                                  for route_id, _ in conflict[3:]})
+        return [(city, start, end) + tuple((route_id, names.get(route_id), station_id)
+                                           for route_id, station_id in (first, second))
+                for city, start, end, first, second in conflicts]
+
+    # --- поездки с пересадками
+
+    def plan_journey(self, origin, destination, after, transfer=0):
+        # -> [(название маршрута, откуда, отправление, куда, прибытие)]
+        # с самым ранним прибытием или None, если доехать нельзя
+        legs = self.planner.earliest_arrival(origin, destination, after, transfer)
+        if not legs:
+            return legs
+        names = self.route_names({leg[0] for leg in legs})
+        return [(names.get(leg[0]),) + leg[1:] for leg in legs]
+
+    # --- станции
+
+    def route(self, route_id):
+        return self.routes.get(route_id)
+
+    def route_snapshot(self, route_id):
+        # Копия кэша маршрута, которую можно читать из потока окна,
+        # пока поток базы меняет сам кэш
+        return self.routes.get(route_id).copy()
+
+    def editable_route(self, route_id):
+        # Станции рейса по шаблону берутся из шаблона и правятся только в нём
+        model = self.routes.get(route_id)
+        if model.pattern_id is not None:
+            raise ValueError("Это рейс по шаблону: станции меняются в маршруте-шаблоне")
+        return model
+
+    def station(self, route_id, index):
+        # (id, city, departure, travel, order_index, arrival, dwell) по правилам политики
+        model = self.routes.get(route_id)
+        station = model.station(index)
+        arrival, dwell = self.policy.arrival_and_dwell(model, index)
+        return station[:5] + (arrival, dwell)
+
+    def add_station(self, route_id, city, departure=None, travel=None):
+        return self.insert_station(route_id, None, city, departure, travel)
+
+    @retry_on_busy()
+    def insert_station(self, route_id, index, city, departure=None, travel=None):
+        # Вставка перед станцией index (None - в конец маршрута): в базе
+        # добавляется одна строка плюс пересчёт отправления последующих станций
+        with self.writing(route_id):
+            model = self.editable_route(route_id)
+            if index is None or index >= len(model):
+                index = len(model)
+            departure, travel = self.policy.new_station(model, departure, travel, index)
+            self.routes.insert_station(route_id, index, city, departure, travel)
+            if index < len(model) - 1 or self.policy.recalculate_after_add():
+                self.routes.recalculate(route_id, index)
+        return index
+
+    @retry_on_busy()
+    def update_station(self, route_id, index, city, departure, travel):
+        with self.writing(route_id):
+            model = self.editable_route(route_id)
+            departure, travel = self.policy.normalize_update(model, index, departure, travel)
+            self.routes.update_station(route_id, index, city, departure, travel)
+            # Пересчитываем время для последующих станций
+            if index < len(model) - 1:
+                self.routes.recalculate(route_id, index)
+
+    @retry_on_busy()
+    def delete_station(self, route_id, index):
+        with self.writing(route_id):
+            model = self.editable_route(route_id)
+            self.routes.delete_station(route_id, index)
+            # Пересчитываем время отправления для последующих станций
+            if index < len(model):
+                self.routes.recalculate(route_id, index)
+
+    @retry_on_busy()
+    def recalculate(self, route_id, index):
+        with self.writing(route_id):
+            self.editable_route(route_id)
+            self.routes.recalculate(route_id, index)
+
+    def edit(self, write, route_id, *args):
+        # Запись станций маршрута (insert_station, update_station,
+        # delete_station, recalculate) -> RoutePatch с изменёнными строками,
+        # по которому окно правит свой снимок маршрута вместо перечитывания
+        model = self.routes.get(route_id)
+        patch = model.patch = RoutePatch(route_id)
+        try:
+            write(self, route_id, *args)
+        finally:
+            model.patch = None
+        # Запись повторялась или маршрут изменил другой экземпляр -
+        # кэш перечитан, и по записанным строкам снимок не поправить
+        if self.routes.cached(route_id) is not model:
+            patch.full = True
+        patch.finish(model)
+        return patch
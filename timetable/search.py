@@ -0,0 +1,132 @@
+import re
+
+# Поиск маршрутов по названию и по городам, через которые они проходят.
+# Индексы FTS5 routes_search и cities_search создаёт миграция
+# add_search_index; города проиндексированы по одному разу (таблица
+# cities), а маршруты города находятся по индексу stations(city, ...).
+#
+# Сначала ищутся слова, начинающиеся со слов запроса. Если совпадений
+# мало, слова с опечатками заменяются близкими словами из словарей
+# индексов (routes_vocab, cities_vocab) и поиск повторяется.
+
+# Сколько подходящих городов разворачивать в маршруты
+CITY_LIMIT = 20
+# Сколько близких слов словаря подставлять вместо одного слова запроса
+FUZZY_TERMS = 10
+# Слова короче не исправляются
+FUZZY_MIN_LENGTH = 3
+
+WORD_RE = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD_RE.findall(text.lower())
+
+
+def prefix_query(terms):
+    # Все слова запроса, каждое - по началу слова: '"моск"* AND "пет"*'
+    return ' AND '.join(f'"{term}"*' for term in terms)
+
+
+def max_typos(term):
+    return 1 if len(term) <= 5 else 2
+
+
+def distance(a, b, limit):
+    # Расстояние Дамерау-Левенштейна (с перестановкой соседних букв);
+    # как только оно точно больше limit, возвращается limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class RouteSearch:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def search(self, text, limit=50):
+        # -> [(id маршрута, подпись)] не больше limit
+        terms = words(text)
+        if not terms:
+            return []
+        found = {}
+        self.add_matches(found, prefix_query(terms), limit)
+        if len(found) < limit:
+            query = self.fuzzy_query(terms)
+            if query is not None:
+                self.add_matches(found, query, limit)
+        return list(found.items())
+
+    def add_matches(self, found, query, limit):
+        for route_id, name in self.conn.execute("""
+            SELECT r.id, r.name
+            FROM routes_search JOIN routes r ON r.id = routes_search.rowid
+            WHERE routes_search MATCH ?
+            LIMIT ?
+        """, (query, limit)):
+            found.setdefault(route_id, name)
+        if len(found) >= limit:
+            return
+        cities = [row[0] for row in self.conn.execute("""
+            SELECT c.name
+            FROM cities_search JOIN cities c ON c.id = cities_search.rowid
+            WHERE cities_search MATCH ?
+            LIMIT ?
+        """, (query, CITY_LIMIT))]
+        for city in cities:
+            for route_id, name in self.conn.execute("""
+                SELECT r.id, r.name
+                FROM routes r
+                WHERE r.id IN (SELECT route_id FROM stations WHERE city=?)
+                LIMIT ?
+            """, (city, limit)):
+                found.setdefault(route_id, f"{name} ({city})")
+                if len(found) >= limit:
+                    return
+
+    def fuzzy_query(self, terms):
+        # Запрос, в котором слова с близкими словами словаря заменены на
+        # '("слово"* OR "близкое" OR ...)'; None - заменять нечего
+        groups = []
+        changed = False
+        for term in terms:
+            close = self.close_terms(term)
+            if close:
+                changed = True
+                groups.append('(' + ' OR '.join([f'"{term}"*'] + [f'"{word}"' for word in close]) + ')')
+            else:
+                groups.append(f'"{term}"*')
+        return ' AND '.join(groups) if changed else None
+
+    def close_terms(self, term):
+        # Слова словарей на ту же букву, которые (или их начало) отличаются
+        # от term не больше чем на max_typos правок
+        if len(term) < FUZZY_MIN_LENGTH or term.isdigit():
+            return []
+        limit = max_typos(term)
+        start = term[0]
+        end = chr(ord(start) + 1)
+        scored = {}
+        for vocab in ('routes_vocab', 'cities_vocab'):
+            for word, documents in self.conn.execute(
+                    f"SELECT term, doc FROM {vocab} WHERE term >= ? AND term < ?", (start, end)):
+                if word.startswith(term) or len(word) < len(term) - limit:
+                    continue
+                typos = min(distance(term, word[:len(term)], limit), distance(term, word, limit))
+                if typos <= limit:
+                    score = (typos, -documents)
+                    if word not in scored or score < scored[word]:
+                        scored[word] = score
+        return sorted(scored, key=scored.get)[:FUZZY_TERMS]
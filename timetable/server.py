@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .board import DepartureBoard
+from .database import connect_readonly, DEFAULT_PATH
+from .policies import get_policy, POLICIES
+from .prediction import predict
+from .repository import RouteModel
+from .timeutil import format_time, parse_time
+
+# Локальный HTTP-сервис расписания только для чтения (asyncio, без
+# сторонних библиотек). Запросы к базе выполняет пул потоков, у каждого
+# потока своё соединение только для чтения (mode=ro: сервис не меняет
+# файл базы и не выполняет миграции). Готовые ответы хранятся в
+# LRU-кэше с ETag и сбрасываются, когда меняется PRAGMA data_version,
+# то есть когда приложение или другой процесс зафиксировал запись.
+#
+#   python -m timetable.server --db trains.db --port 8080
+#
+#   GET /routes?offset=0&limit=100     список маршрутов
+#   GET /routes/<id>?policy=adjustable станции с прибытием и стоянкой,
+#                                      при задержке - с ожидаемым временем
+#   GET /board?city=Тверь&after=08:00&limit=10   ближайшие отправления
+
+DEFAULT_PORT = 8080
+# Соединений (потоков) для запросов к базе
+DEFAULT_WORKERS = 4
+# Сколько ответов держать в кэше
+DEFAULT_CACHE_SIZE = 4096
+MAX_LIMIT = 1000
+# Заголовки запроса больше этого размера не принимаются
+MAX_HEADER_BYTES = 16384
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 431: 'Request Header Fields Too Large',
+           500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or REASONS[status])
+        self.status = status
+
+
+def int_param(params, name, default, low=0, high=None):
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise HttpError(400, f"{name}: нужно целое число")
+    if value < low or (high is not None and value > high):
+        raise HttpError(400, f"{name}: значение вне диапазона")
+    return value
+
+
+class TimetableReader:
+    # Запросы одного потока пула: своё соединение и свои города табло
+    def __init__(self, path):
+        self.conn = connect_readonly(path)
+        self.board = DepartureBoard(self.conn)
+        self.version = None
+
+    def sync(self, version):
+        # Города табло загружены до записи в базу - перечитываем
+        if version != self.version:
+            self.board.clear()
+            self.version = version
+
+    def routes(self, offset, limit):
+        total = self.conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+        rows = self.conn.execute(
+            "SELECT id, name FROM routes ORDER BY id LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        return {'total': total, 'offset': offset,
+                'routes': [{'id': route_id, 'name': name} for route_id, name in rows]}
+
+    def route(self, route_id, policy):
+        row = self.conn.execute("SELECT name, pattern_id FROM routes WHERE id=?", (route_id,)).fetchone()
+        if row is None:
+            raise HttpError(404, "Маршрут не найден")
+        # Прибытие и стоянка хранятся в строках станций (cascade.store_times)
+        rows = self.conn.execute("""
+            SELECT id, order_index, city, departure_time, travel_time, arrival_time, dwell_minutes
+            FROM route_stations
+            WHERE route_id=?
+            ORDER BY order_index
+        """, (route_id,)).fetchall()
+        # Поезд с задержкой: ожидаемое время опаздывающих станций (prediction.py)
+        delay = self.conn.execute(
+            "SELECT station_id, delay_minutes FROM delays WHERE route_id=?", (route_id,)).fetchone()
+        prediction = predict(RouteModel(route_id, rows), *delay) if delay and rows else None
+        stations = []
+        for i, (station_id, _, city, departure, travel, arrival, dwell) in enumerate(rows):
+            arrival, dwell = policy.stored_arrival_and_dwell(departure, arrival, dwell)
+            station = {
+                'id': station_id,
+                'city': city,
+                'departure': format_time(departure),
+                'travel': travel or 0,
+                'arrival': format_time(arrival),
+                'dwell': dwell,
+            }
+            if prediction is not None and prediction.late(i):
+                expected, late, departure = prediction.expected(i)
+                station['expected_departure' if departure else 'expected_arrival'] = format_time(expected)
+                station['delay'] = late
+            stations.append(station)
+        return {'id': route_id, 'name': row[0], 'pattern_id': row[1], 'stations': stations}
+
+    def departures(self, city, after, limit):
+        found = self.board.next_departures(city, after, limit)
+        route_ids = tuple({route_id for _, _, route_id in found})
+        names = dict(self.conn.execute(
+            f"SELECT id, name FROM routes WHERE id IN ({','.join('?' * len(route_ids))})",
+            route_ids)) if route_ids else {}
+        return {'city': city, 'after': format_time(after),
+                'departures': [{'time': format_time(time), 'route_id': route_id,
+                                'route': names.get(route_id), 'station_id': station_id}
+                               for time, station_id, route_id in found]}
+
+
+class TimetableServer:
+    def __init__(self, path=DEFAULT_PATH, policy='full', workers=DEFAULT_WORKERS,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.policy = get_policy(policy)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()      # путь с параметрами -> (ETag, тело)
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='timetable-http')
+        # Соединение потока событий только следит за data_version.
+        # Базу со старой схемой сервис не открывает (connect_readonly)
+        self.watch = connect_readonly(path)
+        self.version = self.data_version()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.watch.close()
+
+    def data_version(self):
+        return self.watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def reader(self):
+        reader = getattr(self.local, 'reader', None)
+        if reader is None:
+            reader = self.local.reader = TimetableReader(self.path)
+        return reader
+
+    # --- ответы
+
+    def dispatch(self, path, params, version):
+        # Выполняется в потоке пула
+        reader = self.reader()
+        reader.sync(version)
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts == ['routes']:
+            return reader.routes(int_param(params, 'offset', 0),
+                                 int_param(params, 'limit', 100, 1, MAX_LIMIT))
+        if len(parts) == 2 and parts[0] == 'routes':
+            try:
+                route_id = int(parts[1])
+            except ValueError:
+                raise HttpError(404)
+            policy = self.policy
+            if 'policy' in params:
+                name = params['policy'][0]
+                if name not in POLICIES:
+                    raise HttpError(400, f"policy: одно из {', '.join(POLICIES)}")
+                policy = get_policy(name)
+            return reader.route(route_id, policy)
+        if parts == ['board']:
+            city = params.get('city', [''])[0].strip()
+            if not city:
+                raise HttpError(400, "city: нужен город")
+            try:
+                after = parse_time(params.get('after', ['00:00'])[0])
+            except ValueError as error:
+                raise HttpError(400, f"after: {error}")
+            return reader.departures(city, after, int_param(params, 'limit', 10, 1, MAX_LIMIT))
+        raise HttpError(404)
+
+    def render(self, path, params, version):
+        body = json.dumps(self.dispatch(path, params, version), ensure_ascii=False).encode('utf-8')
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        return etag, body
+
+    async def response(self, target):
+        # -> (ETag, тело); из кэша, если база не менялась
+        version = self.data_version()
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+        cached = self.cache.get(target)
+        if cached is not None:
+            self.cache.move_to_end(target)
+            return cached
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.executor, self.render, url.path, params, version)
+        # Пока шёл запрос, база могла измениться - такой ответ не кэшируем
+        if version == self.version:
+            self.cache[target] = result
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    # --- HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 431, b'', close=True)
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self.send(writer, 400, b'', close=True)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                close = (headers.get('connection', '').lower() == 'close'
+                         or (version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive'))
+                if method not in ('GET', 'HEAD'):
+                    await self.send(writer, 405, b'', close=True, extra='Allow: GET, HEAD\r\n')
+                    return
+                try:
+                    etag, body = await self.response(target)
+                except HttpError as error:
+                    message = json.dumps({'error': str(error)}, ensure_ascii=False).encode('utf-8')
+                    await self.send(writer, error.status, message, close)
+                except Exception as error:
+                    message = json.dumps({'error': str(error)}, ensure_ascii=False).encode('utf-8')
+                    await self.send(writer, 500, message, close)
+                else:
+                    if headers.get('if-none-match') == etag:
+                        await self.send(writer, 304, b'', close, etag=etag)
+                    else:
+                        await self.send(writer, 200, body, close, etag=etag, head=method == 'HEAD')
+                if close:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, body, close=False, etag=None, head=False, extra=''):
+        header = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                  f"Content-Length: {len(body)}\r\n"
+                  f"{extra}")
+        if body:
+            header += "Content-Type: application/json; charset=utf-8\r\n"
+        if etag is not None:
+            header += f"ETag: {etag}\r\nCache-Control: no-cache\r\n"
+        if close:
+            header += "Connection: close\r\n"
+        writer.write(header.encode('latin-1') + b'\r\n' + (b'' if head else body))
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m timetable.server',
+                                     description="HTTP-сервис расписания только для чтения")
+    parser.add_argument('--db', default=DEFAULT_PATH, help="файл базы (по умолчанию trains.db)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='full',
+                        help="правила прибытия и стоянки по умолчанию")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--cache', type=int, default=DEFAULT_CACHE_SIZE, help="ответов в кэше")
+    args = parser.parse_args(argv)
+
+    try:
+        server = TimetableServer(args.db, args.policy, args.workers, args.cache)
+    except (ValueError, sqlite3.Error) as error:
+        parser.exit(1, f"{error}\n")
+    print(f"http://{args.host}:{args.port}/routes")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from .database import connect
+from .repository import RouteModel
+
+# Снимок расписания только для чтения: trains.db компилируется в один файл
+# со столбцами целых чисел, который открывается через mmap без SQLite.
+# Страницы файла читаются по мере обращения и общие для всех процессов,
+# открывших тот же снимок (киоски, табло).
+#
+#   python -m timetable.snapshot export trains.db trains.snap
+#   python -m timetable.snapshot info trains.snap
+#   python viewer.py trains.snap
+#
+# Файл: заголовок, затем секции, выровненные по 8 байт (little-endian):
+#   route_ids        int64[R]    id маршрутов по возрастанию
+#   route_starts     int64[R+1]  первая станция маршрута в столбцах станций
+#   name_offsets     int64[R+1]  названия маршрутов в name_data (UTF-8)
+#   station_ids      int64[S]
+#   departures       int64[S]    минуты, как в базе
+#   travels          int64[S]
+#   station_cities   int32[S]    номер города в таблице городов
+#   city_offsets     int64[C+1]  названия городов в city_data (UTF-8)
+#   name_data, city_data
+# Рейсы по шаблону (patterns.py) записываются обычными маршрутами.
+
+MAGIC = b'TTSNAP\0\0'
+VERSION = 1
+SECTIONS = ('route_ids', 'route_starts', 'name_offsets', 'station_ids', 'departures',
+            'travels', 'station_cities', 'city_offsets', 'name_data', 'city_data')
+TYPECODES = {'station_cities': 'i', 'name_data': 'B', 'city_data': 'B'}
+# magic, версия, число секций, затем (смещение, длина в байтах) каждой секции
+HEADER = struct.Struct('<8sII' + 'QQ' * len(SECTIONS))
+
+
+def align(size):
+    return (size + 7) & ~7
+
+
+def copy_column(view, start, end):
+    # Срез столбца снимка в array одним копированием байтов
+    column = array(view.format)
+    column.frombytes(view[start:end].cast('B'))
+    return column
+
+
+def compile_snapshot(conn, path):
+    # -> (маршрутов, станций); файл пишется рядом и подменяется целиком,
+    # поэтому уже открытые снимки продолжают читать прежнюю версию
+    columns = {name: array(TYPECODES.get(name, 'q')) for name in SECTIONS}
+    name_data = bytearray()
+    city_data = bytearray()
+    cities = {}
+    columns['name_offsets'].append(0)
+    columns['city_offsets'].append(0)
+    for route_id, name in conn.execute("SELECT id, name FROM routes ORDER BY id"):
+        columns['route_ids'].append(route_id)
+        name_data += name.encode('utf-8')
+        columns['name_offsets'].append(len(name_data))
+    # Станции идут в том же порядке маршрутов, поэтому начало маршрута -
+    # сумма числа станций всех предыдущих
+    counts = {}
+    for route_id, station_id, city, departure, travel in conn.execute("""
+        SELECT route_id, id, city, departure_time, travel_time
+        FROM route_stations
+        ORDER BY route_id, order_index
+    """):
+        counts[route_id] = counts.get(route_id, 0) + 1
+        index = cities.get(city)
+        if index is None:
+            index = cities[city] = len(cities)
+            city_data.extend(city.encode('utf-8'))
+            columns['city_offsets'].append(len(city_data))
+        columns['station_ids'].append(station_id)
+        columns['departures'].append(departure)
+        columns['travels'].append(travel or 0)
+        columns['station_cities'].append(index)
+    start = 0
+    for route_id in columns['route_ids']:
+        columns['route_starts'].append(start)
+        start += counts.get(route_id, 0)
+    columns['route_starts'].append(start)
+    columns['name_data'] = array('B', name_data)
+    columns['city_data'] = array('B', city_data)
+
+    layout = []
+    offset = align(HEADER.size)
+    for name in SECTIONS:
+        column = columns[name]
+        if sys.byteorder != 'little':
+            column.byteswap()
+        size = len(column) * column.itemsize
+        layout.append((offset, size))
+        offset = align(offset + size)
+    temp = f"{path}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(SECTIONS),
+                            *[value for section in layout for value in section]))
+        for name, (offset, size) in zip(SECTIONS, layout):
+            f.seek(offset)
+            columns[name].tofile(f)
+    os.replace(temp, path)
+    return len(columns['route_ids']), len(columns['station_ids'])
+
+
+class Snapshot:
+    # Открытый снимок: столбцы - memoryview поверх mmap, данные не копируются.
+    # Перед close() нельзя держать ссылки на столбцы
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("Снимки читаются только на little-endian платформах")
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, version, count, *layout = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or count != len(SECTIONS):
+            self.close()
+            raise ValueError(f"{path}: это не снимок расписания версии {VERSION}")
+        for i, name in enumerate(SECTIONS):
+            offset, size = layout[2 * i], layout[2 * i + 1]
+            setattr(self, name, self.view[offset:offset + size].cast(TYPECODES.get(name, 'q')))
+        # Таблица городов небольшая - декодируется один раз, строки общие
+        # для всех станций города
+        offsets = self.city_offsets
+        data = self.city_data
+        self.cities = [bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8')
+                       for i in range(len(offsets) - 1)]
+
+    def close(self):
+        for name in SECTIONS:
+            column = self.__dict__.pop(name, None)
+            if column is not None:
+                column.release()
+        self.view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    def index_of(self, route_id):
+        index = bisect_left(self.route_ids, route_id)
+        if index < len(self.route_ids) and self.route_ids[index] == route_id:
+            return index
+        return None
+
+    def route_name(self, index):
+        return bytes(self.name_data[self.name_offsets[index]:self.name_offsets[index + 1]]).decode('utf-8')
+
+    def route(self, route_id):
+        # RouteModel маршрута: столбцы копируются срезом только для его станций
+        index = self.index_of(route_id)
+        if index is None:
+            raise KeyError(route_id)
+        start, end = self.route_starts[index], self.route_starts[index + 1]
+        cities = self.cities
+        return RouteModel.from_columns(
+            route_id,
+            copy_column(self.station_ids, start, end),
+            [cities[i] for i in self.station_cities[start:end]],
+            copy_column(self.departures, start, end),
+            copy_column(self.travels, start, end),
+        )
+
+
+class SnapshotRoutes:
+    # Источник строк виртуального списка (widgets.VirtualList) по снимку
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def count(self):
+        return len(self.snapshot)
+
+    def reset(self):
+        pass
+
+    def rows(self, offset, limit):
+        snapshot = self.snapshot
+        end = min(offset + limit, len(snapshot))
+        return [(snapshot.route_ids[i], snapshot.route_name(i)) for i in range(offset, end)]
+
+    def prefetch(self, offset, limit):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m timetable.snapshot',
+                                     description="Снимок расписания для просмотра без SQLite")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="скомпилировать базу в снимок")
+    export_parser.add_argument('database')
+    export_parser.add_argument('snapshot')
+    info_parser = commands.add_parser('info', help="сведения о снимке")
+    info_parser.add_argument('snapshot')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        conn = connect(args.database, readonly=True)
+        try:
+            routes, stations = compile_snapshot(conn, args.snapshot)
+        finally:
+            conn.close()
+        print(f"{args.snapshot}: {routes} маршрутов, {stations} станций, "
+              f"{os.path.getsize(args.snapshot)} байт")
+    else:
+        with Snapshot(args.snapshot) as snapshot:
+            print(f"{args.snapshot}: {len(snapshot)} маршрутов, {len(snapshot.station_ids)} станций, "
+                  f"{len(snapshot.cities)} городов")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Время в расписании хранится как целое число минут от начала суток
+# отправления маршрута (00:00 первого дня). Поезда, идущие через полночь,
+# получают значения >= 1440, поэтому порядок станций сохраняется.
+# Разбор и форматирование "ЧЧ:ММ" выполняются только на границе с UI.
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_time(time_str):
+    # "ЧЧ:ММ" или "ЧЧ:ММ+N" (N - смещение в сутках) -> минуты
+    if not isinstance(time_str, str):
+        raise ValueError(f"Неверный формат времени: {time_str!r}")
+    text = time_str.strip()
+    day = 0
+    plus = text.find('+')
+    if plus != -1:
+        day_part = text[plus + 1:]
+        if not day_part.isdigit():
+            raise ValueError(f"Неверный формат времени: {time_str!r}")
+        day = int(day_part)
+        text = text[:plus]
+    hours, sep, minutes = text.partition(':')
+    if (not sep or not hours.isdigit() or not minutes.isdigit()
+            or len(hours) > 2 or len(minutes) > 2):
+        raise ValueError(f"Неверный формат времени: {time_str!r}")
+    h = int(hours)
+    m = int(minutes)
+    if h > 23 or m > 59:
+        raise ValueError(f"Неверный формат времени: {time_str!r}")
+    return day * MINUTES_PER_DAY + h * 60 + m
+
+
+def format_time(minutes):
+    # минуты -> "ЧЧ:ММ", для следующих суток добавляется "+N"
+    day, rest = divmod(int(minutes), MINUTES_PER_DAY)
+    text = f"{rest // 60:02d}:{rest % 60:02d}"
+    if day > 0:
+        text += f"+{day}"
+    return text
+
+
+def is_valid_time(time_str):
+    try:
+        parse_time(time_str)
+        return True
+    except ValueError:
+        return False
+
+
+def align_after(minutes, reference):
+    # Переносит время суток на ближайшие сутки не раньше reference
+    if minutes >= reference:
+        return minutes
+    days = (reference - minutes + MINUTES_PER_DAY - 1) // MINUTES_PER_DAY
+    return minutes + days * MINUTES_PER_DAY
+
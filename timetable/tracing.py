@@ -0,0 +1,278 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Необязательная трассировка SQL. Соединение, открытое с tracer
+# (database.connect(..., tracer=...)), замеряет каждый execute и считает
+# выполненные SQLite операторы (set_trace_callback, включая триггеры).
+# Запросы приписываются действию окна, в котором они случились: действие
+# задаёт Tracer.action() в потоке окна, а задачи потока базы получают
+# действие, из которого были отправлены (widgets.TaskRunner).
+#
+# Профиль пишется в JSON и воспроизводится на копии базы:
+#   TIMETABLE_PROFILE=profile.json python Appl1.py
+#   python -m timetable.tracing summary profile.json
+#   python -m timetable.tracing replay profile.json trains.db
+
+PROFILE_ENV = 'TIMETABLE_PROFILE'
+PROFILE_VERSION = 1
+# Действие для запросов вне обработчиков окна (прокрутка списков и т.п.)
+NO_ACTION = '-'
+# Сколько запросов профиля хранить в памяти: дальше идут только счётчики.
+# Запросы пишутся с начала сеанса, чтобы повтор шёл с исходной базы
+MAX_EVENTS = 100000
+
+
+class Tracer:
+    def __init__(self, path=None):
+        self.path = path
+        self.started = time.perf_counter()
+        self.events = []
+        self.dropped = 0
+        self.actions = {}
+        # Последнее действие окна, в котором были запросы (строка состояния)
+        self.last = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    # --- действия
+
+    def current(self):
+        return getattr(self.local, 'action', None)
+
+    @contextmanager
+    def action(self, name, count=True):
+        # count=False - продолжение уже посчитанного действия (задача потока
+        # базы или обработка её результата в окне)
+        previous = self.current()
+        self.local.action = name
+        if count and previous is None:
+            with self.lock:
+                self.counters(name)['calls'] += 1
+        try:
+            yield
+        finally:
+            self.local.action = previous
+
+    def wrap(self, name, func, count=True):
+        def traced(*args, **kwargs):
+            with self.action(name, count):
+                return func(*args, **kwargs)
+        traced.__name__ = getattr(func, '__name__', name)
+        return traced
+
+    def instrument(self, obj, names):
+        # Обработчики окна заменяются обёртками до того, как на них
+        # сошлются кнопки и списки (вызывать до setup_ui)
+        for name in names:
+            setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+    def counters(self, name):
+        counters = self.actions.get(name)
+        if counters is None:
+            counters = self.actions[name] = {'calls': 0, 'queries': 0, 'statements': 0, 'ms': 0.0}
+        return counters
+
+    # --- запросы
+
+    def statement(self, sql):
+        # set_trace_callback: каждый оператор SQLite, в том числе в триггерах
+        self.local.statements = getattr(self.local, 'statements', 0) + 1
+
+    def record(self, sql, parameters, seconds, statements, many=False):
+        action = self.current() or NO_ACTION
+        event = {
+            't': round(time.perf_counter() - self.started, 6),
+            'thread': threading.current_thread().name,
+            'action': action,
+            'sql': ' '.join(sql.split()),
+            'params': None if many else parameters if isinstance(parameters, dict) else list(parameters),
+            'many': many,
+            'ms': round(seconds * 1000, 4),
+            'statements': statements,
+        }
+        with self.lock:
+            if len(self.events) < MAX_EVENTS:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+            if action != NO_ACTION:
+                self.last = action
+            counters = self.counters(action)
+            counters['queries'] += 1
+            counters['statements'] += statements
+            counters['ms'] += seconds * 1000
+
+    def totals(self):
+        with self.lock:
+            queries = sum(counters['queries'] for counters in self.actions.values())
+            ms = sum(counters['ms'] for counters in self.actions.values())
+        return queries, ms
+
+    def last_action(self):
+        # (имя, счётчики) последнего действия окна, в котором были запросы
+        with self.lock:
+            if self.last is None:
+                return None, None
+            return self.last, dict(self.actions[self.last])
+
+    # --- профиль
+
+    def profile(self):
+        return {
+            'version': PROFILE_VERSION,
+            'actions': self.actions,
+            'events': list(self.events),
+            'dropped': self.dropped,
+        }
+
+    def dump(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.profile(), f, ensure_ascii=False, indent=1)
+
+
+def tracer_from_env():
+    # Трассировка включается переменной окружения TIMETABLE_PROFILE=путь
+    path = os.environ.get(PROFILE_ENV)
+    return Tracer(path) if path else None
+
+
+class TracingCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return self.traced(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.traced(super().executemany, sql, seq_of_parameters, many=True)
+
+    def executescript(self, sql_script):
+        script = super().executescript
+        return self.traced(lambda sql, parameters: script(sql), sql_script, (), many=True)
+
+    def traced(self, method, sql, parameters, many=False):
+        tracer = self.connection.tracer
+        local = tracer.local
+        outer = getattr(local, 'statements', 0)
+        local.statements = 0
+        start = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            seconds = time.perf_counter() - start
+            statements = local.statements
+            local.statements = outer + statements
+            tracer.record(sql, parameters, seconds, statements, many)
+
+
+class TracingConnection(sqlite3.Connection):
+    tracer = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TracingCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        # Фиксация тоже попадает в профиль, чтобы повтор шёл теми же транзакциями
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.tracer.record("COMMIT", (), time.perf_counter() - start, 0)
+
+    def rollback(self):
+        start = time.perf_counter()
+        try:
+            super().rollback()
+        finally:
+            self.tracer.record("ROLLBACK", (), time.perf_counter() - start, 0)
+
+
+# --- разбор и воспроизведение профиля
+
+def load_profile(path):
+    with open(path, encoding='utf-8') as f:
+        profile = json.load(f)
+    if profile.get('version') != PROFILE_VERSION:
+        raise ValueError(f"Неизвестная версия профиля: {profile.get('version')}")
+    return profile
+
+
+def print_actions(actions, out=sys.stdout):
+    out.write(f"{'действие':<28} {'вызовов':>8} {'запросов':>9} {'операторов':>11} {'мс':>10}\n")
+    for name, counters in sorted(actions.items(), key=lambda item: -item[1]['ms']):
+        out.write(f"{str(name):<28} {counters['calls']:>8} {counters['queries']:>9} "
+                  f"{counters['statements']:>11} {counters['ms']:>10.2f}\n")
+
+
+def replay(profile, database, out=sys.stdout):
+    # Повторяет запросы профиля по порядку на копии базы и сравнивает время.
+    # База должна быть в состоянии на начало записи профиля (например,
+    # резервная копия trains.db). executemany пишется без параметров и пропускается
+    import shutil
+    import tempfile
+
+    actions = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, 'replay.db')
+        shutil.copy(database, copy)
+        conn = sqlite3.connect(copy, isolation_level=None)
+        conn.execute("PRAGMA foreign_keys=ON")
+        for event in profile['events']:
+            if event['many']:
+                continue
+            start = time.perf_counter()
+            try:
+                conn.execute(event['sql'], event['params']).fetchall()
+            except sqlite3.Error:
+                pass
+            seconds = time.perf_counter() - start
+            counters = actions.setdefault(event['action'], {'queries': 0, 'recorded': 0.0, 'replayed': 0.0})
+            counters['queries'] += 1
+            counters['recorded'] += event['ms']
+            counters['replayed'] += seconds * 1000
+        conn.close()
+    out.write(f"{'действие':<28} {'запросов':>9} {'записано, мс':>13} {'повтор, мс':>11}\n")
+    for name, counters in sorted(actions.items(), key=lambda item: -item[1]['recorded']):
+        out.write(f"{str(name):<28} {counters['queries']:>9} "
+                  f"{counters['recorded']:>13.2f} {counters['replayed']:>11.2f}\n")
+    return actions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m timetable.tracing',
+                                     description="Разбор и воспроизведение SQL-профиля")
+    commands = parser.add_subparsers(dest='command', required=True)
+    summary_parser = commands.add_parser('summary', help="запросы и время по действиям окна")
+    summary_parser.add_argument('profile')
+    replay_parser = commands.add_parser('replay', help="повторить запросы на копии базы")
+    replay_parser.add_argument('profile')
+    replay_parser.add_argument('database')
+    args = parser.parse_args(argv)
+
+    profile = load_profile(args.profile)
+    if args.command == 'summary':
+        print_actions(profile['actions'])
+        if profile.get('dropped'):
+            print(f"Запросов сверх {MAX_EVENTS} в профиле нет: {profile['dropped']}")
+    else:
+        replay(profile, args.database)
+
+
+if __name__ == '__main__':
+    main()
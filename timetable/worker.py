@@ -0,0 +1,54 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+# Единственный пишущий поток для работы с базой. Объект (обычно Schedule)
+# создаётся фабрикой внутри потока, потому что соединение sqlite3 привязано
+# к потоку, в котором открыто. Задачи выполняются по очереди, результат
+# возвращается через concurrent.futures.Future.
+#
+#   worker = DbWorker(lambda: Schedule('trains.db'))
+#   future = worker.submit(Schedule.create_route, "Москва - Тверь")
+
+
+class DbWorker(threading.Thread):
+    def __init__(self, factory, name='timetable-db'):
+        super().__init__(name=name, daemon=True)
+        self.factory = factory
+        self.requests = queue.Queue()
+        self.ready = Future()
+
+    def run(self):
+        try:
+            target = self.factory()
+        except BaseException as error:
+            self.ready.set_exception(error)
+            return
+        self.ready.set_result(target)
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                func, args, kwargs, future = request
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func(target, *args, **kwargs))
+                except BaseException as error:
+                    future.set_exception(error)
+        finally:
+            close = getattr(target, 'close', None)
+            if close is not None:
+                close()
+
+    def submit(self, func, *args, **kwargs):
+        # func(target, *args, **kwargs) выполнится в потоке базы
+        future = Future()
+        self.requests.put((func, args, kwargs, future))
+        return future
+
+    def stop(self, wait=True):
+        self.requests.put(None)
+        if wait and self.is_alive():
+            self.join()
@@ -0,0 +1,89 @@
+import sys
+import tkinter as tk
+from tkinter import messagebox
+from timetable import format_time
+from timetable.paging import StationRows
+from timetable.snapshot import Snapshot, SnapshotRoutes
+from widgets import VirtualList
+
+# Просмотр расписания без SQLite: окно открывает снимок, собранный
+# командой "python -m timetable.snapshot export trains.db trains.snap",
+# и читает его через mmap. Запуск: python viewer.py [trains.snap]
+
+DEFAULT_SNAPSHOT = 'trains.snap'
+
+
+class TimetableViewer:
+    def __init__(self, root, snapshot):
+        self.root = root
+        self.root.title("Расписание поездов (просмотр)")
+        self.root.geometry("800x600")
+        self.snapshot = snapshot
+        self.model = None
+        self.setup_ui()
+        self.route_list.set_source(SnapshotRoutes(snapshot))
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.snapshot.close()
+        self.root.destroy()
+
+    def setup_ui(self):
+        # Левая панель: Список маршрутов
+        self.left_frame = tk.Frame(self.root, width=200)
+        self.left_frame.pack(side=tk.LEFT, fill=tk.Y)
+        self.route_list = VirtualList(self.left_frame)
+        self.route_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.route_list.bind('<<ListboxSelect>>', self.on_route_select)
+
+        # Средняя панель: Список станций
+        self.middle_frame = tk.Frame(self.root)
+        self.middle_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.station_list = VirtualList(self.middle_frame)
+        self.station_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.station_list.bind('<<ListboxSelect>>', self.on_station_select)
+
+        # Правая панель: Сведения о станции
+        self.right_frame = tk.Frame(self.root, width=250)
+        self.right_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=5, pady=5)
+        self.labels = {}
+        for name, title in (('city', "Город:"), ('departure', "Время отправления:"),
+                            ('travel', "Время в пути до следующей:"),
+                            ('arrival', "Время прибытия:"), ('dwell', "Время стоянки:")):
+            tk.Label(self.right_frame, text=title).pack(anchor=tk.W)
+            self.labels[name] = tk.Label(self.right_frame, text="")
+            self.labels[name].pack(anchor=tk.W)
+
+    def on_route_select(self, event):
+        selected = self.route_list.curselection()
+        if not selected:
+            return
+        # Станции маршрута копируются из снимка без запросов и разбора строк
+        self.model = self.snapshot.route(self.route_list.key(selected[0]))
+        self.station_list.set_source(StationRows(self.model))
+
+    def on_station_select(self, event):
+        selected = self.station_list.curselection()
+        if not selected or self.model is None:
+            return
+        index = selected[0]
+        station_id, city, departure, travel, order_index, arrival, dwell = self.model.station(index)
+        last = index == len(self.model) - 1
+        self.labels['city'].config(text=city)
+        self.labels['departure'].config(text="-" if last else format_time(departure))
+        self.labels['travel'].config(text="-" if last else f"{travel} мин")
+        self.labels['arrival'].config(text="-" if index == 0 else format_time(arrival))
+        self.labels['dwell'].config(text=f"{dwell} мин")
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SNAPSHOT
+    root = tk.Tk()
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError) as error:
+        root.withdraw()
+        messagebox.showerror("Ошибка", f"Не удалось открыть снимок {path}: {error}")
+    else:
+        app = TimetableViewer(root, snapshot)
+        root.mainloop()
@@ -0,0 +1,348 @@
+import queue
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import messagebox
+
+from timetable.paging import EmptyRows
+
+# Как часто окно забирает результаты задач потока базы, пока они есть
+TASK_POLL_MS = 20
+# Фон строк, выделенных источником (например, несохранённый пересчёт)
+HIGHLIGHT_BACKGROUND = '#fff3b0'
+
+# Виртуальный список: внутренний Listbox содержит только видимые строки,
+# остальные строки запрашиваются у источника (paging.py) при прокрутке.
+# Интерфейс повторяет используемую приложением часть tk.Listbox:
+# curselection/selection_set/selection_clear/get/delete/bind.
+# Если источник изменился в нескольких строках (repository.RoutePatch),
+# rows_inserted/rows_removed/rows_changed переписывают только видимые
+# из них, прокрутка и выделение остаются на тех же строках.
+
+
+class VirtualList(tk.Frame):
+    def __init__(self, master, source=None, **kwargs):
+        super().__init__(master)
+        self.source = source or EmptyRows()
+        self.first = 0
+        self.visible = 20
+        self.selected = None
+        self.window = []
+        # Функция индекс -> bool: какие строки источника подсветить
+        self.highlight = None
+        self.select_callbacks = []
+        self.listbox = tk.Listbox(self, exportselection=False, **kwargs)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.listbox.bind('<<ListboxSelect>>', self.on_listbox_select)
+        self.listbox.bind('<Configure>', self.on_resize)
+        self.listbox.bind('<MouseWheel>', self.on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.listbox.bind('<Button-5>', lambda event: self.scroll(3))
+        self.listbox.bind('<Up>', lambda event: self.move_selection(-1))
+        self.listbox.bind('<Down>', lambda event: self.move_selection(1))
+        self.listbox.bind('<Prior>', lambda event: self.move_selection(-self.visible))
+        self.listbox.bind('<Next>', lambda event: self.move_selection(self.visible))
+
+    # --- источник данных
+
+    def set_source(self, source, keep_position=False, highlight=None):
+        # keep_position - та же выборка после обновления: прокрутка сохраняется;
+        # highlight - функция индекс -> bool для подсветки строк
+        self.source = source
+        self.highlight = highlight
+        if not keep_position:
+            self.first = 0
+            self.selected = None
+        elif self.selected is not None and self.selected >= source.count():
+            self.selected = None
+        self.render()
+
+    def refresh(self):
+        # Перечитать источник, сохранив прокрутку и выделение
+        self.source.reset()
+        self.render()
+
+    def size(self):
+        return self.source.count()
+
+    # --- точечные изменения источника
+
+    def rows_inserted(self, index):
+        # В источник вставлена строка index
+        if self.selected is not None and self.selected >= index:
+            self.selected += 1
+        position = index - self.first
+        if position < 0:
+            self.first += 1
+        elif position <= len(self.window) and position < self.visible:
+            row = self.source.rows(index, 1)[0]
+            self.window.insert(position, row)
+            self.listbox.insert(position, row[1])
+            self.paint(position)
+            if len(self.window) > self.visible:
+                self.window.pop()
+                self.listbox.delete(self.visible)
+            self.show_selection()
+        self.show_scrollbar()
+
+    def rows_removed(self, index):
+        # Из источника удалена строка index
+        if self.selected == index:
+            self.selected = None
+        elif self.selected is not None and self.selected > index:
+            self.selected -= 1
+        position = index - self.first
+        if position < 0:
+            self.first -= 1
+        elif position < len(self.window):
+            if self.first and self.first + self.visible > self.size():
+                # Окно у конца списка - сдвигается вверх целиком
+                self.render()
+                return
+            del self.window[position]
+            self.listbox.delete(position)
+            following = self.source.rows(self.first + len(self.window), 1)
+            if following:
+                self.window.extend(following)
+                self.listbox.insert(tk.END, following[0][1])
+                self.paint(len(self.window) - 1)
+            self.show_selection()
+        self.show_scrollbar()
+
+    def rows_changed(self, start, stop):
+        # Строки start..stop-1 источника получили новые подписи
+        start = max(start, self.first)
+        stop = min(stop, self.first + len(self.window))
+        if start >= stop:
+            return
+        for offset, row in enumerate(self.source.rows(start, stop - start)):
+            position = start - self.first + offset
+            if self.window[position] != row:
+                self.window[position] = row
+                self.listbox.delete(position)
+                self.listbox.insert(position, row[1])
+                self.paint(position)
+        self.show_selection()
+
+    # --- API, совместимый с tk.Listbox
+
+    def bind(self, sequence=None, func=None, add=None):
+        if sequence == '<<ListboxSelect>>':
+            self.select_callbacks.append(func)
+            return None
+        return self.listbox.bind(sequence, func, add)
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def selection_set(self, index, last=None):
+        if 0 <= index < self.size():
+            self.selected = index
+            self.see(index)
+
+    def selection_clear(self, first=0, last=None):
+        self.selected = None
+        self.listbox.selection_clear(0, tk.END)
+
+    def get(self, index):
+        rows = self.source.rows(index, 1)
+        return rows[0][1] if rows else None
+
+    def key(self, index):
+        rows = self.source.rows(index, 1)
+        return rows[0][0] if rows else None
+
+    def delete(self, first=0, last=None):
+        # Используется только для полной очистки списка
+        self.set_source(EmptyRows())
+
+    def see(self, index):
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + self.visible:
+            self.first = index - self.visible + 1
+        self.render()
+
+    # --- прокрутка и отрисовка окна
+
+    def row_height(self):
+        font = tkfont.Font(font=self.listbox.cget('font'))
+        return font.metrics('linespace') + 1
+
+    def on_resize(self, event):
+        visible = max(1, event.height // self.row_height())
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return 'break'
+
+    def scroll(self, rows):
+        self.first += rows
+        self.render()
+        return 'break'
+
+    def yview(self, *args):
+        total = self.size()
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self.visible
+            self.first += step
+        self.render()
+
+    def move_selection(self, delta):
+        if not self.size():
+            return 'break'
+        current = self.first if self.selected is None else self.selected
+        index = min(max(current + delta, 0), self.size() - 1)
+        self.selection_set(index)
+        self.fire_select()
+        return 'break'
+
+    def render(self):
+        total = self.size()
+        self.first = max(0, min(self.first, total - self.visible))
+        self.window = self.source.rows(self.first, self.visible)
+        self.listbox.delete(0, tk.END)
+        for _, label in self.window:
+            self.listbox.insert(tk.END, label)
+        if self.highlight is not None:
+            for position in range(len(self.window)):
+                self.paint(position)
+        self.show_selection()
+        self.show_scrollbar()
+        # Следующая страница подгружается, когда окно уже отрисовано
+        self.after_idle(self.source.prefetch, self.first, self.visible)
+
+    def paint(self, position):
+        if self.highlight is not None and self.highlight(self.first + position):
+            self.listbox.itemconfig(position, background=HIGHLIGHT_BACKGROUND)
+
+    def show_selection(self):
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected is not None and self.first <= self.selected < self.first + len(self.window):
+            self.listbox.selection_set(self.selected - self.first)
+
+    def show_scrollbar(self):
+        total = self.size()
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_listbox_select(self, event):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        self.selected = self.first + selection[0]
+        self.fire_select()
+
+    def fire_select(self):
+        for callback in self.select_callbacks:
+            callback(None)
+
+
+class StatusBar(tk.Label):
+    # Строка состояния: пока поток базы выполняет задачи, показывает
+    # текущую и число ожидающих, курсор окна меняется на "часики"
+    def __init__(self, master, **kwargs):
+        super().__init__(master, anchor=tk.W, relief=tk.SUNKEN, **kwargs)
+        self.tasks = []
+        self.counters = ""
+
+    def start(self, label):
+        self.tasks.append(label)
+        self.show()
+
+    def finish(self, label):
+        self.tasks.remove(label)
+        self.show()
+
+    def show_counters(self, text):
+        # Счётчики трассировки SQL (tracing.py) справа от текущей задачи
+        self.counters = text
+        self.show()
+
+    def show(self):
+        if self.tasks:
+            text = f"{self.tasks[0]}..."
+            if len(self.tasks) > 1:
+                text += f" (в очереди: {len(self.tasks) - 1})"
+            cursor = 'watch'
+        else:
+            text = ""
+            cursor = ''
+        if self.counters:
+            text = f"{text}    {self.counters}" if text else self.counters
+        self.config(text=text)
+        self.winfo_toplevel().config(cursor=cursor)
+
+
+class TaskRunner:
+    # Связывает поток базы (timetable.worker.DbWorker) с циклом Tk.
+    # Готовые результаты складываются в очередь, окно забирает их через
+    # root.after, поэтому on_done/on_error вызываются в потоке окна.
+    # on_error возвращает True, если ошибку обработал сам; иначе
+    # показывается стандартное сообщение. С tracer запросы задачи и её
+    # обработчиков приписываются действию окна, из которого она отправлена.
+    def __init__(self, root, worker, status=None, poll_ms=TASK_POLL_MS, tracer=None):
+        self.root = root
+        self.worker = worker
+        self.status = status
+        self.poll_ms = poll_ms
+        self.tracer = tracer
+        self.results = queue.Queue()
+        self.pending = 0
+        self.busy = 0
+        self.polling = False
+
+    def submit(self, label, func, *args, on_done=None, on_error=None):
+        # label=None - фоновая задача без индикатора занятости
+        if label is not None:
+            self.busy += 1
+            if self.status is not None:
+                self.status.start(label)
+        self.pending += 1
+        if self.tracer is not None:
+            action = self.tracer.current() or label or getattr(func, '__name__', None)
+            func = self.tracer.wrap(action, func, count=False)
+            on_done = on_done and self.tracer.wrap(action, on_done, count=False)
+            on_error = on_error and self.tracer.wrap(action, on_error, count=False)
+        future = self.worker.submit(func, *args)
+        future.add_done_callback(
+            lambda future: self.results.put((label, future, on_done, on_error)))
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.poll_ms, self.deliver)
+        return future
+
+    def deliver(self):
+        try:
+            while True:
+                try:
+                    label, future, on_done, on_error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                self.pending -= 1
+                if label is not None:
+                    self.busy -= 1
+                    if self.status is not None:
+                        self.status.finish(label)
+                error = future.exception()
+                if error is None:
+                    if on_done is not None:
+                        on_done(future.result())
+                elif on_error is None or not on_error(error):
+                    messagebox.showerror("Ошибка", str(error))
+        finally:
+            # Ошибка в обработчике не должна остановить доставку остальных
+            if self.pending:
+                self.root.after(self.poll_ms, self.deliver)
+            else:
+                self.polling = False